@@ -20,16 +20,33 @@ Examples:
     ```bash
     $ python -m dcw.cli.pipeline help mymodule.mysubmodule.SomePipelineFactory
     ```
+
+    Run a pipeline on 4 processes, each processing a quarter of the records, and print the merged stats of all four.
+    ```bash
+    $ dcw-pipeline run --workers 4 --stats mymodule.mysubmodule.SomePipelineFactory -- --some-option 1
+    ```
 """
 
 import sys
 import os
 import argparse
+import contextlib
 import logging
+import logging.handlers
+import multiprocessing
+import queue
+import tracemalloc
+from pathlib import Path
+
 import tabulate
 
 from ..etl.pipeline import find_pipeline_factories, get_factory_class_by_path, run_pipeline, logger as etl_pipe_logger
 from ..etl.extract import logger as extract_logger
+from ..etl.checkpoint import Checkpoint, FileCheckpointStore, SQLiteCheckpointStore
+from ..etl.metrics import MetricsExporter
+from ..etl.pipeline import PipelineFactory, ProcessingPipeline
+from ..etl.profiling import profile
+from ..etl.stats import format_stats, merge_stats
 from ..logging import add_console_logging
 
 logger = logging.getLogger(__name__)
@@ -50,10 +67,28 @@ def main_list(args: argparse.Namespace) -> None:
     print(tabulate.tabulate(tbl, headers=("Path", "Description"), tablefmt="grid"))
 
 
-def main_run(args: argparse.Namespace) -> None:
-    """Entrypoint when the 'run' command is used."""
-    factory_class = get_factory_class_by_path(args.path)
+def _format_bytes(size: int | None) -> str:
+    if size is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def print_stage_profile(stats: dict[str, dict]) -> None:
+    """Print the time and memory attributed to each stage of a pipeline, most expensive first."""
+    total = sum(s["time"] for s in stats.values()) or 1.0
+    ordered = sorted(stats.items(), key=lambda item: item[1]["time"], reverse=True)
+    tbl = ((name, s["kind"], s["records_in"], s["time"], 100 * s["time"] / total, _format_bytes(s["allocated"]))
+           for name, s in ordered)
+    print("Stage profile:")
+    print(tabulate.tabulate(tbl, headers=("Stage", "Kind", "Records", "Wall time (s)", "% Time", "Allocated"),
+                            tablefmt="grid", floatfmt=("", "", "", ".3f", ".1f", "")))
+
 
+def _parse_pipeline_opts(args: argparse.Namespace, factory_class: type) -> PipelineFactory.Options:
     # get the CLI argument parser for the pipeline and set the program name to look like the command we're running
     parser = factory_class.create_argument_parser(
         prog=f"{os.path.basename(sys.argv[0])} run [OPTIONS] {args.path} [-- [PIPELINE OPTIONS]]")
@@ -61,17 +96,187 @@ def main_run(args: argparse.Namespace) -> None:
     # parse the arguments and convert them to an instance of the Options type for the pipeline
     pipeline_args = parser.parse_args(args.remaining or [])
     logger.debug(f"Parsed pipeline arguments: {pipeline_args}")
-    pipeline_opts = factory_class.args_to_opts(pipeline_args)
+    return factory_class.args_to_opts(pipeline_args)
 
-    if not args.dry_run:
+
+def _worker_path(path: str | None, shard: tuple[int, int] | None) -> str | None:
+    """Give each worker of a sharded run its own output file, by adding the worker index to the file name."""
+    if path is None or shard is None:
+        return path
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}-{shard[0]}{path.suffix}"))
+
+
+def main_run(args: argparse.Namespace) -> None:
+    """Entrypoint when the 'run' command is used."""
+    factory_class = get_factory_class_by_path(args.path)
+    pipeline_opts = _parse_pipeline_opts(args, factory_class)
+
+    if args.dry_run:
+        logger.info(f"Dry run enabled; would have run {factory_class.__name__} with options {pipeline_opts}")
+    elif args.resume and not args.checkpoint:
+        raise ValueError("--resume requires --checkpoint")
+    elif args.workers > 1:
+        if args.metrics_port is not None:
+            raise ValueError("--metrics-port is not supported with --workers, use --metrics-file")
+        logger.info(f"Running {factory_class.__name__} on {args.workers} workers with options {pipeline_opts}")
+        _run_workers(args, factory_class)
+    else:
         logger.info(f"Running {factory_class.__name__} with options {pipeline_opts}")
-        factory = factory_class()
-        for pipeline_logger in factory.get_loggers():
-            pipeline_logger.setLevel(logger.level)
+        stats = _run(args, factory_class, pipeline_opts)
+        _print_stats(args, stats)
+
+
+def _run(args: argparse.Namespace, factory_class: type, pipeline_opts: PipelineFactory.Options, *,
+         shard: tuple[int, int] | None = None) -> dict[str, dict] | None:
+    """Run the pipeline in this process, returning its stats if they were collected."""
+    factory = factory_class()
+    for pipeline_logger in factory.get_loggers():
+        pipeline_logger.setLevel(logger.level)
+        if shard is None:
             add_console_logging(pipeline_logger)
-        run_pipeline(factory, pipeline_opts)
-    else:
-        logger.info(f"Dry run enabled; would have run {factory_class.__name__} with options {pipeline_opts}")
+    pipelines = []
+    exporters = []
+
+    def setup(pipeline):
+        pipelines.append(pipeline)
+        if args.profile_stages and isinstance(pipeline, ProcessingPipeline):
+            pipeline.enable_stats(memory=True)
+        elif args.stats or args.profile_stages:
+            pipeline.enable_stats()
+        if args.metrics_port is not None or args.metrics_file is not None:
+            exporter = MetricsExporter(pipeline, port=args.metrics_port, host=args.metrics_host,
+                                       path=_worker_path(args.metrics_file, shard), interval=args.metrics_interval)
+            exporter.start()
+            exporters.append(exporter)
+
+    checkpoint = None
+    if args.checkpoint:
+        store_class = SQLiteCheckpointStore if args.checkpoint_store == "sqlite" else FileCheckpointStore
+        key = args.checkpoint_key or args.path
+        checkpoint = Checkpoint(store_class(args.checkpoint), key if shard is None else f"{key}[{shard[0]}]",
+                                every=args.checkpoint_every, interval=args.checkpoint_interval, resume=args.resume)
+
+    if args.profile_stages:
+        tracemalloc.start()
+
+    try:
+        profile_path = _worker_path(args.profile, shard)
+        with profile(profile_path) if profile_path else contextlib.nullcontext():
+            run_pipeline(factory, pipeline_opts, max_in_flight=args.max_in_flight, setup=setup,
+                         checkpoint=checkpoint, shard=shard)
+    finally:
+        if checkpoint is not None:
+            checkpoint.store.close()
+        if args.profile_stages:
+            tracemalloc.stop()
+        for exporter in exporters:
+            exporter.stop()
+    return pipelines[0].stats() if (args.stats or args.profile_stages) and pipelines else None
+
+
+def _print_stats(args: argparse.Namespace, stats: dict[str, dict] | None) -> None:
+    if stats is None:
+        return
+    if args.stats:
+        print(format_stats(stats))
+    if args.profile_stages:
+        print_stage_profile(stats)
+
+
+class _WorkerLogFilter(logging.Filter):
+    """Prefix the messages logged by a worker process with its index."""
+
+    def __init__(self, index: int) -> None:
+        super().__init__()
+        self.index = index
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = f"[worker {self.index}] {record.msg}"
+        return True
+
+
+class _ForwardingHandler(logging.Handler):
+    """Handle the records logged by worker processes with the loggers of this process."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        target = logging.getLogger(record.name)
+        if target.isEnabledFor(record.levelno):
+            target.handle(record)
+
+
+def _run_worker(args: argparse.Namespace, index: int, log_queue: multiprocessing.Queue,
+                results: multiprocessing.Queue) -> None:
+    """Entrypoint of a worker process of a sharded run. Exits with a non-zero code if the pipeline fails."""
+    # logs are sent to the parent process, which writes them out along with those of the other workers
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(_WorkerLogFilter(index))
+    factory_class = get_factory_class_by_path(args.path)
+    for worker_logger in (logger, etl_pipe_logger, extract_logger, *factory_class().get_loggers()):
+        worker_logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+        worker_logger.handlers = [handler]
+        worker_logger.propagate = False
+
+    stats = None
+    try:
+        logger.info(f"Processing shard {index + 1} of {args.workers} in process {os.getpid()}")
+        stats = _run(args, factory_class, _parse_pipeline_opts(args, factory_class), shard=(index, args.workers))
+    except Exception:
+        logger.exception("Pipeline failed")
+        sys.exit(1)
+    finally:
+        results.put((index, stats))
+
+
+def _run_workers(args: argparse.Namespace, factory_class: type) -> None:
+    """Run the pipeline on `args.workers` processes, each processing a shard of the records.
+
+    Logs from the workers are written by this process, their stats are merged into one summary, and an exception is
+    raised if any of them failed.
+    """
+    for pipeline_logger in factory_class().get_loggers():
+        pipeline_logger.setLevel(logger.level)
+        add_console_logging(pipeline_logger)
+
+    # forking a process that is running threads can deadlock, so workers start from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    log_queue = context.Queue()
+    results = context.Queue()
+    listener = logging.handlers.QueueListener(log_queue, _ForwardingHandler())
+    listener.start()
+
+    workers = [context.Process(target=_run_worker, args=(args, index, log_queue, results), name=f"worker-{index}")
+               for index in range(args.workers)]
+    try:
+        for worker in workers:
+            worker.start()
+
+        # results must be read before joining, as a worker does not exit until what it put on the queue is read
+        stats = {}
+        while len(stats) < len(workers):
+            try:
+                index, worker_stats = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers) and results.empty():
+                    break
+                continue
+            stats[index] = worker_stats
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        listener.stop()
+
+    failed = [index for index, worker in enumerate(workers) if worker.exitcode != 0]
+    collected = [worker_stats for _, worker_stats in sorted(stats.items()) if worker_stats is not None]
+    if collected:
+        _print_stats(args, merge_stats(collected))
+    if failed:
+        codes = ", ".join(f"worker {index} exited with {workers[index].exitcode}" for index in failed)
+        raise RuntimeError(f"{len(failed)} of {len(workers)} workers failed: {codes}")
+    logger.info(f"All {len(workers)} workers finished")
 
 
 def main_help(args: argparse.Namespace) -> None:
@@ -100,6 +305,41 @@ def setup_parser() -> argparse.ArgumentParser:
 
     run_parser.add_argument("path", type=str, help="Path to pipeline factory (module.ClassName)", metavar="PATH")
     run_parser.add_argument("--dry-run", "-d", action="store_true", help="Do not actually run the pipeline.")
+    run_parser.add_argument("--max-in-flight", type=int, default=None, metavar="N",
+                            help="Pause extraction while N records are still being processed.")
+    run_parser.add_argument("--stats", action="store_true",
+                            help="Print the throughput and latency of each pipeline stage after the run.")
+    run_parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                            help="Serve metrics in the Prometheus text format on http://HOST:PORT/metrics.")
+    run_parser.add_argument("--metrics-host", type=str, default="127.0.0.1", metavar="HOST",
+                            help="The address to serve metrics on. Default: 127.0.0.1.")
+    run_parser.add_argument("--metrics-file", type=str, default=None, metavar="PATH",
+                            help="Periodically write metrics in the Prometheus text format to PATH.")
+    run_parser.add_argument("--metrics-interval", type=float, default=15.0, metavar="SECONDS",
+                            help="Seconds between writes to the metrics file. Default: 15.")
+    run_parser.add_argument("--checkpoint", type=str, default=None, metavar="PATH",
+                            help="Save the progress of the extraction to PATH, so that it can be resumed.")
+    run_parser.add_argument("--checkpoint-store", choices=("sqlite", "file"), default="sqlite",
+                            help="Store checkpoints in a SQLite database at PATH (the default), or as JSON files "
+                                 "in the directory PATH.")
+    run_parser.add_argument("--checkpoint-key", type=str, default=None, metavar="KEY",
+                            help="The name the checkpoint is saved under. Default: the pipeline path.")
+    run_parser.add_argument("--checkpoint-every", type=int, default=10_000, metavar="N",
+                            help="Save a checkpoint every N records. Default: 10000.")
+    run_parser.add_argument("--checkpoint-interval", type=float, default=60.0, metavar="SECONDS",
+                            help="Save a checkpoint at least every SECONDS. Default: 60.")
+    run_parser.add_argument("--resume", action="store_true",
+                            help="Resume from the last checkpoint instead of starting from the beginning.")
+    run_parser.add_argument("--workers", type=int, default=1, metavar="N",
+                            help="Run the pipeline on N processes. If the extractor can be split into at least N "
+                                 "splits, each process reads every Nth split; otherwise each process reads every "
+                                 "record and processes every Nth one. Output files (--profile, --metrics-file) get the "
+                                 "worker index added to their names, and checkpoints are saved per worker, so resume "
+                                 "with the same N. Default: 1.")
+    run_parser.add_argument("--profile", type=str, default=None, metavar="PATH",
+                            help="Profile the run with cProfile and write the stats to PATH.")
+    run_parser.add_argument("--profile-stages", action="store_true",
+                            help="Print the wall time and memory allocated (per tracemalloc) by each pipeline stage.")
     run_parser.add_argument("remaining", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
     run_parser.set_defaults(func=main_run)
 
@@ -131,6 +371,9 @@ def main(args: list[str] | None = None) -> None:
         args.func(args)
     except Exception:
         logger.exception(f"Unhandled exception executing the '{args.command}' command")
+        if args.func is main_run:
+            # a failed pipeline run exits with a non-zero code, so that whatever started it can tell
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -40,10 +40,21 @@ required and optional parameters into a single place. Organizing pipelines this
 using the `dcw-pipeline` command line tool tool or the `run_pipeline` function.
 
 Modules:
+  aio: Support for processing pipelines that run on an asyncio event loop.
+  batching: Cap batches by size in bytes, or adapt their size to a target latency.
+  cache: Memoize transformations that are pure functions of a key.
+  checkpoint: Checkpoint and resume long-running extractions.
+  dedup: Drop records that have already been seen.
+  engine: A lightweight, streamz-free execution engine for simple pipelines.
   extract: Base classes and support for extracting records from a source.
   load: Base classes and support for loading records into a destination.
+  metrics: Export pipeline metrics in the Prometheus text format.
   pipeline: Base classes and support for defining and running processing pipelines.
+  profiling: Profile pipeline runs, including their worker threads, with cProfile.
+  stages: Custom stream nodes that implement some of the pipeline stages.
+  stats: Per-stage counters and latency histograms for processing pipelines.
   transform: Base classes and support for creating data transformations.
+  window: Aggregate records over tumbling and sliding windows of time.
 
 Examples:
     A simple `ProcessingPipeline` that squares input numbers and loads them into a mock database:
@@ -116,16 +127,21 @@ Examples:
     ```
 """
 
-from .pipeline import ProcessingPipeline, PipelineFactory, run_pipeline
-from .extract import Extractor
-from .load import Loader
+from .pipeline import ProcessingPipeline, PipelineFactory, run_pipeline, arun_pipeline
+from .aio import AsyncProcessingPipeline
+from .extract import Extractor, AsyncExtractor
+from .load import Loader, AsyncLoader
 from .transform import Transformation
 
 __all__ = [
     "ProcessingPipeline",
+    "AsyncProcessingPipeline",
     "PipelineFactory",
     "run_pipeline",
+    "arun_pipeline",
     "Extractor",
+    "AsyncExtractor",
     "Loader",
+    "AsyncLoader",
     "Transformation",
 ]
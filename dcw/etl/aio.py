@@ -0,0 +1,466 @@
+"""Support for processing pipelines that run on an asyncio event loop.
+
+`ProcessingPipeline` calls `Extractor.iter_records()`, transformations and `Loader.load()` one record at a time, so a
+pipeline that talks to the network spends most of its time waiting on a single request. `AsyncProcessingPipeline`
+instead processes many records at once on one event loop:
+
+- Records can come from an `dcw.etl.extract.AsyncExtractor` (or a regular `Extractor`).
+- Transformations can be coroutine functions (or regular functions).
+- Records can be loaded with an `dcw.etl.load.AsyncLoader` (or a regular `Loader`).
+
+Each transformation and loader has its own concurrency limit, the number of records it may work on at once. The
+number of records being processed by the pipeline as a whole is limited by `max_in_flight`. Records are not guaranteed
+to reach the loaders in the order they were extracted.
+
+Regular (non-async) transformations and loaders are called directly on the event loop, so they should be quick. The
+records of a regular extractor are read on a worker thread instead, so that reading them does not block the loop.
+
+Examples:
+    >>> import asyncio
+    >>> from dcw.etl.aio import AsyncProcessingPipeline
+    >>> from dcw.etl.extract import RecordExtractor
+    >>> from dcw.etl.load import ListLoader
+    >>> async def lookup(x):
+    ...     await asyncio.sleep(0.01)  # e.g. an HTTP request
+    ...     return x ** 2
+    >>> records = []
+    >>> pipeline = AsyncProcessingPipeline()
+    >>> pipeline.add_transform(lookup, concurrency=10)
+    >>> pipeline.add_loader(ListLoader(records))
+    >>> asyncio.run(pipeline.extract(RecordExtractor(range(5))))
+    >>> sorted(records)
+    [0, 1, 4, 9, 16]
+"""
+
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+
+from dcw.etl.extract import AsyncExtractor, Extractor, is_async_extractor
+from dcw.etl.load import AsyncLoader, Loader
+from dcw.etl.stats import StageStats, new_stage_names, stage_kind
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT: int = 1000
+
+
+async def _resolve(value: Any) -> Any:
+    """Await `value` if it is awaitable, otherwise return it as-is."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+# marks the end of the records of a regular extractor in the buffer of `aiter_records`
+_DONE = object()
+
+
+async def aiter_records(extractor: Extractor | AsyncExtractor, *, buffer_size: int = 1000) -> AsyncIterator[Any]:
+    """Iterate over the records of a regular or async extractor asynchronously.
+
+    The records of a regular extractor are read on a background thread, so that an extractor that blocks, such as one
+    reading files or a database, does not hold up the event loop. The thread reads up to `buffer_size` records ahead,
+    and the event loop is only woken up when it is waiting for records, so that records read in the meantime are taken
+    all at once. The extractor's iterator is closed by the thread if iteration stops early.
+    """
+    if is_async_extractor(extractor):
+        async for record in extractor:
+            yield record
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: deque = deque()
+    cond = threading.Condition()
+    ready = asyncio.Event()
+    waiting = False
+    stopped = False
+    error: Optional[BaseException] = None
+
+    def wake() -> None:
+        # called with `cond` held, after adding to the buffer
+        nonlocal waiting
+        if waiting:
+            waiting = False
+            loop.call_soon_threadsafe(ready.set)
+
+    def read() -> None:
+        nonlocal error
+        try:
+            records = iter(extractor.iter_records())
+            try:
+                for record in records:
+                    with cond:
+                        cond.wait_for(lambda: len(buffer) < buffer_size or stopped)
+                        if stopped:
+                            break
+                        buffer.append(record)
+                        wake()
+            finally:
+                # release what the extractor holds, such as open files or threads, if iteration stops early
+                close = getattr(records, "close", None)
+                if close is not None:
+                    close()
+        except BaseException as e:
+            error = e
+        finally:
+            with cond:
+                buffer.append(_DONE)
+                wake()
+
+    thread = threading.Thread(target=read, name="aiter-records", daemon=True)
+    thread.start()
+    try:
+        while True:
+            with cond:
+                chunk = list(buffer)
+                buffer.clear()
+                if chunk:
+                    cond.notify_all()
+                else:
+                    waiting = True
+                    ready.clear()
+            if not chunk:
+                await ready.wait()
+                continue
+            for record in chunk:
+                if record is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield record
+    finally:
+        with cond:
+            stopped = True
+            cond.notify_all()
+        await asyncio.to_thread(thread.join)
+
+
+class _Stage:
+    """A stage of an `AsyncProcessingPipeline`."""
+
+    def __init__(self, upstream: Optional["_Stage"] = None, *, name: Optional[str] = None) -> None:
+        self.name = name
+        self.stats: Optional[StageStats] = None
+        self.downstreams: list[_Stage] = []
+        if upstream is not None:
+            upstream.downstreams.append(self)
+
+    def reset(self) -> None:
+        """Prepare the stage to run on the current event loop."""
+        pass
+
+    async def update(self, x: Any) -> None:
+        self._count_in()
+        await self.emit(x)
+
+    def _count_in(self) -> None:
+        if self.stats is not None:
+            self.stats.record(records_in=1)
+
+    async def _call(self, func: Callable[[Any], Any], x: Any) -> Any:
+        """Call (and await) `func(x)`, timing the call if stats are enabled."""
+        if self.stats is None:
+            return await _resolve(func(x))
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await _resolve(func(x))
+            failed = False
+            return result
+        finally:
+            self.stats.record(records_in=1, records_out=int(isinstance(self, _Sink) and not failed),
+                              errors=int(failed), elapsed=time.perf_counter() - start)
+
+    async def emit(self, x: Any) -> None:
+        if self.stats is not None:
+            self.stats.record(records_out=1)
+        if len(self.downstreams) == 1:
+            await self.downstreams[0].update(x)
+        elif self.downstreams:
+            await asyncio.gather(*(downstream.update(x) for downstream in self.downstreams))
+
+
+class _Map(_Stage):
+    def __init__(self, upstream: _Stage, func: Callable[[Any], Any], *, concurrency: int,
+                 name: Optional[str] = None) -> None:
+        super().__init__(upstream, name=name)
+        self.func = func
+        self.concurrency = concurrency
+        self.reset()
+
+    def reset(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def update(self, x: Any) -> None:
+        async with self._semaphore:
+            result = await self._call(self.func, x)
+        await self.emit(result)
+
+
+class _Batch(_Stage):
+    def __init__(self, upstream: _Stage, size: int, *, timeout: Optional[float] = None,
+                 name: Optional[str] = None) -> None:
+        super().__init__(upstream, name=name)
+        self.size = size
+        self.timeout = timeout
+        self._buffer: list = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def update(self, x: Any) -> None:
+        self._count_in()
+        self._buffer.append(x)
+        if len(self._buffer) >= self.size:
+            await self._emit_buffer()
+        elif len(self._buffer) == 1 and self.timeout is not None:
+            self._timer = asyncio.get_running_loop().call_later(self.timeout, self._on_timeout)
+
+    def _on_timeout(self) -> None:
+        self._timer = None
+        task = asyncio.ensure_future(self._emit_buffer())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _emit_buffer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        batch, self._buffer = tuple(self._buffer), []
+        await self.emit(batch)
+
+    async def flush(self) -> None:
+        """Wait for batches being emitted after a timeout, then emit the partial batch, if any."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        await self._emit_buffer()
+
+
+class _Flatten(_Stage):
+    async def update(self, x: Any) -> None:
+        self._count_in()
+        for item in x:
+            await self.emit(item)
+
+
+class _Sink(_Stage):
+    def __init__(self, upstream: _Stage, loader: Loader | AsyncLoader, *, concurrency: int,
+                 name: Optional[str] = None) -> None:
+        super().__init__(upstream, name=name)
+        self.func = loader
+        self.concurrency = concurrency
+        self.reset()
+
+    def reset(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def update(self, x: Any) -> None:
+        async with self._semaphore:
+            await self._call(self.func, x)
+
+
+class AsyncProcessingPipeline:
+    """A processing pipeline that runs on an asyncio event loop.
+
+    The interface mirrors `dcw.etl.pipeline.ProcessingPipeline`, except that `extract` and `flush_loaders` are
+    coroutines, and transformations and loaders accept a `concurrency` limit. A `PipelineFactory` may return an
+    `AsyncProcessingPipeline` from `get_pipeline`; `run_pipeline` and the `dcw-pipeline` command line tool run it on an
+    event loop.
+
+    Attributes:
+        name (str): Name of the pipeline.
+        end_name (str): Name of the last point in the pipeline.
+    """
+
+    def __init__(self, name: str = None) -> None:
+        """Create a new AsyncProcessingPipeline.
+
+        Arguments:
+            name (str): Name of the pipeline.
+        """
+        self.source = _Stage(name=name)
+        self.current = self.source
+        self._stats_enabled = False
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def name(self):
+        return self.source.name
+
+    @property
+    def end_name(self):
+        return self.current.name
+
+    @property
+    def in_flight(self) -> int:
+        """The number of records that have been extracted by `extract` but not yet fully processed."""
+        return len(self._tasks) + sum(len(stage._buffer) for stage in self._iter_stages() if isinstance(stage, _Batch))
+
+    def _loader_at_end(self) -> bool:
+        return len(self.current.downstreams) > 0
+
+    async def push(self, data: Any) -> None:
+        """Push data into the pipeline, returning once it has been processed or is held by a batcher.
+
+        Arguments:
+            data (Any): Data that will be pushed into the pipeline.
+        """
+        await self.source.update(data)
+
+    async def extract(self, extractor: Extractor | AsyncExtractor, *,
+                      max_in_flight: Optional[int] = None) -> None:
+        """Extract records and process them through the pipeline.
+
+        Records are processed concurrently, up to the limits set for each stage. This coroutine returns once every
+        record has been processed and the loaders have been flushed. If processing a record raises an exception,
+        extraction stops and the exception is raised.
+
+        Arguments:
+            extractor (Extractor | AsyncExtractor): Extractor that will be used to extract records.
+            max_in_flight (Optional[int]): Maximum number of records being processed at once.
+                Default: `DEFAULT_MAX_IN_FLIGHT`.
+        """
+        if not self._loader_at_end():
+            raise ValueError("Pipeline must have a loader at the end")
+
+        self._instrument()
+        for stage in self._iter_stages():
+            stage.reset()
+
+        max_in_flight = max_in_flight or DEFAULT_MAX_IN_FLIGHT
+        slots = asyncio.Semaphore(max_in_flight)
+        tasks = self._tasks
+        errors: list[BaseException] = []
+
+        def on_done(task: asyncio.Task) -> None:
+            tasks.discard(task)
+            slots.release()
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        try:
+            async for record in aiter_records(extractor):
+                await slots.acquire()
+                if errors:
+                    raise errors[0]
+                task = asyncio.create_task(self.source.update(record))
+                tasks.add(task)
+                task.add_done_callback(on_done)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+        if errors:
+            raise errors[0]
+
+        # emit partial batches, upstream batchers first since their output may end up in downstream batchers
+        for stage in self._iter_stages():
+            if isinstance(stage, _Batch):
+                await stage.flush()
+
+        await self.flush_loaders()
+
+    def add_transform(self, func: Callable[[Any], Any], *, concurrency: int = 1, name: Optional[str] = None) -> None:
+        """Add a transformation to the pipeline.
+
+        Arguments:
+            func (Callable): Callable or coroutine function that will be used to transform the data.
+            concurrency (int): Maximum number of records transformed at once.
+            name (Optional[str]): Name of the transformation.
+        """
+        self.current = _Map(self.current, func, concurrency=concurrency, name=name)
+
+    def add_batcher(self, size: int, *, name: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """Add a batcher to the pipeline.
+
+        Arguments:
+            size (int): Size of the batches.
+            name (Optional[str]): Name of the batcher.
+            timeout (Optional[float]): Timeout in seconds after which the batcher will emit a partial batch.
+        """
+        self.current = _Batch(self.current, size, timeout=timeout, name=name)
+
+    def add_flattener(self, *, name: Optional[str] = None) -> None:
+        """Add a flattener to the pipeline.
+
+        Arguments:
+            name (Optional[str]): Name of the flattener.
+        """
+        self.current = _Flatten(self.current, name=name)
+
+    def add_loader(self, loader: Loader | AsyncLoader, *, concurrency: int = 1, name: Optional[str] = None) -> None:
+        """Add a loader to the pipeline.
+
+        Arguments:
+            loader (Loader | AsyncLoader): Loader instance that will be used to load data.
+            concurrency (int): Maximum number of records loaded at once.
+            name (Optional[str]): Name of the loader.
+        """
+        _Sink(self.current, loader, concurrency=concurrency, name=name)
+
+    def _iter_stages(self) -> Iterable[_Stage]:
+        queue = deque([self.source])
+        while queue:
+            stage = queue.popleft()
+            yield stage
+            queue.extend(stage.downstreams)
+
+    def describe(self):
+        return [stage.name for stage in self._iter_stages()]
+
+    @property
+    def stats_enabled(self) -> bool:
+        """Whether statistics are collected, see `enable_stats`."""
+        return self._stats_enabled
+
+    def enable_stats(self) -> None:
+        """Collect statistics for every stage of the pipeline, see `dcw.etl.stats`.
+
+        The time recorded for a transformation or loader is the time spent awaiting it, which overlaps for records
+        processed concurrently. Stages added after this is called are included from the next call to `extract` or
+        `stats`.
+        """
+        self._stats_enabled = True
+        self._instrument()
+
+    def _instrument(self) -> None:
+        if self._stats_enabled:
+            for stage, name in new_stage_names(self._iter_stages()):
+                stage.stats = StageStats(name, stage_kind(stage))
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Get the statistics of each stage, keyed by a unique stage name. See `ProcessingPipeline.stats`."""
+        self._instrument()
+        return {stage.stats.name: stage.stats.to_dict() for stage in self._iter_stages() if stage.stats is not None}
+
+    def get_loaders(self) -> Iterable[Loader | AsyncLoader]:
+        """Get the loaders in the pipeline.
+
+        Returns:
+            Iterable[Loader | AsyncLoader]: Iterable of loader instances.
+        """
+        for stage in self._iter_stages():
+            if isinstance(stage, _Sink):
+                yield stage.func
+
+    async def flush_loaders(self) -> None:
+        """Flush all the loaders in the pipeline concurrently."""
+        logger.debug("Flushing loaders")
+        await asyncio.gather(*(self._flush_loader(stage) for stage in self._iter_stages() if isinstance(stage, _Sink)))
+
+    @staticmethod
+    async def _flush_loader(stage: "_Sink") -> None:
+        start = time.perf_counter()
+        await _resolve(stage.func.flush())
+        if stage.stats is not None:
+            stage.stats.record_flush(time.perf_counter() - start)
@@ -0,0 +1,125 @@
+"""Decide how many records go into a batch.
+
+`ProcessingPipeline.add_batcher` normally emits a batch once it holds a fixed number of records. When records vary
+widely in size, a fixed count gives batches that are either too small to be efficient or too large to fit in memory.
+A `BatchSizer` can instead:
+
+- cap each batch by the estimated size of its records in bytes (see `estimate_size`), and/or
+- adapt the number of records per batch to hold a target latency, using additive-increase/multiplicative-decrease
+  (AIMD): after a full batch is processed within the target, the size grows by a fixed step, and after a batch takes
+  longer than the target, the size is halved. The latency measured is the time taken to push a batch through the
+  stages downstream of the batcher which, for a batcher that feeds a loader, is the time taken by `Loader.load`.
+
+Examples:
+    >>> sizer = BatchSizer(10, target_latency=0.5)
+    >>> sizer.observe(10, 0.1)  # a full batch, well within the target
+    >>> sizer.size
+    11
+    >>> sizer.observe(11, 2.0)  # too slow
+    >>> sizer.size
+    5
+"""
+
+import sys
+from typing import Any, Callable, Optional
+
+
+def estimate_size(obj: Any) -> int:
+    """Estimate the size of a record, in bytes.
+
+    Bytes and strings count their length; arrays, Arrow tables and record batches their buffers (`nbytes`); pandas
+    objects their memory usage; and containers their own size plus that of their items, recursively. Anything else
+    counts `sys.getsizeof`. The estimate is meant to be cheap rather than exact.
+
+    Examples:
+        >>> estimate_size(b"x" * 1000)
+        1000
+        >>> estimate_size({"a": "x" * 1000}) > 1000
+        True
+    """
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(item) for item in obj)
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage):
+        # pandas DataFrame (a Series of column sizes) or Series (an int)
+        usage = memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(obj)
+
+
+class BatchSizer:
+    """Decide when a batch is full, by number of records, estimated size in bytes, or both, see the module
+    documentation.
+
+    A sizer is used by a single batcher, which holds a lock while calling it.
+
+    Attributes:
+        size (int): Current maximum number of records in a batch.
+        max_bytes (Optional[int]): Maximum estimated size of a batch, in bytes. A record larger than this is emitted
+            in a batch of its own.
+        sizeof (Callable): Estimates the size of a record, in bytes.
+        target_latency (Optional[float]): If set, `size` is adapted so that a batch takes about this many seconds to
+            process.
+        min_size (int): Smallest `size` adapted to.
+        max_size (Optional[int]): Largest `size` adapted to. Default: no limit.
+        increase (int): Records added to `size` after a full batch is processed within the target latency.
+        decrease (float): Factor `size` is multiplied by after a batch takes longer than the target latency.
+    """
+
+    def __init__(self, size: int, *, max_bytes: Optional[int] = None, sizeof: Optional[Callable[[Any], int]] = None,
+                 target_latency: Optional[float] = None, min_size: int = 1, max_size: Optional[int] = None,
+                 increase: Optional[int] = None, decrease: float = 0.5) -> None:
+        if size < 1:
+            raise ValueError(f"size must be at least 1, got {size}")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError(f"max_bytes must be at least 1, got {max_bytes}")
+        if target_latency is not None and target_latency <= 0:
+            raise ValueError(f"target_latency must be positive, got {target_latency}")
+        if not 0 < decrease < 1:
+            raise ValueError(f"decrease must be between 0 and 1, got {decrease}")
+        self.size = size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or estimate_size
+        self.target_latency = target_latency
+        self.min_size = max(1, min_size)
+        self.max_size = max_size
+        self.increase = increase or max(1, size // 10)
+        self.decrease = decrease
+        self.batches = 0
+
+    def measure(self, record: Any) -> int:
+        """Get the estimated size of a record, or 0 if batches are not capped by size."""
+        return self.sizeof(record) if self.max_bytes is not None else 0
+
+    def fits(self, nbytes: int, record_bytes: int) -> bool:
+        """Check whether a record of `record_bytes` can be added to a non-empty batch of `nbytes`."""
+        return self.max_bytes is None or nbytes + record_bytes <= self.max_bytes
+
+    def full(self, count: int, nbytes: int) -> bool:
+        """Check whether a batch of `count` records and `nbytes` is full."""
+        return count >= self.size or (self.max_bytes is not None and nbytes >= self.max_bytes)
+
+    def observe(self, count: int, elapsed: float) -> None:
+        """Record that a batch of `count` records took `elapsed` seconds to process, adapting `size` if enabled."""
+        self.batches += 1
+        if self.target_latency is None:
+            return
+        if elapsed > self.target_latency:
+            self.size = max(self.min_size, int(self.size * self.decrease))
+        elif count >= self.size:
+            # only a full batch shows that a larger one could be processed in time
+            size = self.size + self.increase
+            self.size = size if self.max_size is None else min(size, self.max_size)
+
+    def stats(self) -> dict[str, Any]:
+        """Get the current batch size and the number of batches emitted."""
+        return {"batch_size": self.size, "batches": self.batches}
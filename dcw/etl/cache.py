@@ -0,0 +1,382 @@
+"""Memoize transformations that are pure functions of a key.
+
+Transformations such as geocoding or resolving IDs are often called with the same input over and over. Wrapping them
+in a `CachedTransformation` skips the call when the result for the record's key is already known:
+
+- Entries are kept in a `TransformCache`, bounded in size by evicting the least recently used entry, and optionally
+  expiring `ttl` seconds after they were stored.
+- Caches are thread-safe, so cached transformations can be used with `add_parallel_transform`. Two threads that miss
+  on the same key at the same time both call the transformation.
+- One cache can be shared by several transformations, and by several pipelines in the same process. Transformations
+  that compute different things from the same keys must then use different `namespace`s.
+- A cache sent to another process, such as by `add_process_transform`, arrives empty, and each worker process keeps
+  its own entries.
+
+When a cached transformation is added with `add_transform` or `add_parallel_transform`, the cache's counters are
+included in the stage stats under "details".
+
+Results can also be kept across runs with a `PersistentTransformCache`, stored in a SQLite database. Keying it by
+`file_fingerprint` lets a pipeline that runs over a directory every day skip the files that have not changed since the
+last run. Entries are invalidated when the transformation's `version` changes.
+
+Examples:
+    >>> calls = []
+    >>> def lookup(x):
+    ...     calls.append(x)
+    ...     return x.upper()
+    >>> cached = CachedTransformation(lookup, maxsize=100)
+    >>> [cached(x) for x in "abab"]
+    ['A', 'B', 'A', 'B']
+    >>> calls
+    ['a', 'b']
+    >>> cached.cache.stats()["hits"]
+    2
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Hashable, Optional
+
+from dcw.etl.transform import Transformation
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TransformCache:
+    """A thread-safe mapping with LRU eviction and per-entry expiry.
+
+    Examples:
+        >>> cache = TransformCache(maxsize=2)
+        >>> cache.put("a", 1)
+        >>> cache.put("b", 2)
+        >>> cache.get("a")
+        1
+        >>> cache.put("c", 3)
+        >>> cache.get("b", "evicted")
+        'evicted'
+
+    Attributes:
+        maxsize (Optional[int]): The maximum number of entries. None for no limit.
+        ttl (Optional[float]): Seconds after which an entry expires. None for no expiry.
+        hits (int): Lookups that found a live entry.
+        misses (int): Lookups that did not.
+        evictions (int): Entries removed to make room for new ones.
+        expirations (int): Entries found to have expired.
+    """
+
+    def __init__(self, maxsize: Optional[int] = 1024, ttl: Optional[float] = None, *,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Create a new TransformCache.
+
+        Arguments:
+            maxsize (Optional[int]): The maximum number of entries. None for no limit.
+            ttl (Optional[float]): Seconds after which an entry expires. None for no expiry.
+            clock (Callable): Returns the current time in seconds.
+        """
+        if maxsize is not None and maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be positive, got {ttl}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._init()
+
+    def _init(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: collections.OrderedDict[Hashable, tuple[Any, Optional[float]]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value stored for `key`, or `default` if there is none or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or self.clock() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store `value` for `key`, evicting the least recently used entry if the cache is full."""
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            if self.maxsize is not None and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every entry. The counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        """Get the size of the cache and its counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __getstate__(self) -> dict[str, Any]:
+        # entries and counters stay in this process
+        return {"maxsize": self.maxsize, "ttl": self.ttl, "clock": self.clock}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._init()
+
+
+class PersistentTransformCache:
+    """A cache of transformation results stored in a SQLite database, so that they can be reused by later runs.
+
+    Keys are identified by a hash of their `repr()`, which must therefore be stable across runs, and values are
+    pickled. Every entry is stored with the `version` of the transformation that computed it. When the cache is opened,
+    entries of the same `name` with any other version are deleted, so bump the version whenever the transformation's
+    output changes.
+
+    Several caches, with different names, can share one database. The database as a whole is kept under `max_bytes` of
+    pickled values by evicting the least recently used entries. The cache is thread-safe, and can be sent to worker
+    processes, each of which opens the database itself.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as tmpdir:
+        ...     cache = PersistentTransformCache(f"{tmpdir}/cache.db", version="1")
+        ...     cache.put("a", [1, 2])
+        ...     cache.close()
+        ...     # the next run finds the value, unless the version changes
+        ...     cache = PersistentTransformCache(f"{tmpdir}/cache.db", version="1")
+        ...     print(cache.get("a"))
+        ...     cache.close()
+        ...     cache = PersistentTransformCache(f"{tmpdir}/cache.db", version="2")
+        ...     print(cache.get("a"))
+        ...     cache.close()
+        [1, 2]
+        None
+
+    Attributes:
+        path (pathlib.Path): The database file.
+        version (str): The version of the transformation whose results are cached.
+        name (str): The name of the cache within the database.
+        max_bytes (Optional[int]): The maximum total size of the pickled values in the database. None for no limit.
+        hits (int): Lookups that found an entry.
+        misses (int): Lookups that did not.
+        evictions (int): Entries removed to keep the database under `max_bytes`.
+        invalidated (int): Entries deleted when the cache was opened, because their version did not match.
+    """
+
+    def __init__(self, path: str | Path, *, version: str, name: str = "default",
+                 max_bytes: Optional[int] = None) -> None:
+        """Open (or create) a PersistentTransformCache.
+
+        Arguments:
+            path (str | pathlib.Path): The database file.
+            version (str): The version of the transformation whose results are cached.
+            name (str): The name of the cache within the database.
+            max_bytes (Optional[int]): The maximum total size of the pickled values in the database.
+        """
+        self.path = Path(path)
+        self.version = str(version)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries (name TEXT, key TEXT, version TEXT, value BLOB, "
+                               "size INTEGER, accessed REAL, PRIMARY KEY (name, key))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self.invalidated = self._conn.execute("DELETE FROM entries WHERE name = ? AND version != ?",
+                                                  (self.name, self.version)).rowcount
+        if self.invalidated:
+            logger.info(f"Invalidated {self.invalidated} entries of cache '{self.name}' in {self.path}")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def _hash(key: Hashable) -> str:
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value stored for `key`, or `default` if there is none."""
+        digest = self._hash(key)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM entries WHERE name = ? AND key = ? AND version = ?",
+                                     (self.name, digest, self.version)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE name = ? AND key = ?",
+                               (time.time(), self.name, digest))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store `value` for `key`, evicting the least recently used entries if the database grows too large."""
+        digest = self._hash(key)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._conn:
+            old = self._conn.execute("SELECT size FROM entries WHERE name = ? AND key = ?",
+                                     (self.name, digest)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO entries (name, key, version, value, size, accessed) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               (self.name, digest, self.version, data, len(data), time.time()))
+            self._bytes += len(data) - (old[0] if old is not None else 0)
+            if self.max_bytes is not None and self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the database is under `max_bytes`."""
+        while self._bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT name, key, size FROM entries ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                break
+            for name, key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE name = ? AND key = ?", (name, key))
+                self._bytes -= size
+                self.evictions += 1
+                if self._bytes <= self.max_bytes:
+                    break
+
+    def clear(self) -> None:
+        """Remove every entry of this cache."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE name = ?", (self.name,))
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries WHERE name = ?", (self.name,)).fetchone()[0]
+
+    def stats(self) -> dict[str, Any]:
+        """Get the number of entries, the size of the database's values and the counters."""
+        size = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidated": self.invalidated,
+            }
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"path": self.path, "version": self.version, "name": self.name, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(**state)
+
+
+def file_fingerprint(path: str | os.PathLike, *, content: bool = False) -> tuple:
+    """Get a fingerprint of a file that changes when the file does, for use as a cache key.
+
+    By default, the fingerprint is made of the path, size and modification time of the file, which is cheap to get.
+    With `content`, it is made of the path, size and a SHA-256 hash of the contents instead, which costs a read of the
+    whole file but ignores changes to the modification time alone.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.NamedTemporaryFile() as f:
+        ...     before = file_fingerprint(f.name, content=True)
+        ...     _ = f.write(b"data")
+        ...     f.flush()
+        ...     before == file_fingerprint(f.name, content=True)
+        False
+    """
+    path = Path(path)
+    stat = path.stat()
+    if not content:
+        return str(path), stat.st_size, stat.st_mtime_ns
+
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return str(path), stat.st_size, digest.hexdigest()
+
+
+class CachedTransformation(Transformation):
+    """Wrap a transformation, or any callable, so that its result is reused for records with the same key.
+
+    Attributes:
+        func (Callable): The wrapped transformation.
+        key (Optional[Callable]): Returns the cache key of a record. If None, the record itself is the key.
+        cache (TransformCache | PersistentTransformCache): Where results are stored.
+        namespace (Optional[Hashable]): Combined with each key, so that transformations can share a cache.
+    """
+
+    def __init__(self, func: Callable[[Any], Any], *, key: Optional[Callable[[Any], Hashable]] = None,
+                 cache: Optional[TransformCache | PersistentTransformCache] = None, maxsize: Optional[int] = 1024,
+                 ttl: Optional[float] = None, namespace: Optional[Hashable] = None) -> None:
+        """Create a new CachedTransformation.
+
+        Arguments:
+            func (Callable): The transformation. It must return the same result for records with the same key.
+            key (Optional[Callable]): Returns the cache key of a record, which must be hashable. If None, the record
+                itself is the key.
+            cache (Optional[TransformCache | PersistentTransformCache]): A cache to use, possibly shared with other
+                transformations. If None, a new `TransformCache` is created with `maxsize` and `ttl`.
+            maxsize (Optional[int]): The maximum number of entries of a new cache.
+            ttl (Optional[float]): Seconds after which entries of a new cache expire.
+            namespace (Optional[Hashable]): Combined with each key, so that transformations can share a cache.
+        """
+        self.func = func
+        self.key = key
+        self.cache = cache if cache is not None else TransformCache(maxsize, ttl)
+        self.namespace = namespace
+
+    def transform(self, item: Any) -> Any:
+        key = self.key(item) if self.key is not None else item
+        if self.namespace is not None:
+            key = (self.namespace, key)
+
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.func(item)
+            self.cache.put(key, value)
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        """Get the stats of the cache, see `TransformCache.stats`."""
+        return self.cache.stats()
@@ -0,0 +1,272 @@
+"""Checkpoint and resume long-running extractions.
+
+A checkpoint records how far through its source an extractor has got, so that a pipeline that dies part of the way
+through can resume where it left off rather than starting over.
+
+To be resumable, an extractor implements `dcw.etl.extract.ResumableExtractor`: alongside each record it yields a
+position, and it can restart from just after a given position. Positions must be JSON serializable.
+
+`ProcessingPipeline.extract(extractor, checkpoint=...)` tracks the completion of every record. The checkpoint's
+position is the low-watermark: the position of the last record for which it and every record before it have made it
+all the way through the pipeline. Periodically, the pipeline flushes its loaders and only then saves the low-watermark
+to a `CheckpointStore`, so a saved position never covers records that a loader could still lose. Records after the
+saved position may be loaded again when resuming, so loaders should tolerate (or overwrite) duplicates.
+
+With the native engine, completion is only known when no records are held in batchers, so the low-watermark advances
+in steps whenever the batchers empty.
+
+The `dcw-pipeline run` command saves checkpoints with `--checkpoint PATH`, and resumes with `--resume`.
+
+Examples:
+    >>> import tempfile
+    >>> from dcw.etl.pipeline import ProcessingPipeline
+    >>> from dcw.etl.extract import RecordExtractor
+    >>> from dcw.etl.load import ListLoader
+    >>> records = []
+    >>> pipeline = ProcessingPipeline()
+    >>> pipeline.add_loader(ListLoader(records))
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     store = SQLiteCheckpointStore(f"{tmpdir}/checkpoints.db")
+    ...     pipeline.extract(RecordExtractor("abc"), checkpoint=Checkpoint(store, "letters"))
+    ...     # the next run, with more data, resumes after the last record of the first
+    ...     pipeline.extract(RecordExtractor("abcde"), checkpoint=Checkpoint(store, "letters", resume=True))
+    ...     store.close()
+    >>> records
+    ['a', 'b', 'c', 'd', 'e']
+"""
+
+import abc
+import functools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from dcw.etl.extract import ResumableExtractor
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore(abc.ABC):
+    """Storage for checkpoint positions, keyed by name. Implementations must be thread-safe."""
+
+    @abc.abstractmethod
+    def load(self, key: str) -> Optional[Any]:
+        """Get the position saved under `key`, or None if there is none."""
+        raise NotImplementedError("load() must be implemented by subclasses")
+
+    @abc.abstractmethod
+    def save(self, key: str, position: Any) -> None:
+        """Save `position` under `key`, replacing any previous position. Must be durable once it returns."""
+        raise NotImplementedError("save() must be implemented by subclasses")
+
+    @abc.abstractmethod
+    def clear(self, key: str) -> None:
+        """Remove the position saved under `key`, if any."""
+        raise NotImplementedError("clear() must be implemented by subclasses")
+
+    def close(self) -> None:
+        """Release any resources held by the store."""
+        pass
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Store checkpoints in a SQLite database. Many checkpoints can share one database.
+
+    Attributes:
+        path (pathlib.Path): The database file.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, position TEXT NOT NULL, updated REAL)")
+
+    def load(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT position FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save(self, key: str, position: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO checkpoints (key, position, updated) VALUES (?, ?, ?)",
+                               (key, json.dumps(position), time.time()))
+
+    def clear(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FileCheckpointStore(CheckpointStore):
+    """Store each checkpoint in its own JSON file in a directory. Files are replaced atomically.
+
+    Attributes:
+        directory (pathlib.Path): The directory holding the checkpoint files.
+    """
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in key)
+        return self.directory / f"{safe}.json"
+
+    def load(self, key: str) -> Optional[Any]:
+        try:
+            with self._path(key).open() as f:
+                return json.load(f)["position"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, position: Any) -> None:
+        path = self._path(key)
+        with self._lock:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=f".{path.name}.")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"key": key, "position": position, "updated": time.time()}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._path(key).unlink(missing_ok=True)
+
+
+class Watermark:
+    """Track the position up to which every record has completed, when records can complete out of order.
+
+    Examples:
+        >>> watermark = Watermark()
+        >>> a, b, c = (watermark.track(position) for position in "abc")
+        >>> watermark.complete(b)
+        >>> watermark.position is None
+        True
+        >>> watermark.complete(a)
+        >>> watermark.position
+        'b'
+
+    Attributes:
+        position (Optional[Any]): The position of the last record for which it and every record before it have
+            completed, or None if there is no such record yet.
+    """
+
+    def __init__(self, position: Optional[Any] = None) -> None:
+        self.position = position
+        self._lock = threading.Lock()
+        self._next = 0
+        self._low = 0
+        self._positions: dict[int, Any] = {}
+        self._done: set[int] = set()
+
+    def track(self, position: Any) -> int:
+        """Start tracking a record at `position`, returning its sequence number."""
+        with self._lock:
+            seq = self._next
+            self._next += 1
+            self._positions[seq] = position
+            return seq
+
+    def complete(self, seq: int) -> None:
+        """Mark the record with sequence number `seq` as completed."""
+        with self._lock:
+            self._done.add(seq)
+            while self._low in self._done:
+                self._done.remove(self._low)
+                self.position = self._positions.pop(self._low)
+                self._low += 1
+
+
+class Checkpoint:
+    """Periodically save the progress of an extraction to a `CheckpointStore`.
+
+    A checkpoint is saved every `every` records and/or `interval` seconds, and once more when extraction finishes.
+
+    Attributes:
+        store (CheckpointStore): Where positions are saved.
+        key (str): The name the position is saved under.
+        every (Optional[int]): Save after this many records have been extracted since the last save.
+        interval (Optional[float]): Save after this many seconds have passed since the last save.
+        resume (bool): Whether to resume from the saved position. If False, extraction starts from the beginning and
+            the saved position is overwritten.
+    """
+
+    def __init__(self, store: CheckpointStore, key: str, *, every: Optional[int] = 10_000,
+                 interval: Optional[float] = 60.0, resume: bool = False) -> None:
+        """Create a new Checkpoint.
+
+        Arguments:
+            store (CheckpointStore): Where positions are saved.
+            key (str): The name the position is saved under.
+            every (Optional[int]): Save after this many records have been extracted since the last save.
+            interval (Optional[float]): Save after this many seconds have passed since the last save.
+            resume (bool): Whether to resume from the saved position.
+        """
+        self.store = store
+        self.key = key
+        self.every = every
+        self.interval = interval
+        self.resume = resume
+        self.watermark = Watermark()
+
+    def iter_records(self, extractor: ResumableExtractor,
+                     flush: Callable[[], None]) -> Iterator[tuple[Any, Callable[[], None]]]:
+        """Iterate over the records of `extractor`, saving checkpoints along the way.
+
+        Each record is yielded along with a callback that must be called once the record has completed. Checkpoints
+        are saved between records: `flush` is called first, and then the low-watermark as it was before `flush` was
+        called is saved.
+
+        Arguments:
+            extractor (ResumableExtractor): The extractor.
+            flush (Callable): Flushes the loaders.
+        """
+        if self.resume:
+            start = self.store.load(self.key)
+            if start is not None:
+                logger.info(f"Resuming '{self.key}' after position {start}")
+        else:
+            start = None
+            self.store.clear(self.key)
+
+        self.watermark = watermark = Watermark(start)
+        count = 0
+        last = time.monotonic()
+
+        for position, record in extractor.iter_positions(start):
+            seq = watermark.track(position)
+            yield record, functools.partial(watermark.complete, seq)
+
+            count += 1
+            if ((self.every is not None and count >= self.every)
+                    or (self.interval is not None and time.monotonic() - last >= self.interval)):
+                self.save(flush)
+                count = 0
+                last = time.monotonic()
+
+    def save(self, flush: Callable[[], None]) -> None:
+        """Flush the loaders, then save the low-watermark as it was before the flush."""
+        position = self.watermark.position
+        flush()
+        if position is not None:
+            logger.debug(f"Saving checkpoint '{self.key}' at position {position}")
+            self.store.save(self.key, position)
@@ -0,0 +1,258 @@
+"""Drop records that have already been seen.
+
+`ProcessingPipeline.add_deduplicator` adds a stage that drops every record whose key has been seen before, so that
+duplicates sent by a source do not go through the (often expensive) stages after it. Remembering every key ever seen
+takes unbounded memory, so the keys are held in one of two bounded structures:
+
+- `LRUSet` ("exact" mode): the `capacity` most recently seen keys. A duplicate is never let through as long as its
+  key is still held, and a new record is never dropped.
+- `BloomFilter` ("bloom" mode): a fixed-size bit array, sized for `capacity` keys at a given false-positive rate. It
+  takes far less memory than the keys themselves and never forgets a key, but a small fraction of new records are
+  dropped as duplicates. The rate grows past the target once more than `capacity` keys have been added.
+
+The state of a `Deduplicator` can be saved to a file and loaded by the next run, so that records sent again in a later
+run are dropped too.
+
+Examples:
+    >>> dedup = Deduplicator(lambda record: record["id"], capacity=100)
+    >>> [dedup(record) for record in ({"id": 1}, {"id": 2}, {"id": 1})]
+    [True, True, False]
+    >>> dedup.stats()["duplicates"]
+    1
+"""
+
+import collections
+import hashlib
+import logging
+import math
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Hashable, Literal, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUSet:
+    """A set that holds at most `capacity` keys, forgetting the least recently seen key when full.
+
+    Examples:
+        >>> seen = LRUSet(2)
+        >>> [seen.add(key) for key in "abac"]
+        [True, True, False, True]
+        >>> "b" in seen, "a" in seen
+        (False, True)
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self._keys: collections.OrderedDict[Hashable, None] = collections.OrderedDict()
+        self._key_bytes = 0
+
+    def add(self, key: Hashable) -> bool:
+        """Add a key, returning True if it was not already in the set."""
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+
+        self._keys[key] = None
+        self._key_bytes += sys.getsizeof(key)
+        if len(self._keys) > self.capacity:
+            evicted, _ = self._keys.popitem(last=False)
+            self._key_bytes -= sys.getsizeof(evicted)
+        return True
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def memory_bytes(self) -> int:
+        """An estimate of the memory used by the set and its keys, not counting objects the keys refer to."""
+        return sys.getsizeof(self._keys) + self._key_bytes
+
+    @property
+    def false_positive_rate(self) -> float:
+        return 0.0
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"capacity": self.capacity, "keys": list(self._keys)}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(state["capacity"])
+        for key in state["keys"]:
+            self.add(key)
+
+
+class BloomFilter:
+    """A probabilistic set of fixed size, which may report that a key is present when it is not.
+
+    Keys are hashed with BLAKE2b rather than `hash()`, so that a saved filter works in another process. Strings and
+    bytes are hashed as-is, and other keys by their `repr()`, which must therefore identify them.
+
+    Examples:
+        >>> seen = BloomFilter(1000, error_rate=0.01)
+        >>> [seen.add(key) for key in "aba"]
+        [True, True, False]
+        >>> "a" in seen, "c" in seen
+        (True, False)
+
+    Attributes:
+        capacity (int): The number of keys the filter is sized for.
+        error_rate (float): The target false-positive rate once `capacity` keys have been added.
+        bits (int): The number of bits in the filter.
+        hashes (int): The number of bits set for each key.
+        count (int): The number of keys added that were not (reported as) already present.
+    """
+
+    def __init__(self, capacity: int, *, error_rate: float = 0.001) -> None:
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be between 0 and 1, got {error_rate}")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _indexes(self, key: Any) -> list[int]:
+        if isinstance(key, str):
+            data = key.encode()
+        elif isinstance(key, bytes):
+            data = key
+        else:
+            data = repr(key).encode()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        # double hashing: k indexes from two 64-bit hashes
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: Any) -> bool:
+        """Add a key, returning True if it was not (reported as) already present."""
+        array = self._array
+        new = False
+        for index in self._indexes(key):
+            byte, mask = index >> 3, 1 << (index & 7)
+            if not array[byte] & mask:
+                array[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key: Any) -> bool:
+        array = self._array
+        return all(array[index >> 3] & (1 << (index & 7)) for index in self._indexes(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._array)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """The estimated probability that a key that was never added is reported as present."""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class Deduplicator:
+    """A predicate that returns False for records whose key has been seen before. Thread-safe.
+
+    Attributes:
+        key (Optional[Callable]): Returns the key of a record. If None, the record itself is the key.
+        mode (str): "exact" to hold keys in an `LRUSet`, or "bloom" to use a `BloomFilter`.
+        capacity (int): The number of keys the deduplicator holds or is sized for.
+        state_path (Optional[pathlib.Path]): File the state is loaded from, if it exists, and saved to by `save()`.
+        duplicates (int): The number of records found to be duplicates.
+    """
+
+    def __init__(self, key: Optional[Callable[[Any], Hashable]] = None, *, capacity: int,
+                 mode: Literal["exact", "bloom"] = "exact", error_rate: float = 0.001,
+                 state_path: Optional[str | Path] = None) -> None:
+        """Create a new Deduplicator.
+
+        Arguments:
+            key (Optional[Callable]): Returns the key of a record. If None, the record itself is the key.
+            capacity (int): In "exact" mode, the number of keys held. In "bloom" mode, the number of keys the filter
+                is sized for.
+            mode (str): "exact" or "bloom".
+            error_rate (float): In "bloom" mode, the target false-positive rate.
+            state_path (Optional[str | pathlib.Path]): File to load the state from, if it exists, and to save it to.
+        """
+        if mode == "exact":
+            seen = LRUSet(capacity)
+        elif mode == "bloom":
+            seen = BloomFilter(capacity, error_rate=error_rate)
+        else:
+            raise ValueError(f"Unknown mode {mode}")
+
+        self.key = key
+        self.mode = mode
+        self.capacity = capacity
+        self.state_path = Path(state_path) if state_path is not None else None
+        self.duplicates = 0
+        self._seen = seen
+        self._lock = threading.Lock()
+
+        if self.state_path is not None and self.state_path.exists():
+            self._load()
+
+    def __call__(self, record: Any) -> bool:
+        key = self.key(record) if self.key is not None else record
+        with self._lock:
+            new = self._seen.add(key)
+            if not new:
+                self.duplicates += 1
+        return new
+
+    def stats(self) -> dict[str, Any]:
+        """Get the number of keys held, an estimate of the memory they use, and the false-positive rate."""
+        with self._lock:
+            return {
+                "keys": len(self._seen),
+                "duplicates": self.duplicates,
+                "memory_bytes": self._seen.memory_bytes,
+                "false_positive_rate": self._seen.false_positive_rate,
+            }
+
+    def _load(self) -> None:
+        with self.state_path.open("rb") as f:
+            state = pickle.load(f)
+        seen = state["seen"]
+        if (state["mode"], seen.capacity) != (self.mode, self.capacity) or (
+                self.mode == "bloom" and seen.error_rate != self._seen.error_rate):
+            raise ValueError(f"The deduplicator state in {self.state_path} was saved with different settings")
+        logger.debug(f"Loaded {len(seen)} keys from {self.state_path}")
+        self._seen = seen
+
+    def save(self) -> None:
+        """Save the state to `state_path`, atomically replacing the previous state."""
+        if self.state_path is None:
+            raise ValueError("The deduplicator has no state_path")
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = pickle.dumps({"mode": self.mode, "seen": self._seen}, protocol=pickle.HIGHEST_PROTOCOL)
+
+        fd, tmp = tempfile.mkstemp(dir=self.state_path.parent, prefix=f".{self.state_path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.state_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
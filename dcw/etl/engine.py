@@ -0,0 +1,832 @@
+"""A lightweight execution engine for linear chains of pipeline stages.
+
+`ProcessingPipeline` normally builds a graph of `streamz` streams. Every record pushed through such a graph pays for
+streamz's general-purpose machinery: a reference counter per record, a metadata list that is retained and released at
+every stage, and, when extracting, a lock and a condition notification per record.
+
+The native engine trades that generality for speed. Its nodes implement the subset of the streamz API used by
+`ProcessingPipeline` (`map`, `filter`, `partition`, `flatten`, `union` and `sink`, plus windows). Before the first
+record is pushed, the graph is compiled into plain Python closures, fusing consecutive transformations into a single
+call, so pushing a record costs little more than calling the transformations and loaders directly.
+
+Because every stage runs synchronously on the thread that pushed the record, the only place a record can wait is in a
+batcher. Rather than tracking each record with a reference counter, the engine tracks completion by counting the
+records held in batchers: when none are held, everything pushed so far has been processed.
+
+Examples:
+    >>> from dcw.etl.pipeline import ProcessingPipeline
+    >>> from dcw.etl.extract import RecordExtractor
+    >>> from dcw.etl.load import ListLoader
+    >>> records = []
+    >>> pipeline = ProcessingPipeline(engine="native")
+    >>> pipeline.add_transform(lambda x: x ** 2)
+    >>> pipeline.add_transform(lambda x: x + 1)
+    >>> pipeline.add_batcher(2)
+    >>> pipeline.add_loader(ListLoader(records))
+    >>> pipeline.extract(RecordExtractor(range(5)))
+    >>> records
+    [(1, 2), (5, 10), (17,)]
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+from dcw.etl.batching import BatchSizer
+from dcw.etl.load import Loader
+from dcw.etl.window import Windower
+
+logger = logging.getLogger(__name__)
+
+
+def _noop(x: Any) -> None:
+    pass
+
+
+class Node:
+    """A stage in a natively executed pipeline.
+
+    Attributes:
+        name (Optional[str]): Name of the stage.
+        upstreams (list[Node]): The stages that emit into this stage.
+        downstreams (list[Node]): The stages this stage emits into.
+        source (Source): The source of the graph this stage belongs to.
+        stats (Optional[dcw.etl.stats.StageStats]): If set, records passing through the stage are counted and timed.
+    """
+
+    def __init__(self, upstream: Optional["Node"] = None, *, stream_name: Optional[str] = None) -> None:
+        self.name = stream_name
+        self.stats = None
+        self.upstreams: list[Node] = []
+        self.downstreams: list[Node] = []
+        self.source = upstream.source if upstream is not None else self
+        if upstream is not None:
+            self.upstreams.append(upstream)
+            upstream.downstreams.append(self)
+            self.source.invalidate()
+
+    def map(self, func: Callable[[Any], Any], *, stream_name: Optional[str] = None) -> "Map":
+        return Map(self, func, stream_name=stream_name)
+
+    def filter(self, predicate: Callable[[Any], bool], *, stream_name: Optional[str] = None) -> "Filter":
+        return Filter(self, predicate, stream_name=stream_name)
+
+    def partition(self, n: int, *, timeout: Optional[float] = None, stream_name: Optional[str] = None,
+                  sizer: Optional[BatchSizer] = None) -> "Batch":
+        return Batch(self, n, timeout=timeout, stream_name=stream_name, sizer=sizer)
+
+    def window(self, windower: Windower, *, stream_name: Optional[str] = None) -> "Window":
+        return Window(self, windower, stream_name=stream_name)
+
+    def flatten(self, *, stream_name: Optional[str] = None) -> "Flatten":
+        return Flatten(self, stream_name=stream_name)
+
+    def union(self, *others: "Node", stream_name: Optional[str] = None) -> "Union":
+        return Union(self, *others, stream_name=stream_name)
+
+    def sink(self, func: Callable[[Any], None], *, stream_name: Optional[str] = None) -> "Sink":
+        return Sink(self, func, stream_name=stream_name)
+
+    def compile(self) -> Callable[[Any], None]:
+        """Compile this stage and everything downstream of it into a single callable."""
+        run = self._compile()
+        if self.stats is not None and not isinstance(self, Source):
+            # queued loaders time the records they load on their worker threads
+            run = self.stats.wrap_update(run, timed=not isinstance(self, QueuedSink), loader=isinstance(self, Sink))
+        return run
+
+    def _compile(self) -> Callable[[Any], None]:
+        return self._compile_downstreams()
+
+    def _compile_downstreams(self) -> Callable[[Any], None]:
+        emit = self._fan_out(tuple(downstream.compile() for downstream in self.downstreams))
+        if self.stats is not None:
+            emit = self.stats.wrap_emit(emit, count_in=isinstance(self, Source))
+        return emit
+
+    @staticmethod
+    def _fan_out(emitters: tuple[Callable[[Any], None], ...]) -> Callable[[Any], None]:
+        if not emitters:
+            return _noop
+
+        if len(emitters) == 1:
+            return emitters[0]
+
+        def fan_out(x):
+            for emit in emitters:
+                emit(x)
+
+        return fan_out
+
+
+class Source(Node):
+    """The entry point to a natively executed pipeline."""
+
+    def __init__(self, *, stream_name: Optional[str] = None) -> None:
+        super().__init__(stream_name=stream_name)
+        self.exception: Optional[BaseException] = None
+        self._compiled: Optional[Callable[[Any], None]] = None
+        self._idle = threading.Condition()
+        self._callbacks: list[Callable[[], None]] = []
+        # records held by the batchers, windows, partitioners and queued loaders, kept up to date by the nodes through
+        # `_hold` and `_notify` so that it is not recounted for every record
+        self._held = 0
+        # incremented whenever the graph changes, so that nodes can tell when what they cache is out of date
+        self.generation = 0
+
+    def invalidate(self) -> None:
+        """Discard the compiled pipeline, so that it is recompiled the next time a record is pushed."""
+        self._compiled = None
+        self.generation += 1
+
+    def emit(self, x: Any, callback: Optional[Callable[[], None]] = None) -> None:
+        """Push a record through the pipeline.
+
+        Arguments:
+            x (Any): The record.
+            callback (Optional[Callable]): Called once the record, and every record pushed before it, has been
+                processed.
+        """
+        if self._compiled is None:
+            self._compiled = self.compile()
+        self._compiled(x)
+
+        if callback is not None:
+            with self._idle:
+                self._callbacks.append(callback)
+            self._notify()
+
+    def batches(self) -> Iterator["Batch | Window | KeyPartition | QueuedSink"]:
+        """Iterate over the batchers, windows, partitioners and queued loaders in the pipeline, from upstream to
+        downstream."""
+        queue = [self]
+        seen = set()
+        while queue:
+            node = queue.pop(0)
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, (Batch, Window, KeyPartition, QueuedSink)):
+                yield node
+            queue.extend(node.downstreams)
+
+    def held(self) -> int:
+        """Get the number of records (or batches) waiting in batchers, in a batch being emitted, in lanes or in loader
+        queues, plus the number of open windows."""
+        return self._held
+
+    def wait(self, predicate: Callable[[int], bool]) -> None:
+        """Block until `predicate(self.held())` is True."""
+        with self._idle:
+            self._idle.wait_for(lambda: predicate(self._held))
+
+    def flush(self) -> None:
+        """Emit every partial batch, from upstream to downstream, and wait for loader queues to drain, so that no
+        records are left waiting."""
+        for batch in self.batches():
+            batch.flush()
+
+    def _hold(self, n: int) -> None:
+        """Count `n` more records as held by a node."""
+        with self._idle:
+            self._held += n
+
+    def _notify(self, released: int = 0) -> None:
+        """Count `released` records as no longer held, wake up anything waiting on the number of held records, and
+        fire callbacks if the pipeline is idle."""
+        callbacks = []
+        with self._idle:
+            self._held -= released
+            self._idle.notify_all()
+            if self._callbacks and self._held == 0:
+                callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+
+class Map(Node):
+    """Apply a function to every record.
+
+    Consecutive `Map` stages are fused into a single callable when compiled, unless they collect stats.
+    """
+
+    def __init__(self, upstream: Node, func: Callable[[Any], Any], *, stream_name: Optional[str] = None) -> None:
+        self.func = func
+        super().__init__(upstream, stream_name=stream_name)
+
+    def _compile(self) -> Callable[[Any], None]:
+        funcs = [self.func]
+        node = self
+        while (self.stats is None and len(node.downstreams) == 1 and type(node.downstreams[0]) is Map
+               and node.downstreams[0].stats is None):
+            node = node.downstreams[0]
+            funcs.append(node.func)
+
+        emit = node._compile_downstreams()
+
+        if len(funcs) == 1:
+            func = funcs[0]
+
+            def run(x):
+                emit(func(x))
+        else:
+            funcs = tuple(funcs)
+
+            def run(x):
+                for func in funcs:
+                    x = func(x)
+                emit(x)
+
+        return run
+
+
+class Filter(Node):
+    """Emit only the records for which a predicate returns True."""
+
+    def __init__(self, upstream: Node, predicate: Callable[[Any], bool], *,
+                 stream_name: Optional[str] = None) -> None:
+        self.predicate = predicate
+        super().__init__(upstream, stream_name=stream_name)
+
+    def _compile(self) -> Callable[[Any], None]:
+        emit = self._compile_downstreams()
+        predicate = self.predicate
+
+        def run(x):
+            if predicate(x):
+                emit(x)
+
+        return run
+
+
+class Flatten(Node):
+    """Emit each element of an iterable record as its own record."""
+
+    def _compile(self) -> Callable[[Any], None]:
+        emit = self._compile_downstreams()
+
+        def run(x):
+            for item in x:
+                emit(item)
+
+        return run
+
+
+class Union(Node):
+    """Emit the records of several upstream stages, such as the branches of a pipeline, into one.
+
+    The union is compiled once for each upstream, but the stages downstream of it are only compiled once.
+    """
+
+    def __init__(self, upstream: Node, *others: Node, stream_name: Optional[str] = None) -> None:
+        self._emit: Optional[Callable[[Any], None]] = None
+        self._generation = -1
+        super().__init__(upstream, stream_name=stream_name)
+        for other in others:
+            if other.source is not self.source:
+                raise ValueError("Only stages of the same pipeline can be merged")
+            self.upstreams.append(other)
+            other.downstreams.append(self)
+
+    def _compile(self) -> Callable[[Any], None]:
+        if self._emit is None or self._generation != self.source.generation:
+            self._emit = self._compile_downstreams()
+            self._generation = self.source.generation
+        return self._emit
+
+
+class Sink(Node):
+    """Pass every record to a function, typically a `Loader`."""
+
+    def __init__(self, upstream: Node, func: Callable[[Any], None], *, stream_name: Optional[str] = None) -> None:
+        self.func = func
+        super().__init__(upstream, stream_name=stream_name)
+
+    def _compile(self) -> Callable[[Any], None]:
+        # skip Loader.__call__ and go straight to load()
+        return self.func.load if isinstance(self.func, Loader) else self.func
+
+
+class Batch(Node):
+    """Collect records into tuples of up to `n` records.
+
+    If a `sizer` is given, it decides when a batch is full instead, capping batches by estimated size in bytes and/or
+    adapting their size to a target latency (see `dcw.etl.batching`).
+
+    If a `timeout` is given, a partial batch is emitted once its first record has been waiting for that many seconds.
+    Timeouts are handled by a daemon thread that is started when the first record arrives.
+
+    Attributes:
+        n (int): Maximum batch size.
+        timeout (Optional[float]): Seconds after which a partial batch is emitted.
+        sizer (Optional[dcw.etl.batching.BatchSizer]): Decides when a batch is full, if given.
+        exception (Optional[BaseException]): The first exception raised downstream while emitting a batch that timed
+            out, if any.
+    """
+
+    def __init__(self, upstream: Node, n: int, *, timeout: Optional[float] = None, stream_name: Optional[str] = None,
+                 sizer: Optional[BatchSizer] = None) -> None:
+        self.n = n
+        self.timeout = timeout
+        self.sizer = sizer
+        self.exception: Optional[BaseException] = None
+        self._buffer: list = []
+        self._bytes = 0
+        self._emitting = 0
+        self._deadline: Optional[float] = None
+        self._lock = threading.Condition()
+        self._emit: Callable[[Any], None] = _noop
+        self._timer: Optional[threading.Thread] = None
+        super().__init__(upstream, stream_name=stream_name)
+
+    @property
+    def details(self) -> Optional[Callable[[], dict[str, Any]]]:
+        return self.sizer.stats if self.sizer is not None else None
+
+    def __len__(self) -> int:
+        return len(self._buffer) + self._emitting
+
+    def _compile(self) -> Callable[[Any], None]:
+        self._emit = self._compile_downstreams()
+        if self.sizer is not None:
+            return self._compile_sized()
+
+        buffer = self._buffer
+        n = self.n
+        lock = self._lock
+        timeout = self.timeout
+        hold = self.source._hold
+
+        def run(x):
+            with lock:
+                buffer.append(x)
+                hold(1)
+                if len(buffer) >= n:
+                    self._emit_batch()
+                elif timeout is not None and len(buffer) == 1:
+                    self._deadline = time.monotonic() + timeout
+                    self._start_timer()
+                    lock.notify()
+
+        return run
+
+    def _compile_sized(self) -> Callable[[Any], None]:
+        buffer = self._buffer
+        sizer = self.sizer
+        lock = self._lock
+        timeout = self.timeout
+        hold = self.source._hold
+
+        def run(x):
+            nbytes = sizer.measure(x)
+            with lock:
+                if buffer and not sizer.fits(self._bytes, nbytes):
+                    self._emit_batch()
+                buffer.append(x)
+                hold(1)
+                self._bytes += nbytes
+                if sizer.full(len(buffer), self._bytes):
+                    self._emit_batch()
+                elif timeout is not None and len(buffer) == 1:
+                    self._deadline = time.monotonic() + timeout
+                    self._start_timer()
+                    lock.notify()
+
+        return run
+
+    def flush(self) -> None:
+        """Emit the current partial batch, if any."""
+        with self._lock:
+            if self._buffer:
+                self._emit_batch()
+
+    def _emit_batch(self) -> None:
+        """Emit the buffered records as a batch. Called with the lock held."""
+        batch = tuple(self._buffer)
+        self._buffer.clear()
+        self._bytes = 0
+        self._deadline = None
+        # the batch is still held until it has made it through the rest of the pipeline
+        self._emitting += len(batch)
+        try:
+            if self.sizer is None:
+                self._emit(batch)
+            else:
+                start = time.perf_counter()
+                self._emit(batch)
+                self.sizer.observe(len(batch), time.perf_counter() - start)
+        finally:
+            self._emitting -= len(batch)
+            self.source._notify(len(batch))
+
+    def _start_timer(self) -> None:
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run_timer, name=f"batch-timer-{self.name}", daemon=True)
+            self._timer.start()
+
+    def _run_timer(self) -> None:
+        with self._lock:
+            while True:
+                if self._deadline is None:
+                    self._lock.wait()
+                    continue
+
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+
+                try:
+                    self._emit_batch()
+                except Exception as e:
+                    logger.exception(f"Error emitting batch from {self.name}")
+                    if self.exception is None:
+                        self.exception = e
+
+
+class Window(Node):
+    """Aggregate records over windows of time, see `dcw.etl.window`.
+
+    Each open window counts as one held record until it closes. With processing time, windows are closed by a daemon
+    thread that is started when the first record arrives.
+
+    Attributes:
+        windower (dcw.etl.window.Windower): Assigns records to windows and computes their aggregates.
+        exception (Optional[BaseException]): The first exception raised downstream while emitting a window that was
+            closed by the timer thread, if any.
+    """
+
+    def __init__(self, upstream: Node, windower: Windower, *, stream_name: Optional[str] = None) -> None:
+        self.windower = windower
+        self.exception: Optional[BaseException] = None
+        self._emitting = 0
+        self._lock = threading.Condition()
+        self._emit: Callable[[Any], None] = _noop
+        self._timer: Optional[threading.Thread] = None
+        super().__init__(upstream, stream_name=stream_name)
+
+    @property
+    def details(self) -> Callable[[], dict[str, Any]]:
+        return self.windower.stats
+
+    def __len__(self) -> int:
+        return len(self.windower) + self._emitting
+
+    def _compile(self) -> Callable[[Any], None]:
+        self._emit = self._compile_downstreams()
+        windower = self.windower
+        lock = self._lock
+        hold = self.source._hold
+
+        def run(x):
+            with lock:
+                opened = -len(windower)
+                _, closed = windower.add(x)
+                opened += len(windower) + len(closed)
+                if opened:
+                    hold(opened)
+                self._emit_results(closed)
+                if not windower.event_time:
+                    self._start_timer()
+                    lock.notify()
+
+        return run
+
+    def flush(self) -> None:
+        """Close and emit every open window."""
+        with self._lock:
+            self._emit_results(self.windower.flush())
+
+    def _emit_results(self, closed: list[tuple[Any, dict]]) -> None:
+        """Emit the results of closed windows. Called with the lock held."""
+        if not closed:
+            return
+        self._emitting += len(closed)
+        try:
+            for _, result in closed:
+                self._emit(result)
+        finally:
+            self._emitting -= len(closed)
+            self.source._notify(len(closed))
+
+    def _start_timer(self) -> None:
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run_timer, name=f"window-timer-{self.name}", daemon=True)
+            self._timer.start()
+
+    def _run_timer(self) -> None:
+        with self._lock:
+            while True:
+                end = self.windower.next_end()
+                if end is None:
+                    self._lock.wait()
+                    continue
+
+                remaining = end - self.windower.clock()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+
+                try:
+                    self._emit_results(self.windower.close_due())
+                except Exception as e:
+                    logger.exception(f"Error emitting windows from {self.name}")
+                    if self.exception is None:
+                        self.exception = e
+
+
+class Lanes:
+    """Route records to independent lanes by key, preserving the order of the records of each key.
+
+    Each lane is a natively executed pipeline with its own `Source`, fed by its own worker thread. A record is sent to
+    lane `hash(key_func(record)) % partitions`, so every record of a key goes through the same lane, one at a time, in
+    the order the records were submitted. Records of different keys may be processed in parallel.
+
+    Attributes:
+        key_func (Callable): Returns the key of a record.
+        sources (list[Source]): The source of each lane.
+        buffer_size (int): Maximum number of records waiting for each lane. `submit` blocks when a lane is full.
+        exception (Optional[BaseException]): The first exception raised by a lane, if any.
+    """
+
+    def __init__(self, key_func: Callable[[Any], Hashable], partitions: int, *, buffer_size: int,
+                 name: Optional[str] = None) -> None:
+        if partitions < 1:
+            raise ValueError(f"partitions must be at least 1, got {partitions}")
+        if buffer_size < 1:
+            raise ValueError(f"buffer_size must be at least 1, got {buffer_size}")
+        self.key_func = key_func
+        self.buffer_size = buffer_size
+        self.sources = [Source(stream_name=f"{name or 'lane'}[{i}]") for i in range(partitions)]
+        self.exception: Optional[BaseException] = None
+        self._queues: list[deque[tuple[Any, Callable[[], None]]]] = [deque() for _ in range(partitions)]
+        self._busy = 0
+        self._held = 0
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    def __len__(self) -> int:
+        """Get the number of records submitted that have not yet completed."""
+        return self._held
+
+    def submit(self, x: Any, done: Callable[[], None], *, block: bool = True) -> bool:
+        """Queue a record for its lane.
+
+        Arguments:
+            x (Any): The record.
+            done (Callable): Called once the record has made it through its lane.
+            block (bool): Whether to wait for room in the lane if it is full.
+
+        Returns:
+            bool: True if the record was queued, False if the lane was full and `block` is False.
+        """
+        queue = self._queues[hash(self.key_func(x)) % len(self._queues)]
+        with self._cond:
+            if len(queue) >= self.buffer_size:
+                if not block:
+                    return False
+                self._cond.wait_for(lambda: len(queue) < self.buffer_size)
+            if not self._threads:
+                self._start()
+            queue.append((x, done))
+            self._held += 1
+            self._cond.notify_all()
+        return True
+
+    def flush(self) -> None:
+        """Wait for the lanes to take every queued record, then emit the partial batches held in the lanes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._busy == 0 and not any(self._queues))
+        for source in self.sources:
+            source.flush()
+
+    def _start(self) -> None:
+        for index, source in enumerate(self.sources):
+            thread = threading.Thread(target=self._run, args=(index,), name=source.name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self, index: int) -> None:
+        source = self.sources[index]
+        queue = self._queues[index]
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: queue)
+                x, done = queue.popleft()
+                self._busy += 1
+                self._cond.notify_all()
+
+            callback = functools.partial(self._complete, done)
+            try:
+                source.emit(x, callback=callback)
+            except Exception as e:
+                # drop the record, so that completion tracking is not left waiting on it
+                logger.exception(f"Error in lane {source.name}")
+                if self.exception is None:
+                    self.exception = e
+                callback()
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def _complete(self, done: Callable[[], None]) -> None:
+        with self._cond:
+            self._held -= 1
+            self._cond.notify_all()
+        done()
+
+
+class KeyPartition(Node):
+    """Send each record to one of several lanes by key, see `Lanes`.
+
+    The lanes are separate pipelines, so this node has no downstreams of its own. Records are held by the node until
+    they have made it through their lane.
+    """
+
+    def __init__(self, upstream: Node, lanes: Lanes, *, stream_name: Optional[str] = None) -> None:
+        self.lanes = lanes
+        super().__init__(upstream, stream_name=stream_name)
+
+    @property
+    def exception(self) -> Optional[BaseException]:
+        return self.lanes.exception
+
+    def __len__(self) -> int:
+        return len(self.lanes)
+
+    def flush(self) -> None:
+        self.lanes.flush()
+
+    def _compile(self) -> Callable[[Any], None]:
+        lanes = self.lanes
+        hold = self.source._hold
+        release = functools.partial(self.source._notify, 1)
+        stats = self.stats
+
+        def run(x):
+            if lanes.exception is not None:
+                raise lanes.exception
+            hold(1)
+            lanes.submit(x, release)
+            if stats is not None:
+                stats.record(records_out=1)
+
+        return run
+
+
+class LoaderQueue:
+    """Run a loader on its own worker threads, behind a bounded queue.
+
+    Records submitted to the queue are loaded in the background, so a slow loader does not hold up the stages upstream
+    of it, or other loaders, until its queue is full. With more than one worker, the loader must be thread-safe, and
+    records may be loaded out of order.
+
+    Attributes:
+        loader (Loader | Callable): The loader.
+        maxsize (int): Maximum number of records waiting to be loaded. `submit` blocks when the queue is full.
+        workers (int): Number of worker threads.
+        exception (Optional[BaseException]): The first exception raised by the loader, if any.
+        stats (Optional[dcw.etl.stats.StageStats]): If set, loaded records are counted as emitted, and timed.
+    """
+
+    def __init__(self, loader: Loader | Callable[[Any], None], *, maxsize: int, workers: int = 1,
+                 name: Optional[str] = None) -> None:
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        self.loader = loader
+        self.maxsize = maxsize
+        self.workers = workers
+        self.name = name or "loader"
+        self.exception: Optional[BaseException] = None
+        self.stats = None
+        self._queue: deque[tuple[Any, Optional[Callable[[], None]]]] = deque()
+        self._busy = 0
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    def __len__(self) -> int:
+        """Get the number of records submitted that have not yet been loaded."""
+        return len(self._queue) + self._busy
+
+    def details(self) -> dict[str, Any]:
+        """Get the number of records waiting in the queue and being loaded."""
+        return {"queued": len(self._queue), "loading": self._busy}
+
+    def submit(self, x: Any, done: Optional[Callable[[], None]] = None, *, block: bool = True) -> bool:
+        """Queue a record to be loaded.
+
+        Arguments:
+            x (Any): The record.
+            done (Optional[Callable]): Called once the record has been loaded, or has failed to load.
+            block (bool): Whether to wait for room in the queue if it is full.
+
+        Returns:
+            bool: True if the record was queued, False if the queue was full and `block` is False.
+        """
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                if not block:
+                    return False
+                self._cond.wait_for(lambda: len(self._queue) < self.maxsize)
+            if not self._threads:
+                self._start()
+            self._queue.append((x, done))
+            self._cond.notify_all()
+        return True
+
+    def join(self) -> None:
+        """Wait until every record submitted has been loaded."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self) == 0)
+
+    def _start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self) -> None:
+        # skip Loader.__call__ and go straight to load()
+        load = self.loader.load if isinstance(self.loader, Loader) else self.loader
+        perf_counter = time.perf_counter
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                x, done = self._queue.popleft()
+                self._busy += 1
+                self._cond.notify_all()
+
+            start = perf_counter()
+            failed = True
+            try:
+                load(x)
+                failed = False
+            except Exception as e:
+                # drop the record, so that completion tracking is not left waiting on it
+                logger.exception(f"Error in loader {self.name}")
+                if self.exception is None:
+                    self.exception = e
+            finally:
+                stats = self.stats
+                if stats is not None:
+                    stats.record(records_out=int(not failed), errors=int(failed), elapsed=perf_counter() - start)
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+                if done is not None:
+                    done()
+
+
+class QueuedSink(Node):
+    """Pass every record to a `LoaderQueue`, which loads it on a worker thread.
+
+    Records are held by the node until they have been loaded.
+    """
+
+    def __init__(self, upstream: Node, queue: LoaderQueue, *, stream_name: Optional[str] = None) -> None:
+        self.queue = queue
+        self.func = queue.loader
+        super().__init__(upstream, stream_name=stream_name)
+
+    @property
+    def stats(self):
+        return self.queue.stats
+
+    @stats.setter
+    def stats(self, stats) -> None:
+        self.queue.stats = stats
+
+    @property
+    def exception(self) -> Optional[BaseException]:
+        return self.queue.exception
+
+    @property
+    def details(self) -> Callable[[], dict[str, Any]]:
+        return self.queue.details
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def flush(self) -> None:
+        """Wait until every queued record has been loaded."""
+        self.queue.join()
+
+    def _compile(self) -> Callable[[Any], None]:
+        queue = self.queue
+        hold = self.source._hold
+        release = functools.partial(self.source._notify, 1)
+
+        def run(x):
+            if queue.exception is not None:
+                raise queue.exception
+            hold(1)
+            queue.submit(x, release)
+
+        return run
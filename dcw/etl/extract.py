@@ -1,8 +1,25 @@
+import collections
+import fnmatch
+import functools
+import itertools
 import json
 import logging
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Any, Callable, Iterator, Protocol
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, Literal, Optional, Protocol, Sequence
 
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
@@ -15,27 +32,342 @@ class Extractor(Protocol):
         raise NotImplementedError("Extractor must implement iter_records()")
 
 
+class AsyncExtractor(Protocol):
+    """Protocol for a data extractor that produces records asynchronously.
+
+    Implement `__aiter__` as an async generator to produce records from network-bound sources without blocking the
+    event loop. Async extractors can be used with `dcw.etl.aio.AsyncProcessingPipeline`, and with
+    `dcw.etl.pipeline.run_pipeline`, which detects them.
+
+    Examples:
+        >>> import asyncio
+        >>> class NumberExtractor(AsyncExtractor):
+        ...     async def __aiter__(self):
+        ...         for i in range(3):
+        ...             await asyncio.sleep(0)
+        ...             yield i
+        >>> async def collect(extractor):
+        ...     return [record async for record in extractor]
+        >>> asyncio.run(collect(NumberExtractor()))
+        [0, 1, 2]
+    """
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        """Iterate over records asynchronously."""
+        raise NotImplementedError("AsyncExtractor must implement __aiter__()")
+
+
+def is_async_extractor(extractor: Any) -> bool:
+    """Check if an extractor produces records asynchronously (i.e. it implements `__aiter__`)."""
+    return hasattr(extractor, "__aiter__")
+
+
+class ResumableExtractor(Extractor, Protocol):
+    """Protocol for an extractor that can resume from a position, see `dcw.etl.checkpoint`.
+
+    Examples:
+        >>> extractor = RecordExtractor("abcd")
+        >>> list(extractor.iter_positions())
+        [(0, 'a'), (1, 'b'), (2, 'c'), (3, 'd')]
+        >>> list(extractor.iter_positions(1))
+        [(2, 'c'), (3, 'd')]
+    """
+
+    def iter_positions(self, start: Optional[Any] = None) -> Iterator[tuple[Any, Any]]:
+        """Iterate over (position, record) tuples.
+
+        Arguments:
+            start (Optional[Any]): A position previously yielded by this method. Iteration starts with the record after
+                it. If None, iteration starts from the beginning.
+
+        Yields:
+            tuple[Any, Any]: The position of the record, which must be JSON serializable, and the record.
+        """
+        raise NotImplementedError("ResumableExtractor must implement iter_positions()")
+
+
+def is_resumable_extractor(extractor: Any) -> bool:
+    """Check if an extractor can resume from a position (i.e. it implements `iter_positions`)."""
+    return hasattr(extractor, "iter_positions")
+
+
+class SplittableExtractor(Extractor, Protocol):
+    """Protocol for an extractor whose records can be read in independent parts, or splits, see `ParallelExtractor`.
+
+    Reading every split returned by `splits`, in order, yields the same records as `iter_records`. Splits must be
+    picklable, so that they can be read in other processes.
+
+    Examples:
+        >>> extractor = RecordExtractor("abcde", split_size=2)
+        >>> extractor.splits()
+        [range(0, 2), range(2, 4), range(4, 5)]
+        >>> list(extractor.iter_split(range(2, 4)))
+        ['c', 'd']
+    """
+
+    def splits(self) -> list[Any]:
+        """Get the splits of the extractor, such as files, directories or ranges of indexes."""
+        raise NotImplementedError("SplittableExtractor must implement splits()")
+
+    def iter_split(self, split: Any) -> Iterator[Any]:
+        """Iterate over the records of one split."""
+        raise NotImplementedError("SplittableExtractor must implement iter_split()")
+
+
+def is_splittable_extractor(extractor: Any) -> bool:
+    """Check if an extractor can be read in splits (i.e. it implements `splits` and `iter_split`)."""
+    return hasattr(extractor, "splits") and hasattr(extractor, "iter_split")
+
+
+def _iter_indexed(records: Iterator[Any], start: Optional[int]) -> Iterator[tuple[int, Any]]:
+    """Pair records with their index, skipping those up to and including index `start`."""
+    first = 0 if start is None else start + 1
+    return zip(itertools.count(first), itertools.islice(records, first, None))
+
+
 class RecordExtractor(Extractor):
-    """A simple extractor that iterates over an object and yields each item as a record."""
+    """A simple extractor that iterates over an object and yields each item as a record.
+
+    It is resumable: the position of a record is its index. It is splittable into ranges of `split_size` indexes if
+    the object is a sequence (it supports `len` and indexing), and otherwise into a single split.
+    """
 
-    def __init__(self, data):
+    def __init__(self, data, *, split_size: int = 10_000):
         self.data = data
+        self.split_size = split_size
 
     def iter_records(self):
         for item in self.data:
             yield item
 
+    def iter_positions(self, start: Optional[int] = None) -> Iterator[tuple[int, Any]]:
+        return _iter_indexed(iter(self.data), start)
+
+    def splits(self) -> list[Optional[range]]:
+        if not isinstance(self.data, Sequence):
+            return [None]
+        return [range(start, min(start + self.split_size, len(self.data)))
+                for start in range(0, len(self.data), self.split_size)]
+
+    def iter_split(self, split: Optional[range]) -> Iterator[Any]:
+        if split is None:
+            return self.iter_records()
+        return (self.data[index] for index in split)
+
+
+class _Failure:
+    """An exception raised on a background thread, passed to the thread reading the records."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# marks the end of the records of a split, an extractor or a walk in a queue
+_DONE = object()
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Put an item in a bounded queue, unless `stop` is set while waiting for room. Returns whether it was put."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class _WorkStealingQueue:
+    """The directories left to scan by a parallel walk, in one deque per worker.
+
+    A worker pushes the subdirectories it finds onto its own deque and takes the most recent one back, so that it walks
+    its part of the tree depth first. A worker whose deque is empty steals the oldest directory of another, which is
+    the closest to the root and so likely the largest part of the tree left. The walk is over once no directory is
+    queued or being scanned.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self._deques = [collections.deque() for _ in range(workers)]
+        self._cv = threading.Condition()
+        self._pending = 0
+        self._closed = False
+
+    def put(self, worker: int, item: Any) -> None:
+        with self._cv:
+            self._deques[worker].append(item)
+            self._pending += 1
+            self._cv.notify()
+
+    def get(self, worker: int) -> Optional[Any]:
+        """Take a directory to scan, waiting for one if others are still being scanned. Returns None once the walk is
+        over."""
+        with self._cv:
+            while not self._closed:
+                if self._deques[worker]:
+                    return self._deques[worker].pop()
+                for other in self._deques:
+                    if other:
+                        return other.popleft()
+                if self._pending == 0:
+                    return None
+                self._cv.wait()
+            return None
+
+    def take(self, item: Any) -> bool:
+        """Take a particular directory out of the queue, unless a worker has already taken it. Returns whether it was
+        taken, in which case it must be marked done with `task_done` like one returned by `get`."""
+        with self._cv:
+            for items in self._deques:
+                if item in items:
+                    items.remove(item)
+                    return True
+            return False
+
+    def task_done(self) -> None:
+        """Mark a directory taken by `get` or `take` as scanned, after its subdirectories have been put."""
+        with self._cv:
+            self._pending -= 1
+            if self._pending == 0:
+                self._cv.notify_all()
+
+    def close(self) -> None:
+        """End the walk early."""
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+
+def _walk_parallel(root: Path, scan: Callable[[Path], tuple[list[Path], list[Path]]], *, threads: int,
+                   ordered: bool, buffer_size: Optional[int] = None) -> Iterator[Path]:
+    """Walk a directory tree on `threads` threads, yielding the paths returned by `scan` for each directory.
+
+    `scan` lists one directory, returning the paths to yield and the subdirectories to walk. If `ordered`, paths are
+    yielded in the order of a depth-first walk with the paths and subdirectories of each directory sorted. Otherwise,
+    they are yielded as soon as they are found.
+
+    At most `buffer_size` directories (default: `4 * threads`) are held once scanned, until their paths are yielded.
+    When an ordered walk's buffer is full, the workers wait, and the directory whose paths are due next is scanned by
+    the thread reading the paths if no worker has taken it.
+    """
+    buffer_size = buffer_size or 4 * threads
+    directories = _WorkStealingQueue(threads)
+    stop = threading.Event()
+    # unordered: a bounded queue of the paths found in each directory; ordered: the results of each directory, by path
+    found = queue.Queue(buffer_size)
+    results: dict[Path, Any] = {}
+    results_cv = threading.Condition()
+    running = [threads]
+    # ordered: the directory whose results are yielded next, which is delivered even when the buffer is full
+    awaited = [root]
+
+    def deliver(directory, result):
+        if ordered:
+            with results_cv:
+                if isinstance(result, _Failure):
+                    # a failure ends the walk, so it is delivered in place of whichever directory is awaited
+                    directory = None
+                else:
+                    results_cv.wait_for(lambda: (len(results) < buffer_size or directory == awaited[0]
+                                                 or stop.is_set()))
+                    if stop.is_set():
+                        return False
+                results[directory] = result
+                results_cv.notify_all()
+            return True
+        return _put(found, result, stop)
+
+    def await_result(directory):
+        with results_cv:
+            awaited[0] = directory
+            results_cv.notify_all()
+            while directory not in results and None not in results:
+                if len(results) >= buffer_size and directories.take(directory):
+                    break
+                results_cv.wait()
+            else:
+                return results.pop(directory, None) or results[None]
+
+        # every worker is waiting for room in the buffer, and none of them has taken the directory, so scan it here
+        paths, subdirs = scan(directory)
+        paths, subdirs = sorted(paths), sorted(subdirs)
+        for subdir in reversed(subdirs):
+            directories.put(0, subdir)
+        directories.task_done()
+        return paths, subdirs
+
+    def work(worker):
+        try:
+            while (directory := directories.get(worker)) is not None:
+                try:
+                    paths, subdirs = scan(directory)
+                except Exception as e:
+                    deliver(directory, _Failure(e))
+                    directories.close()
+                    return
+                if ordered:
+                    paths, subdirs = sorted(paths), sorted(subdirs)
+                # pushed deepest first, so that the worker takes them back in order
+                for subdir in reversed(subdirs):
+                    directories.put(worker, subdir)
+                directories.task_done()
+                if not deliver(directory, (paths, subdirs)):
+                    return
+        finally:
+            with results_cv:
+                running[0] -= 1
+                last = running[0] == 0
+            if last and not ordered:
+                _put(found, _DONE, stop)
+
+    directories.put(0, root)
+    workers = [threading.Thread(target=work, args=(i,), name=f"walker-{i}", daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        if ordered:
+            todo = [root]
+            while todo:
+                result = await_result(todo.pop())
+                if isinstance(result, _Failure):
+                    raise result.error
+                paths, subdirs = result
+                yield from paths
+                todo.extend(reversed(subdirs))
+        else:
+            while (result := found.get()) is not _DONE:
+                if isinstance(result, _Failure):
+                    raise result.error
+                yield from result[0]
+    finally:
+        stop.set()
+        directories.close()
+        with results_cv:
+            results_cv.notify_all()
+        for worker in workers:
+            worker.join()
+
 
 class FileWalkExtractor(Extractor):
     """An extractor that walks a directory and yields each `pathlib.Path` as a record.
 
+    It is resumable: the position of a path is its index in the walk, so resuming assumes that the directory has not
+    changed in the meantime.
+
+    A recursive walk can list directories on several `threads`, which helps most on network filesystems, where every
+    listing and `stat` waits on a round trip. Paths are then yielded as soon as they are found, in no particular order,
+    unless `ordered` is set, in which case they are yielded depth first, sorted within each directory. Symbolic links
+    to directories are not walked, as with `pathlib.Path.rglob`.
+
     Attributes:
         path (pathlib.Path): The path to walk.
         recursive (bool): Whether to walk recursively.
         glob (str): The glob pattern to match.
+        threads (int): Number of threads listing directories in a recursive walk.
+        ordered (bool): Whether a walk on several threads yields paths in a deterministic order.
     """
 
-    def __init__(self, path: str | Path, *, recursive: bool = False, glob: str = "*", files_only: bool = True):
+    def __init__(self, path: str | Path, *, recursive: bool = False, glob: str = "*", files_only: bool = True,
+                 threads: int = 1, ordered: bool = False):
         """Initialize the extractor.
 
         Arguments:
@@ -43,34 +375,324 @@ class FileWalkExtractor(Extractor):
             recursive (bool): Whether to walk recursively.
             glob (str): The glob pattern to match.
             files_only (bool): If True, only extract/yield files (avoid directories).
+            threads (int): Number of threads listing directories in a recursive walk.
+            ordered (bool): If True, a walk on several threads yields paths depth first, sorted within each directory.
         """
+        if threads < 1:
+            raise ValueError(f"threads must be at least 1, got {threads}")
+        if threads > 1 and "**" in glob:
+            raise ValueError(f"A walk on several threads cannot match a recursive glob pattern, got {glob!r}")
         self.path = Path(path)
         self.recursive = recursive
         self.glob = glob
         self.files_only = files_only
+        self.threads = threads
+        self.ordered = ordered
 
     def iter_records(self) -> Iterator[Path]:
         """Iterate over the files in the path."""
+        if self.recursive and self.threads > 1:
+            yield from _walk_parallel(self.path, self._scan, threads=self.threads, ordered=self.ordered)
+            return
         for path in self.path.rglob(self.glob) if self.recursive else self.path.glob(self.glob):
             if self.files_only and path.is_dir():
                 continue
             yield path
 
+    def _scan(self, directory: Path) -> tuple[list[Path], list[Path]]:
+        """List one directory for a parallel walk: the paths in it that match, and its subdirectories.
+
+        A recursive walk matches the glob pattern in every directory, so a pattern made up of a name alone is matched
+        against the entries listed, and any other pattern is left to `pathlib.Path.glob`.
+        """
+        by_name = os.sep not in self.glob and (os.altsep is None or os.altsep not in self.glob)
+        paths = []
+        subdirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                is_dir = entry.is_dir()
+                if is_dir and not entry.is_symlink():
+                    subdirs.append(Path(entry.path))
+                if by_name and fnmatch.fnmatch(entry.name, self.glob) and not (self.files_only and is_dir):
+                    paths.append(Path(entry.path))
+        if not by_name:
+            paths = list(self.iter_split(directory))
+        return paths, subdirs
+
+    def iter_positions(self, start: Optional[int] = None) -> Iterator[tuple[int, Path]]:
+        if self.recursive and self.threads > 1 and not self.ordered:
+            raise ValueError("Resuming a walk on several threads requires it to be ordered")
+        return _iter_indexed(self.iter_records(), start)
+
+    def splits(self) -> list[Path]:
+        """Get the directories to walk: the path and, if recursive, each directory below it.
+
+        The paths in a directory are only listed when its split is read, so listing large directories can be spread
+        across threads. Reading every split yields the same paths as `iter_records`, though not in the same order.
+        """
+        if not self.recursive:
+            return [self.path]
+        # symbolic links to directories are not walked by `iter_records`, so they are not splits either
+        return [self.path, *(path for path in self.path.rglob("*") if path.is_dir() and not path.is_symlink())]
+
+    def iter_split(self, split: Path) -> Iterator[Path]:
+        """Iterate over the paths in one directory, not recursively."""
+        for path in split.glob(self.glob):
+            if self.files_only and path.is_dir():
+                continue
+            yield path
+
+
+class FileManifest:
+    """A SQLite database of the files and directories seen by an `IncrementalFileWalkExtractor`, with the size and
+    modification time of each. Several walks can share one database under different names.
+
+    Changes are made in a transaction that is only committed by `commit`, so that a walk that fails part of the way
+    through leaves the manifest as it was.
+
+    Attributes:
+        path (pathlib.Path): The database file.
+        name (str): The name of the walk within the database.
+    """
+
+    def __init__(self, path: str | Path, *, name: str = "default") -> None:
+        self.path = Path(path)
+        self.name = name
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS directories (name TEXT, path TEXT, parent TEXT, "
+                               "mtime INTEGER, PRIMARY KEY (name, path))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS directories_parent ON directories (name, parent)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files (name TEXT, path TEXT, directory TEXT, "
+                               "size INTEGER, mtime INTEGER, PRIMARY KEY (name, path))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (name, directory)")
+
+    def directory(self, path: str) -> Optional[tuple[int, list[str]]]:
+        """Get the modification time (in nanoseconds) and the subdirectories of a directory, or None if it has not
+        been seen."""
+        with self._lock:
+            row = self._conn.execute("SELECT mtime FROM directories WHERE name = ? AND path = ?",
+                                     (self.name, path)).fetchone()
+            if row is None:
+                return None
+            subdirs = self._conn.execute("SELECT path FROM directories WHERE name = ? AND parent = ?",
+                                         (self.name, path)).fetchall()
+        return row[0], [subdir for subdir, in subdirs]
+
+    def files(self, directory: str) -> dict[str, tuple[int, int]]:
+        """Get the size and modification time (in nanoseconds) of each file seen in a directory, by path."""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, size, mtime FROM files WHERE name = ? AND directory = ?",
+                                      (self.name, directory)).fetchall()
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def record(self, directory: str, parent: Optional[str], mtime: int, subdirs: list[str],
+               files: list[tuple[str, int, int]]) -> None:
+        """Replace what is known about a directory with the result of scanning it.
+
+        Subdirectories that are no longer there are removed, along with everything below them.
+
+        Arguments:
+            directory (str): The directory.
+            parent (Optional[str]): Its parent, or None if it is the root of the walk.
+            mtime (int): Its modification time, in nanoseconds.
+            subdirs (list[str]): The paths of its subdirectories.
+            files (list[tuple[str, int, int]]): The path, size and modification time of each of its files.
+        """
+        with self._lock:
+            known = self._conn.execute("SELECT path FROM directories WHERE name = ? AND parent = ?",
+                                       (self.name, directory)).fetchall()
+            for removed in {subdir for subdir, in known} - set(subdirs):
+                below = removed.rstrip(os.sep) + os.sep
+                self._conn.execute("DELETE FROM directories WHERE name = ? AND (path = ? OR substr(path, 1, ?) = ?)",
+                                   (self.name, removed, len(below), below))
+                self._conn.execute("DELETE FROM files WHERE name = ? AND "
+                                   "(directory = ? OR substr(directory, 1, ?) = ?)",
+                                   (self.name, removed, len(below), below))
+            self._conn.execute("INSERT OR REPLACE INTO directories (name, path, parent, mtime) VALUES (?, ?, ?, ?)",
+                               (self.name, directory, parent, mtime))
+            self._conn.execute("DELETE FROM files WHERE name = ? AND directory = ?", (self.name, directory))
+            self._conn.executemany("INSERT INTO files (name, path, directory, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                                   ((self.name, path, directory, size, mtime) for path, size, mtime in files))
+
+    def commit(self) -> None:
+        """Save the changes made since the last commit."""
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        """Discard the changes made since the last commit."""
+        with self._lock:
+            self._conn.rollback()
+
+    def __len__(self) -> int:
+        """Get the number of files in the manifest."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files WHERE name = ?", (self.name,)).fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database, discarding any changes that were not committed."""
+        with self._lock:
+            self._conn.close()
+
+
+class IncrementalFileWalkExtractor(Extractor):
+    """An extractor that walks a directory and yields only the files that are new or have changed since the last walk.
+
+    The size and modification time of every file are kept in a `FileManifest`. The walk uses `os.scandir`, which tells
+    files and directories apart without a `stat` call on most platforms, and only calls `stat` on the files that match
+    the glob pattern and on directories. Files are matched by name, so the glob pattern cannot contain a separator, and
+    symbolic links to directories are not followed.
+
+    With `prune` set, a directory whose modification time has not changed is not listed again: only its subdirectories
+    are checked. A directory's modification time changes when files are added to, removed from or renamed within it,
+    but not when a file in it is modified in place, so pruning suits directories whose files are written once.
+
+    By default, the manifest is committed once the walk has finished. Records extracted near the end of the walk may
+    still be being processed at that point, so for a pipeline that must not skip files after a crash, set
+    `auto_commit=False` and call `commit` once `ProcessingPipeline.extract` has returned.
+
+    Examples:
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as tmpdir:
+        ...     manifest = FileManifest(Path(tmpdir) / "manifest.db")
+        ...     data = Path(tmpdir) / "data"
+        ...     data.mkdir()
+        ...     _ = (data / "a.txt").write_text("a")
+        ...     extractor = IncrementalFileWalkExtractor(data, manifest, glob="*.txt")
+        ...     first = [path.name for path in extractor.iter_records()]
+        ...     _ = (data / "b.txt").write_text("b")
+        ...     second = [path.name for path in extractor.iter_records()]
+        ...     manifest.close()
+        >>> first, second
+        (['a.txt'], ['b.txt'])
+
+    Attributes:
+        path (pathlib.Path): The path to walk.
+        manifest (FileManifest): The files seen by previous walks.
+        recursive (bool): Whether to walk recursively.
+        glob (str): The glob pattern that file names must match.
+        prune (bool): Whether to skip listing directories whose modification time has not changed.
+        auto_commit (bool): Whether to commit the manifest once the walk has finished.
+    """
+
+    def __init__(self, path: str | Path, manifest: FileManifest, *, recursive: bool = False, glob: str = "*",
+                 prune: bool = False, auto_commit: bool = True):
+        if os.sep in glob or (os.altsep is not None and os.altsep in glob):
+            raise ValueError(f"glob must match file names, got {glob!r}")
+        self.path = Path(path)
+        self.manifest = manifest
+        self.recursive = recursive
+        self.glob = glob
+        self.prune = prune
+        self.auto_commit = auto_commit
+
+    def iter_records(self) -> Iterator[Path]:
+        """Iterate over the files that are new or have changed since the last walk."""
+        try:
+            yield from self._walk()
+        except BaseException:
+            self.manifest.rollback()
+            raise
+        if self.auto_commit:
+            self.manifest.commit()
+
+    def commit(self) -> None:
+        """Save the files seen by the last walk to the manifest, see `auto_commit`."""
+        self.manifest.commit()
+
+    def _walk(self) -> Iterator[Path]:
+        root = str(self.path)
+        stack = [(root, None, os.stat(root).st_mtime_ns)]
+        while stack:
+            directory, parent, mtime = stack.pop()
+            known = self.manifest.directory(directory)
+
+            if self.prune and known is not None and known[0] == mtime:
+                if self.recursive:
+                    for subdir in known[1]:
+                        stack.append((subdir, directory, os.stat(subdir).st_mtime_ns))
+                continue
+
+            seen = self.manifest.files(directory)
+            subdirs = []
+            files = []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        if self.recursive:
+                            stack.append((entry.path, directory, entry.stat(follow_symlinks=False).st_mtime_ns))
+                    elif fnmatch.fnmatchcase(entry.name, self.glob) and entry.is_file():
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+                        if seen.get(entry.path) != (stat.st_size, stat.st_mtime_ns):
+                            yield Path(entry.path)
+
+            # without recursion, the subdirectories are not walked, so they are not recorded either
+            self.manifest.record(directory, parent, mtime, subdirs if self.recursive else [], files)
+
+
+def _load_json(path: Path, fast: bool) -> Any:
+    """Read a JSON file whole, as bytes, and parse it, with `orjson` if `fast`.
+
+    `orjson` rejects some documents that `json` accepts, such as NaN, so a document it cannot parse is parsed again
+    with `json`, which raises if the document really is invalid.
+    """
+    data = path.read_bytes()
+    if fast:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
 
 class JsonFileExtractor(Extractor):
-    """An extractor that walks a directory and yields each JSON file as a (path, data) tuple."""
+    """An extractor that walks a directory and yields each JSON file as a (path, data) tuple.
+
+    It is resumable in the same way as `FileWalkExtractor`. Files before the resume position are not read. It is
+    splittable by file.
+
+    Each file is read whole and parsed with `json`, or with `orjson` if the "orjson" backend is chosen (`pip install
+    dcw[json]`). `orjson` is several times faster, but parses integers beyond 64 bits as floats, losing precision, so
+    it is only used when asked for.
+
+    Files can be read and parsed by several `workers`: threads by default, which overlap waiting on I/O, or processes,
+    which also parse in parallel and suit large files. Records are yielded in the same order as with a single worker
+    unless `ordered` is False, in which case they are yielded as soon as they are parsed, and the extractor cannot be
+    resumed. Either way, `on_error` is called on the thread iterating over the records.
+    """
 
     def __init__(self, file_or_dir_path: str | Path, *, glob="*.json",
-                 on_error: Callable[[Path, Exception], None] | None = None):
+                 on_error: Callable[[Path, Exception], None] | None = None, workers: int = 1, processes: bool = False,
+                 ordered: bool = True, backend: Literal["json", "orjson"] = "json"):
         """Create the extractor.
 
         Arguments:
             file_or_dir_path (str | pathlib.Path): The path to walk.
             glob (str): The glob pattern to match.
-            on_error (Callable[[Path, Exception], None] | None): A callback to invoke when an error occurs."""
+            on_error (Callable[[Path, Exception], None] | None): A callback to invoke when an error occurs.
+            workers (int): Number of threads, or processes, reading and parsing files.
+            processes (bool): If True, read and parse files in worker processes rather than threads.
+            ordered (bool): If False, yield files as soon as they are parsed rather than in the order of the walk.
+            backend (str): The JSON parser: "json" or "orjson"."""
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        if backend not in ("json", "orjson"):
+            raise ValueError(f"Unknown JSON backend {backend}")
+        if backend == "orjson" and orjson is None:
+            raise ValueError("The orjson backend requires orjson to be installed")
         self.path = Path(file_or_dir_path)
         self.glob = glob
         self.on_error = on_error
+        self.workers = workers
+        self.processes = processes
+        self.ordered = ordered
+        self.backend = backend
 
     def iter_records(self) -> Iterator[tuple[Path, Any]]:
         """Iterate over the files in the path and yield each file as a (path, data) tuple.
@@ -81,13 +703,441 @@ class JsonFileExtractor(Extractor):
         Yields:
             tuple[pathlib.Path, Any]: A tuple containing the path to the file and the JSON data parsed from the file.
         """
-        extractor = FileWalkExtractor(self.path, files_only=True, glob=self.glob, recursive=True)
-        for path in extractor.iter_records():
+        for _, record in self._iter_positions():
+            yield record
+
+    def iter_positions(self, start: Optional[int] = None) -> Iterator[tuple[int, tuple[Path, Any]]]:
+        if self.workers > 1 and not self.ordered:
+            raise ValueError("Resuming requires the files to be read in order")
+        return self._iter_positions(start)
+
+    @property
+    def _fast(self) -> bool:
+        return self.backend == "orjson"
+
+    def _iter_positions(self, start: Optional[int] = None) -> Iterator[tuple[int, tuple[Path, Any]]]:
+        paths = FileWalkExtractor(self.path, files_only=True, glob=self.glob, recursive=True).iter_positions(start)
+        if self.workers == 1:
+            for position, path in paths:
+                for record in self.iter_split(path):
+                    yield position, record
+            return
+
+        pool = _new_process_pool(self.workers) if self.processes else ThreadPoolExecutor(self.workers, "json")
+        with pool:
+            tasks = (((position, path), functools.partial(_load_json, path, self._fast))
+                     for position, path in paths)
+            for (position, path), future in _iter_submitted(pool, tasks, ahead=4 * self.workers, ordered=self.ordered):
+                for record in self._parsed(path, future.result):
+                    yield position, record
+
+    def splits(self) -> list[Path]:
+        """Get the JSON files to read."""
+        return list(FileWalkExtractor(self.path, files_only=True, glob=self.glob, recursive=True).iter_records())
+
+    def iter_split(self, split: Path) -> Iterator[tuple[Path, Any]]:
+        """Read one JSON file, yielding it as a (path, data) tuple unless it cannot be parsed."""
+        return self._parsed(split, functools.partial(_load_json, split, self._fast))
+
+    def _parsed(self, path: Path, load: Callable[[], Any]) -> Iterator[tuple[Path, Any]]:
+        """Yield a file as a (path, data) tuple, with the data returned by `load`, or pass the error to `on_error`."""
+        try:
+            data = load()
+        except Exception as e:
+            if self.on_error is None:
+                raise
+            self.on_error(path, e)
+        else:
+            yield path, data
+
+
+class ArrowDatasetExtractor(Extractor):
+    """An extractor that reads a file or directory of files and yields each `pyarrow.RecordBatch` as a record.
+
+    Yielding batches rather than rows keeps the data in columnar form from end to end: transformations can operate on
+    whole batches with `pyarrow.compute` (see `dcw.etl.transform.ArrowComputeTransformation`), and loaders such as
+    `dcw.etl.load.ParquetLoader` can write the batches directly, without converting each row to Python objects.
+
+    Examples:
+        >>> import tempfile
+        >>> import pyarrow.parquet as pq
+        >>> with tempfile.TemporaryDirectory() as tmpdir:
+        ...     pq.write_table(pa.table({"x": [1, 2, 3]}), f"{tmpdir}/data.parquet")
+        ...     [batch.to_pydict() for batch in ArrowDatasetExtractor(tmpdir, batch_size=2).iter_records()]
+        [{'x': [1, 2]}, {'x': [3]}]
+
+    Attributes:
+        path (pathlib.Path): The file or directory to read.
+        format (str): The file format, as understood by `pyarrow.dataset`.
+        batch_size (int): The maximum number of rows per batch.
+        columns (Optional[list[str]]): The columns to read, or None for all columns.
+        filter (Optional[pyarrow.compute.Expression]): Only rows matching this expression are read.
+    """
+
+    def __init__(self, path: str | Path, *, format: str = "parquet", batch_size: int = 65_536,
+                 columns: Optional[list[str]] = None, filter: Optional[Any] = None):
+        """Create the extractor.
+
+        Arguments:
+            path (str | pathlib.Path): The file or directory to read.
+            format (str): The file format, as understood by `pyarrow.dataset` ("parquet", "csv", "ipc", ...).
+            batch_size (int): The maximum number of rows per batch.
+            columns (Optional[list[str]]): The columns to read, or None for all columns.
+            filter (Optional[pyarrow.compute.Expression]): Only rows matching this expression are read.
+        """
+        self.path = Path(path)
+        self.format = format
+        self.batch_size = batch_size
+        self.columns = columns
+        self.filter = filter
+
+    def iter_records(self) -> Iterator[pa.RecordBatch]:
+        """Iterate over the record batches in the dataset."""
+        dataset = ds.dataset(self.path, format=self.format)
+        for batch in dataset.to_batches(columns=self.columns, filter=self.filter, batch_size=self.batch_size):
+            if batch.num_rows > 0:
+                yield batch
+
+    def iter_positions(self, start: Optional[list[int]] = None) -> Iterator[tuple[list[int], pa.RecordBatch]]:
+        """Iterate over the record batches in the dataset, one file at a time.
+
+        The position of a batch is `[file index, batch index]`. When resuming, files before the position are skipped
+        without being read.
+        """
+        start_file, start_batch = start if start is not None else (0, None)
+        dataset = ds.dataset(self.path, format=self.format)
+        for file_index, fragment in enumerate(dataset.get_fragments()):
+            if file_index < start_file:
+                continue
+            batches = fragment.to_batches(schema=dataset.schema, columns=self.columns, filter=self.filter,
+                                          batch_size=self.batch_size)
+            for batch_index, batch in _iter_indexed(batches, start_batch if file_index == start_file else None):
+                if batch.num_rows > 0:
+                    yield [file_index, batch_index], batch
+
+
+class ShardedExtractor(Extractor):
+    """Take one shard of the records of another extractor: every `count`th record, starting with record `index`.
+
+    Running `count` pipelines, each with a different `index`, processes every record exactly once (see
+    `dcw.etl.pipeline.run_pipeline`). Each shard still iterates over all of the records of the extractor, so this
+    divides the work of processing the records, not that of extracting them. Use `shard_extractor` to create one,
+    which divides the splits of a splittable extractor instead, see `SplitShardedExtractor`.
+
+    Examples:
+        >>> [list(shard_extractor(RecordExtractor(range(7)), i, 3).iter_records()) for i in range(3)]
+        [[0, 3, 6], [1, 4], [2, 5]]
+
+    Attributes:
+        extractor (Extractor): The extractor being sharded.
+        index (int): The index of this shard.
+        count (int): The number of shards.
+    """
+
+    def __init__(self, extractor: Extractor, index: int, count: int):
+        if not 0 <= index < count:
+            raise ValueError(f"index must be in [0, {count}), got {index}")
+        self.extractor = extractor
+        self.index = index
+        self.count = count
+
+    def iter_records(self) -> Iterator[Any]:
+        return itertools.islice(self.extractor.iter_records(), self.index, None, self.count)
+
+
+class ResumableShardedExtractor(ShardedExtractor):
+    """A `ShardedExtractor` of a resumable extractor, which is itself resumable.
+
+    The position of a record is `[position in the extractor, index of the record in the extractor]`, so resuming
+    relies on the extractor yielding the same records in the same order.
+    """
+
+    def iter_positions(self, start: Optional[list] = None) -> Iterator[tuple[list, Any]]:
+        inner_start, first = (None, 0) if start is None else (start[0], start[1] + 1)
+        for ordinal, (position, record) in enumerate(self.extractor.iter_positions(inner_start), first):
+            if ordinal % self.count == self.index:
+                yield [position, ordinal], record
+
+
+class SplitShardedExtractor(ShardedExtractor):
+    """Take one shard of the splits of a splittable extractor: every `count`th split, starting with split `index`.
+
+    Unlike `ShardedExtractor`, each shard only reads its own splits, so the work of extracting the records is divided
+    as well. The shard is itself splittable, into the splits it reads.
+
+    Examples:
+        >>> extractor = RecordExtractor(range(7), split_size=2)
+        >>> [list(shard_extractor(extractor, i, 2).iter_records()) for i in range(2)]
+        [[0, 1, 4, 5], [2, 3, 6]]
+
+    Attributes:
+        extractor (SplittableExtractor): The extractor being sharded.
+        index (int): The index of this shard.
+        count (int): The number of shards.
+    """
+
+    def __init__(self, extractor: SplittableExtractor, index: int, count: int, splits: Optional[list[Any]] = None):
+        """Create the shard.
+
+        Arguments:
+            extractor (SplittableExtractor): The extractor being sharded.
+            index (int): The index of this shard.
+            count (int): The number of shards.
+            splits (Optional[list]): All of the splits of the extractor, if they have already been listed.
+        """
+        super().__init__(extractor, index, count)
+        self._splits = (extractor.splits() if splits is None else splits)[index::count]
+
+    def splits(self) -> list[Any]:
+        return self._splits
+
+    def iter_split(self, split: Any) -> Iterator[Any]:
+        return self.extractor.iter_split(split)
+
+    def iter_records(self) -> Iterator[Any]:
+        for split in self._splits:
+            yield from self.extractor.iter_split(split)
+
+
+class ResumableSplitShardedExtractor(SplitShardedExtractor):
+    """A `SplitShardedExtractor` of a resumable extractor, which is itself resumable.
+
+    The position of a record is `[index of the split in the shard, index of the record in the split]`, so resuming
+    relies on the extractor returning the same splits, and yielding the same records in each.
+    """
+
+    def iter_positions(self, start: Optional[list] = None) -> Iterator[tuple[list, Any]]:
+        first_split, first_record = (0, None) if start is None else start
+        for split_index, split in enumerate(self._splits[first_split:], first_split):
+            records = self.extractor.iter_split(split)
+            for record_index, record in _iter_indexed(records, first_record if split_index == first_split else None):
+                yield [split_index, record_index], record
+
+
+def shard_extractor(extractor: Extractor, index: int, count: int) -> ShardedExtractor:
+    """Take shard `index` of `count` of the records of an extractor.
+
+    If the extractor is splittable into at least `count` splits, each shard reads its share of the splits (see
+    `SplitShardedExtractor`). Otherwise each shard reads every record and keeps its share (see `ShardedExtractor`).
+    The shard is resumable if the extractor is.
+    """
+    if is_async_extractor(extractor):
+        raise ValueError("Async extractors cannot be sharded")
+    resumable = is_resumable_extractor(extractor)
+    if is_splittable_extractor(extractor):
+        splits = extractor.splits()
+        if len(splits) >= count:
+            cls = ResumableSplitShardedExtractor if resumable else SplitShardedExtractor
+            return cls(extractor, index, count, splits)
+    cls = ResumableShardedExtractor if resumable else ShardedExtractor
+    return cls(extractor, index, count)
+
+
+def _read_split(extractor: SplittableExtractor, split: Any) -> list[Any]:
+    """Read all of the records of a split, in a worker process."""
+    return list(extractor.iter_split(split))
+
+
+def _new_process_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn rather than fork, which can deadlock when the parent process runs threads
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _iter_submitted(executor: Executor, tasks: Iterable[tuple[Any, Callable[[], Any]]], *, ahead: int,
+                    ordered: bool) -> Iterator[tuple[Any, Future]]:
+    """Run tasks on an executor, with at most `ahead` submitted at a time, yielding each with its finished future.
+
+    Arguments:
+        executor (concurrent.futures.Executor): Runs the tasks.
+        tasks (Iterable[tuple[Any, Callable]]): Pairs of a tag, which is yielded with the future, and the function to
+            run. The function must be picklable if the executor runs it in another process.
+        ahead (int): The most tasks submitted but not yet yielded.
+        ordered (bool): Whether to yield the tasks in the order they were given, rather than as they finish.
+    """
+    tasks = iter(tasks)
+    pending: collections.deque[tuple[Any, Future]] = collections.deque()
+    try:
+        while True:
+            while len(pending) < ahead and (task := next(tasks, _DONE)) is not _DONE:
+                tag, func = task
+                pending.append((tag, executor.submit(func)))
+            if not pending:
+                return
+            if ordered:
+                yield pending.popleft()
+            else:
+                done = wait([future for _, future in pending], return_when=FIRST_COMPLETED).done
+                task = next(task for task in pending if task[1] in done)
+                pending.remove(task)
+                yield task
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+class ParallelExtractor(Extractor):
+    """Read the splits of a splittable extractor concurrently, and yield their records as a single extractor.
+
+    With threads, which suit extractors that wait on I/O, each worker reads one split at a time into a queue of at most
+    `buffer_size` records, so memory is bounded however large the splits are. With processes, which suit extractors
+    that are limited by CPU, such as parsing, each split is read whole in a worker process and sent back as a list, so
+    splits should be small enough to fit in memory; the extractor and its splits must be picklable.
+
+    Records are yielded as they are read, so records from different splits are interleaved, unless `ordered` is set,
+    in which case they are yielded in the order of `iter_records`, split by split. An error reading a split is raised
+    when the records are iterated over, and stops the workers.
+
+    Examples:
+        >>> extractor = ParallelExtractor(RecordExtractor(range(10), split_size=3), workers=2, ordered=True)
+        >>> list(extractor.iter_records())
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+    Attributes:
+        extractor (SplittableExtractor): The extractor to read.
+        workers (int): Number of threads or processes reading splits.
+        processes (bool): Whether to read splits in worker processes rather than threads.
+        ordered (bool): Whether to yield records in the order of the extractor.
+        buffer_size (int): With threads, the most records to hold per queue.
+    """
+
+    def __init__(self, extractor: SplittableExtractor, *, workers: int = 4, processes: bool = False,
+                 ordered: bool = False, buffer_size: int = 1000):
+        if not is_splittable_extractor(extractor):
+            raise ValueError(f"{type(extractor).__name__} is not splittable")
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        self.extractor = extractor
+        self.workers = workers
+        self.processes = processes
+        self.ordered = ordered
+        self.buffer_size = buffer_size
+
+    def iter_records(self) -> Iterator[Any]:
+        splits = self.extractor.splits()
+        if self.processes:
+            return self._iter_processes(splits)
+        return self._iter_threads(splits)
+
+    def _iter_threads(self, splits: list[Any]) -> Iterator[Any]:
+        if self.ordered:
+            # one queue per split, read in turn; workers start at most 2 * workers splits ahead of the reader
+            queues = [queue.Queue(self.buffer_size) for _ in splits]
+            ahead = threading.Semaphore(2 * self.workers)
+        else:
+            queues = [queue.Queue(self.buffer_size)] * len(splits)
+            ahead = threading.Semaphore(len(splits) or 1)
+        todo = iter(enumerate(splits))
+        todo_lock = threading.Lock()
+        stop = threading.Event()
+
+        def work():
+            while not stop.is_set():
+                if not ahead.acquire(timeout=0.1):
+                    continue
+                with todo_lock:
+                    index, split = next(todo, (None, None))
+                if index is None:
+                    return
+                try:
+                    for record in self.extractor.iter_split(split):
+                        if not _put(queues[index], record, stop):
+                            return
+                except Exception as e:
+                    _put(queues[index], _Failure(e), stop)
+                    return
+                _put(queues[index], _DONE, stop)
+
+        threads = [threading.Thread(target=work, name=f"split-reader-{i}", daemon=True)
+                   for i in range(min(self.workers, len(splits)))]
+        for thread in threads:
+            thread.start()
+        try:
+            done = 0
+            while done < len(splits):
+                item = queues[done].get()
+                if item is _DONE:
+                    done += 1
+                    if self.ordered:
+                        ahead.release()
+                elif isinstance(item, _Failure):
+                    raise item.error
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _iter_processes(self, splits: list[Any]) -> Iterator[Any]:
+        with _new_process_pool(self.workers) as executor:
+            tasks = ((split, functools.partial(_read_split, self.extractor, split)) for split in splits)
+            for _, future in _iter_submitted(executor, tasks, ahead=2 * self.workers, ordered=self.ordered):
+                yield from future.result()
+
+
+class PrefetchingExtractor(Extractor):
+    """Read the records of another extractor ahead of the pipeline, on background threads.
+
+    An extractor that waits on I/O, such as reading files, normally waits while the pipeline processes each record, and
+    the pipeline waits while it reads the next. Prefetching overlaps the two: a background thread iterates over the
+    extractor, putting up to `depth` records in a queue that `iter_records` takes them from, in the same order.
+
+    A single iteration cannot be shared between threads, so more than one thread requires a splittable extractor (see
+    `SplittableExtractor`), whose splits are then read concurrently, and yielded in order, by `ParallelExtractor`.
+
+    An exception raised by the extractor is raised by `iter_records`. If iteration stops early, for example because
+    the pipeline raised, the background threads stop too.
+
+    Examples:
+        >>> list(PrefetchingExtractor(RecordExtractor(range(5)), depth=2).iter_records())
+        [0, 1, 2, 3, 4]
+
+    Attributes:
+        extractor (Extractor): The extractor to read.
+        depth (int): The most records to read ahead, per thread.
+        threads (int): Number of threads reading the extractor.
+    """
+
+    def __init__(self, extractor: Extractor, *, depth: int = 1000, threads: int = 1):
+        if is_async_extractor(extractor):
+            raise ValueError("Async extractors cannot be prefetched")
+        if depth < 1:
+            raise ValueError(f"depth must be at least 1, got {depth}")
+        if threads < 1:
+            raise ValueError(f"threads must be at least 1, got {threads}")
+        if threads > 1 and not is_splittable_extractor(extractor):
+            raise ValueError(f"{type(extractor).__name__} is not splittable, so it can only be read by one thread")
+        self.extractor = extractor
+        self.depth = depth
+        self.threads = threads
+
+    def iter_records(self) -> Iterator[Any]:
+        if self.threads > 1:
+            parallel = ParallelExtractor(self.extractor, workers=self.threads, ordered=True, buffer_size=self.depth)
+            return parallel.iter_records()
+        return self._iter_prefetched()
+
+    def _iter_prefetched(self) -> Iterator[Any]:
+        records = queue.Queue(self.depth)
+        stop = threading.Event()
+
+        def work():
             try:
-                with path.open() as f:
-                    yield path, json.load(f)
+                for record in self.extractor.iter_records():
+                    if not _put(records, record, stop):
+                        return
             except Exception as e:
-                if self.on_error is not None:
-                    self.on_error(path, e)
-                else:
-                    raise
+                _put(records, _Failure(e), stop)
+                return
+            _put(records, _DONE, stop)
+
+        thread = threading.Thread(target=work, name="prefetch", daemon=True)
+        thread.start()
+        try:
+            while (item := records.get()) is not _DONE:
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
+            thread.join()
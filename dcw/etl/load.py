@@ -4,8 +4,13 @@ import gzip
 import json
 import logging
 import lzma
+import os
 import snappy
+import threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from pathlib import Path
 from typing import Any, Callable, Literal, Optional
 
@@ -28,6 +33,23 @@ class Loader(abc.ABC):
         return self.load(*args, **kwargs)
 
 
+class AsyncLoader(abc.ABC):
+    """Protocol for a data loader that stores processed data asynchronously.
+
+    Async loaders can be used with `dcw.etl.aio.AsyncProcessingPipeline`, which awaits `load()` and `flush()`.
+    """
+    @abc.abstractmethod
+    async def load(self, item: Any) -> None:
+        raise NotImplementedError("load() must be implemented by subclasses")
+
+    async def flush(self):
+        """Flush any buffered data."""
+        pass
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.load(*args, **kwargs)
+
+
 class ListLoader(Loader):
     """A loader that stores records in a list.
 
@@ -80,6 +102,22 @@ class JsonLinesLoader(Loader):
 
 class ParquetLoader(Loader):
     """A loader that appends records to Parquet files.
+
+    Records may be pandas DataFrames, or `pyarrow.RecordBatch` / `pyarrow.Table` objects (for example from
+    `dcw.etl.extract.ArrowDatasetExtractor`).
+
+    A DataFrame is appended by reading back the existing file and rewriting it. Arrow records are instead written
+    directly, as new row groups, through a `pyarrow.parquet.ParquetWriter` that is kept open for each output file until
+    `flush()` is called. Every Arrow record written to a file must have the same schema.
+
+    Files are never written in place: the new contents are written to a hidden temporary file next to the output file
+    (".<name>.tmp"), which then replaces it. For Arrow records that happens on `flush()`, so until then the output file
+    keeps its previous contents, and is left intact if the process dies before flushing.
+
+    Attributes:
+        path: The file to write to, or the directory to write partitioned files to.
+        partition_key: A function that returns the partition of each row of a record, as a sequence or array with one
+            value per row.
     """
 
     def __init__(self,
@@ -88,8 +126,18 @@ class ParquetLoader(Loader):
                  partition_key: Optional[Callable[[Any], Any]] = None):
         self.path = Path(path)
         self.partition_key = partition_key
+        self._writers: dict[Path, pq.ParquetWriter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _temp_file(output_file: Path) -> Path:
+        # hidden, so that it is skipped when reading a partitioned directory as a dataset
+        return output_file.with_name(f".{output_file.name}.tmp")
 
     def _write_to_parquet(self, df: pd.DataFrame, output_file: Path) -> None:
+        # complete any Arrow records written to the same file first, so they are included in the existing data
+        self._close_writer(output_file)
+
         if not output_file.parent.exists():
             output_file.parent.mkdir(parents=True, exist_ok=True)
 
@@ -97,16 +145,62 @@ class ParquetLoader(Loader):
             existing_df = pd.read_parquet(output_file)
             df = pd.concat([existing_df, df], ignore_index=True)
 
-        df.to_parquet(output_file, index=False, compression="snappy")
+        temp_file = self._temp_file(output_file)
+        df.to_parquet(temp_file, index=False, compression="snappy")
+        os.replace(temp_file, output_file)
+
+    def _write_arrow_to_parquet(self, data: pa.RecordBatch | pa.Table, output_file: Path) -> None:
+        writer = self._writers.get(output_file)
+
+        if writer is None:
+            if not output_file.parent.exists():
+                output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    def load(self, item: pd.DataFrame) -> None:
+            writer = pq.ParquetWriter(self._temp_file(output_file), data.schema, compression="snappy")
+            self._writers[output_file] = writer
+            if output_file.exists():
+                writer.write_table(pq.read_table(output_file))
+
+        if isinstance(data, pa.RecordBatch):
+            writer.write_batch(data)
+        else:
+            writer.write_table(data)
+
+    def _load_arrow(self, item: pa.RecordBatch | pa.Table) -> None:
         if self.partition_key:
-            for par, df in item.groupby(self.partition_key(item)):
+            keys = pa.array(self.partition_key(item))
+            for par in pc.unique(keys).to_pylist():
+                mask = pc.is_null(keys) if par is None else pc.equal(keys, par)
                 output_file = self.path / f"{str(par).strip()}.parquet"
-                self._write_to_parquet(df, output_file)
+                self._write_arrow_to_parquet(item.filter(mask), output_file)
         else:
-            output_file = self.path
-            self._write_to_parquet(item, output_file)
+            self._write_arrow_to_parquet(item, self.path)
+
+    def _close_writer(self, output_file: Path) -> None:
+        """Close the writer of `output_file`, if one is open, and move the file it wrote into place."""
+        writer = self._writers.pop(output_file, None)
+        if writer is not None:
+            logger.debug(f"Closing {output_file}")
+            writer.close()
+            os.replace(self._temp_file(output_file), output_file)
+
+    def load(self, item: pd.DataFrame | pa.RecordBatch | pa.Table) -> None:
+        with self._lock:
+            if isinstance(item, (pa.RecordBatch, pa.Table)):
+                self._load_arrow(item)
+            elif self.partition_key:
+                for par, df in item.groupby(self.partition_key(item)):
+                    output_file = self.path / f"{str(par).strip()}.parquet"
+                    self._write_to_parquet(df, output_file)
+            else:
+                output_file = self.path
+                self._write_to_parquet(item, output_file)
+
+    def flush(self):
+        """Close the open Parquet writers, replacing the output files with the files written from Arrow records."""
+        with self._lock:
+            for output_file in list(self._writers):
+                self._close_writer(output_file)
 
 
 class TextFileLoader(Loader):
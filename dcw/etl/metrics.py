@@ -0,0 +1,275 @@
+"""Export pipeline metrics in the Prometheus text format.
+
+`MetricsExporter` makes the statistics of a running pipeline (see `dcw.etl.stats`) available to a monitoring system,
+either on a local HTTP endpoint that Prometheus can scrape, or as a text file that is periodically rewritten, for use
+with the node exporter's textfile collector. The `dcw-pipeline run` command enables it with `--metrics-port` or
+`--metrics-file`.
+
+The following metrics are exported, labelled with the pipeline and stage names:
+
+- `dcw_pipeline_records_in_total`, `dcw_pipeline_records_out_total`, `dcw_pipeline_errors_total`: per-stage counters.
+- `dcw_pipeline_stage_seconds_total`: time spent in each stage.
+- `dcw_pipeline_stage_latency_seconds`: a histogram of the time records spent in each stage.
+- `dcw_pipeline_loader_flushes_total`, `dcw_pipeline_loader_flush_seconds_total`: loader flushes and their duration.
+- `dcw_pipeline_stage_detail`: numeric stage-specific statistics, labelled with their name, such as the
+  `memory_bytes` and `false_positive_rate` of a deduplicator.
+- `dcw_pipeline_in_flight`: records extracted but not yet fully processed.
+- `process_resident_memory_bytes`, `process_max_resident_memory_bytes`: memory used by the process.
+
+Examples:
+    >>> from dcw.etl.pipeline import ProcessingPipeline
+    >>> from dcw.etl.extract import RecordExtractor
+    >>> from dcw.etl.load import ListLoader
+    >>> pipeline = ProcessingPipeline(name="demo")
+    >>> pipeline.add_loader(ListLoader(), name="load")
+    >>> pipeline.enable_stats()
+    >>> pipeline.extract(RecordExtractor(range(3)))
+    >>> for line in render_metrics(pipeline).splitlines():
+    ...     if line.startswith("dcw_pipeline_records_in_total"):
+    ...         print(line)
+    dcw_pipeline_records_in_total{pipeline="demo",stage="demo",kind="source"} 3
+    dcw_pipeline_records_in_total{pipeline="demo",stage="load",kind="loader"} 3
+"""
+
+import http.server
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from dcw.etl.aio import AsyncProcessingPipeline
+from dcw.etl.pipeline import ProcessingPipeline
+from dcw.etl.stats import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (name, type, help, key in the dict returned by StageStats.to_dict)
+_STAGE_METRICS = (
+    ("dcw_pipeline_records_in_total", "counter", "Records received by the stage.", "records_in"),
+    ("dcw_pipeline_records_out_total", "counter", "Records emitted (or loaded) by the stage.", "records_out"),
+    ("dcw_pipeline_errors_total", "counter", "Records for which the stage raised an exception.", "errors"),
+    ("dcw_pipeline_stage_seconds_total", "counter", "Seconds spent in the stage, excluding downstream stages.", "time"),
+)
+
+_LOADER_METRICS = (
+    ("dcw_pipeline_loader_flushes_total", "counter", "Number of times the loader was flushed.", "flushes"),
+    ("dcw_pipeline_loader_flush_seconds_total", "counter", "Seconds spent flushing the loader.", "flush_time"),
+)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _resident_memory() -> Optional[int]:
+    """Get the current resident set size of the process in bytes, if it can be determined."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _max_resident_memory() -> int:
+    """Get the peak resident set size of the process in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def render_metrics(pipeline: ProcessingPipeline | AsyncProcessingPipeline) -> str:
+    """Render the metrics of a pipeline in the Prometheus text format.
+
+    Arguments:
+        pipeline (ProcessingPipeline | AsyncProcessingPipeline): The pipeline. Per-stage metrics are only available if
+            stats have been enabled with `enable_stats()`.
+
+    Returns:
+        str: The metrics.
+    """
+    pipeline_name = pipeline.name or ""
+    stats = pipeline.stats()
+    lines = []
+
+    def add(name: str, kind: str, help: str, samples: list[tuple[str, Any]]) -> None:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+    for name, kind, help, key in _STAGE_METRICS:
+        add(name, kind, help, [(_labels(pipeline=pipeline_name, stage=stage, kind=s["kind"]), s[key])
+                               for stage, s in stats.items()])
+
+    samples = []
+    for stage, s in stats.items():
+        buckets = s["latency"]["buckets"]
+        cumulative = 0
+        for index in range(LatencyHistogram.BUCKETS):
+            bound = LatencyHistogram.bucket_bound(index)
+            cumulative += buckets.get(bound, 0)
+            samples.append((_labels(pipeline=pipeline_name, stage=stage, le=bound), cumulative))
+        samples.append((_labels(pipeline=pipeline_name, stage=stage, le="+Inf"), s["latency"]["count"]))
+    lines.append("# HELP dcw_pipeline_stage_latency_seconds Time records spent in the stage.")
+    lines.append("# TYPE dcw_pipeline_stage_latency_seconds histogram")
+    lines.extend(f"dcw_pipeline_stage_latency_seconds_bucket{labels} {value}" for labels, value in samples)
+    for stage, s in stats.items():
+        labels = _labels(pipeline=pipeline_name, stage=stage)
+        lines.append(f"dcw_pipeline_stage_latency_seconds_sum{labels} {s['latency']['sum']}")
+        lines.append(f"dcw_pipeline_stage_latency_seconds_count{labels} {s['latency']['count']}")
+
+    for name, kind, help, key in _LOADER_METRICS:
+        add(name, kind, help, [(_labels(pipeline=pipeline_name, stage=stage), s[key])
+                               for stage, s in stats.items() if s["kind"] == "loader"])
+
+    add("dcw_pipeline_stage_detail", "gauge", "Stage-specific statistics.",
+        [(_labels(pipeline=pipeline_name, stage=stage, detail=detail), value)
+         for stage, s in stats.items() for detail, value in s["details"].items()
+         if isinstance(value, (int, float)) and not isinstance(value, bool)])
+
+    add("dcw_pipeline_in_flight", "gauge", "Records extracted but not yet fully processed.",
+        [(_labels(pipeline=pipeline_name), pipeline.in_flight)])
+
+    resident = _resident_memory()
+    if resident is not None:
+        add("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.", [("", resident)])
+    add("process_max_resident_memory_bytes", "gauge", "Peak resident memory size in bytes.",
+        [("", _max_resident_memory())])
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Serve the metrics of a pipeline over HTTP, and/or periodically write them to a file.
+
+    The exporter runs on daemon threads, so it does not keep the process alive. Stats are enabled on the pipeline when
+    the exporter is created.
+
+    Examples:
+        >>> import urllib.request
+        >>> from dcw.etl.pipeline import ProcessingPipeline
+        >>> from dcw.etl.load import ListLoader
+        >>> pipeline = ProcessingPipeline(name="demo")
+        >>> pipeline.add_loader(ListLoader())
+        >>> with MetricsExporter(pipeline, port=0) as exporter:
+        ...     with urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}/metrics") as response:
+        ...         print(response.read().decode().splitlines()[0])
+        # HELP dcw_pipeline_records_in_total Records received by the stage.
+
+    Attributes:
+        pipeline (ProcessingPipeline | AsyncProcessingPipeline): The pipeline whose metrics are exported.
+        port (Optional[int]): The port metrics are served on. If 0 was requested, the port that was picked.
+        path (Optional[pathlib.Path]): The file metrics are written to.
+        interval (float): Seconds between writes to `path`.
+    """
+
+    def __init__(self, pipeline: ProcessingPipeline | AsyncProcessingPipeline, *, port: Optional[int] = None,
+                 host: str = "127.0.0.1", path: Optional[str | Path] = None, interval: float = 15.0) -> None:
+        """Create a new MetricsExporter. Call `start()` (or use it as a context manager) to begin exporting.
+
+        Arguments:
+            pipeline (ProcessingPipeline | AsyncProcessingPipeline): The pipeline whose metrics are exported.
+            port (Optional[int]): Serve metrics over HTTP on this port. Use 0 to pick a free port.
+            host (str): The address to serve metrics on.
+            path (Optional[str | pathlib.Path]): Periodically write metrics to this file.
+            interval (float): Seconds between writes to `path`.
+        """
+        if port is None and path is None:
+            raise ValueError("Either port or path must be given")
+
+        self.pipeline = pipeline
+        self.port = port
+        self.host = host
+        self.path = Path(path) if path is not None else None
+        self.interval = interval
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._threads: list[threading.Thread] = []
+        self._stopped = threading.Event()
+
+        # stats may already be enabled with other settings, such as tracking memory, which are kept
+        if not pipeline.stats_enabled:
+            pipeline.enable_stats()
+
+    def start(self) -> None:
+        """Start serving and/or writing metrics."""
+        if self.port is not None:
+            self._server = http.server.ThreadingHTTPServer((self.host, self.port), self._make_handler())
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+            self._start_thread(self._server.serve_forever, "metrics-http")
+            logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+        if self.path is not None:
+            self._start_thread(self._run_writer, "metrics-file")
+            logger.info(f"Writing metrics to {self.path} every {self.interval}s")
+
+    def stop(self) -> None:
+        """Stop exporting metrics. The file, if any, is written one last time so that it holds the final values."""
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        if self.path is not None:
+            self.write()
+
+    def write(self) -> None:
+        """Write the metrics to `path`, atomically replacing the previous version of the file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(render_metrics(self.pipeline))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _start_thread(self, target, name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _run_writer(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.write()
+            except Exception:
+                logger.exception(f"Error writing metrics to {self.path}")
+
+    def _make_handler(self) -> type[http.server.BaseHTTPRequestHandler]:
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = render_metrics(exporter.pipeline).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def __enter__(self) -> "MetricsExporter":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -2,27 +2,123 @@
 """
 
 import collections
+import concurrent.futures
+import functools
 import importlib
 import abc
 import argparse
+import asyncio
 import inspect
 import logging
+import multiprocessing
+import os
+import time
 from types import ModuleType
 import typing
 import threading
 from collections import deque
-from typing import Any, Callable, Iterable, Optional
+from typing import Any, Callable, Hashable, Iterable, Literal, Optional, Sequence
 
 import pydantic
 
 import streamz
 
-from dcw.etl.extract import Extractor
+from dcw.etl import engine as native
+from dcw.etl.batching import BatchSizer
+from dcw.etl.aio import AsyncProcessingPipeline, aiter_records
+from dcw.etl.cache import CachedTransformation
+from dcw.etl.checkpoint import Checkpoint
+from dcw.etl.dedup import Deduplicator
+from dcw.etl.extract import AsyncExtractor, Extractor, is_async_extractor, is_resumable_extractor, shard_extractor
 from dcw.etl.load import Loader
+from dcw.etl.stages import Batch, ChunkedExecutorMap, ExecutorMap, KeyPartition, QueuedSink, Window
+from dcw.etl.stats import StageStats, instrument_stream, new_stage_names, stage_kind
+from dcw.etl.transform import VectorizedTransformation
+from dcw.etl.window import Aggregate, Windower
 
 logger = logging.getLogger(__name__)
 
 
+class _LaneStages:
+    """The last stage of every lane of a partitioner. Stages added to it are added to every lane."""
+
+    _NAMES = {"map": "transform", "filter": "filter", "partition": "batcher", "flatten": "flattener"}
+
+    def __init__(self, partitioner: KeyPartition | native.KeyPartition, stages: list[native.Node]) -> None:
+        # streamz only holds weak references to downstreams, so the partitioner is kept alive from here
+        self.partitioner = partitioner
+        self.stages = stages
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.stages[0].name
+
+    @property
+    def downstreams(self) -> list[native.Node]:
+        return self.stages[0].downstreams
+
+    @property
+    def details(self) -> Optional[Callable[[], dict[str, Any]]]:
+        return getattr(self.stages[0], "details", None)
+
+    @details.setter
+    def details(self, details: Optional[Callable[[], dict[str, Any]]]) -> None:
+        for stage in self.stages:
+            stage.details = details
+
+    @staticmethod
+    def _lane_name(stream_name: Optional[str], kind: str, index: int) -> str:
+        return f"{stream_name or kind}[{index}]"
+
+    def _add(self, method: str, *args, stream_name: Optional[str] = None, **kwargs) -> "_LaneStages":
+        kind = self._NAMES[method]
+        stages = [getattr(stage, method)(*args, stream_name=self._lane_name(stream_name, kind, i), **kwargs)
+                  for i, stage in enumerate(self.stages)]
+        return _LaneStages(self.partitioner, stages)
+
+    def map(self, func: Callable[[Any], Any], *, stream_name: Optional[str] = None) -> "_LaneStages":
+        return self._add("map", func, stream_name=stream_name)
+
+    def filter(self, predicate: Callable[[Any], bool], *, stream_name: Optional[str] = None) -> "_LaneStages":
+        return self._add("filter", predicate, stream_name=stream_name)
+
+    def partition(self, n: int, *, timeout: Optional[float] = None, stream_name: Optional[str] = None,
+                  new_sizer: Optional[Callable[[], BatchSizer]] = None) -> "_LaneStages":
+        if new_sizer is None:
+            return self._add("partition", n, timeout=timeout, stream_name=stream_name)
+        # each lane sizes its own batches
+        stages = [stage.partition(n, timeout=timeout, stream_name=self._lane_name(stream_name, "batcher", i),
+                                  sizer=new_sizer())
+                  for i, stage in enumerate(self.stages)]
+        return _LaneStages(self.partitioner, stages)
+
+    def flatten(self, *, stream_name: Optional[str] = None) -> "_LaneStages":
+        return self._add("flatten", stream_name=stream_name)
+
+    def window(self, new_windower: Callable[[], Windower], *, stream_name: Optional[str] = None) -> "_LaneStages":
+        # each lane aggregates its own keys, so each gets its own windower
+        stages = [stage.window(new_windower(), stream_name=self._lane_name(stream_name, "window", i))
+                  for i, stage in enumerate(self.stages)]
+        return _LaneStages(self.partitioner, stages)
+
+    def union(self, *others: "_LaneStages", stream_name: Optional[str] = None) -> "_LaneStages":
+        if any(other.partitioner is not self.partitioner for other in others):
+            raise ValueError("Only branches that follow the same partitioner can be merged")
+        stages = [stage.union(*(other.stages[i] for other in others),
+                              stream_name=self._lane_name(stream_name, "merge", i))
+                  for i, stage in enumerate(self.stages)]
+        return _LaneStages(self.partitioner, stages)
+
+    def sink(self, funcs: list[Callable[[Any], None]], *, stream_name: Optional[str] = None,
+             new_queue: Optional[Callable[[Callable[[Any], None], str], native.LoaderQueue]] = None) -> None:
+        for i, (stage, func) in enumerate(zip(self.stages, funcs)):
+            name = self._lane_name(stream_name, "loader", i)
+            if new_queue is None:
+                stage.sink(func, stream_name=name)
+            else:
+                native.QueuedSink(stage, new_queue(func, name), stream_name=name)
+
+
 class ProcessingPipeline:
     """ProcessingPipeline can be used to process data streams.
 
@@ -42,6 +138,23 @@ class ProcessingPipeline:
     Flatteners can be added to the pipeline to flatten batches of data into individual records that will be emitted
     downstream.
 
+    Windows can be added to the pipeline to aggregate records over tumbling or sliding windows of time, emitting one
+    result per window (and key) when it closes.
+
+    Parallel transformations can be added to the pipeline to run I/O-bound transformations (network lookups, file
+    reads) on a pool of threads, or CPU-bound transformations on a pool of processes, while optionally preserving the
+    order of the records.
+
+    A partitioner can be added to the pipeline to process the records of different keys in parallel, while the records
+    of each key are processed in order. Every stage added after it runs separately in each lane.
+
+    The pipeline can branch, so that the records extracted in one pass feed several chains of stages, each with its own
+    loaders, and branches can be merged back into a single chain (see `branch` and `merge`).
+
+    By default, the pipeline is executed by `streamz`. Pipelines made up only of transformations, batchers, windows,
+    flatteners and loaders can instead use the much faster native engine (see `dcw.etl.engine`) by passing
+    `engine="native"`.
+
     Examples:
         Create a pipeline that squares the input data and loads it into a list:
         >>> from dcw.etl.pipeline import ProcessingPipeline
@@ -77,18 +190,35 @@ class ProcessingPipeline:
     Attributes:
         name (str): Name of the pipeline.
         end_name (str): Name of the last point in the pipeline.
+        engine (str): The engine that executes the pipeline, "streamz" or "native".
     """
-    current: streamz.Stream
-    source: streamz.Stream
+    current: streamz.Stream | native.Node | _LaneStages
+    source: streamz.Stream | native.Source
 
-    def __init__(self, name: str = None) -> None:
+    def __init__(self, name: str = None, *, engine: Literal["streamz", "native"] = "streamz") -> None:
         """Create a new ProcessingPipeline.
 
         Arguments:
             name (str): Name of the pipeline.
+            engine (str): The engine that executes the pipeline. One of "streamz" (the default) or "native".
         """
-        self.source = streamz.Stream(stream_name=name)
+        if engine == "streamz":
+            self.source = streamz.Stream(stream_name=name)
+        elif engine == "native":
+            self.source = native.Source(stream_name=name)
+        else:
+            raise ValueError(f"Unknown engine {engine}")
+        self.engine = engine
         self.current = self.source
+        self._stats_enabled = False
+        self._stats_memory = False
+        self._in_flight = 0
+        self._deduplicators: list[Deduplicator] = []
+        # streamz only holds weak references to downstreams, so the end of each branch is kept alive from here
+        self._branches: list[PipelineBranch] = []
+        # executors of parallel stages, with a factory to start a new one after `close` has shut them down
+        self._executors: list[tuple[ExecutorMap, Callable[[], concurrent.futures.Executor]]] = []
+        self._executors_closed = False
 
     @property
     def name(self):
@@ -98,6 +228,17 @@ class ProcessingPipeline:
     def end_name(self):
         return self.current.name
 
+    @property
+    def in_flight(self) -> int:
+        """The number of records that have been extracted by `extract` but not yet fully processed.
+
+        For the native engine, which processes each record synchronously, this is the number of records held in
+        batchers.
+        """
+        if self.engine == "native":
+            return self.source.held()
+        return self._in_flight
+
     def push(self, data: Any, callback: Callable = None) -> None:
         """Push data into the pipeline.
 
@@ -105,18 +246,26 @@ class ProcessingPipeline:
             data (Any): Data that will be pushed into the pipeline.
             callback (Optional[Callable]): Callback that will be invoked when the data has been processed.
         """
+        if self.engine == "native":
+            self.source.emit(data, callback=callback)
+            return
+
+        if self._executors_closed:
+            self._start_executors()
+
         metadata = [{"ref": streamz.RefCounter(cb=callback)}] if callback is not None else None
         self.source.emit(data, metadata=metadata)
 
     def _loader_at_end(self) -> bool:
-        """Check if the pipeline has a loader at the end.
+        """Check if the pipeline, and each of its branches, has a loader (or a merge) at the end.
 
         Returns:
             bool: True if the pipeline has a loader at the end, False otherwise.
         """
-        return len(self.current.downstreams) > 0
+        return all(len(end.downstreams) > 0 for end in (self.current, *(branch.current for branch in self._branches)))
 
-    def extract(self, extractor: Extractor) -> None:
+    def extract(self, extractor: Extractor, *, max_in_flight: Optional[int] = None,
+                checkpoint: Optional[Checkpoint] = None) -> None:
         """Extract records and push them into the pipeline.
 
         This method blocks until all records have been processed through the pipeline.
@@ -124,34 +273,225 @@ class ProcessingPipeline:
         After all records have been processed, the `Loader` instances in pipeline will be flushed using their `flush()`
         methods.
 
+        By default, records are pulled from the extractor as fast as the pipeline accepts them. Stages that hold on to
+        records, such as batchers with a timeout, accept them faster than they can be loaded, so records can pile up in
+        memory ahead of a slow loader. Use `max_in_flight` to stop pulling records from the extractor while that many
+        records have not yet made it through the pipeline. Note that a batcher must be able to emit a batch while
+        extraction is paused, so its size must be smaller than `max_in_flight`, or it must have a timeout.
+
+        Long extractions can be made resumable with a `dcw.etl.checkpoint.Checkpoint`. The extractor must then be a
+        `dcw.etl.extract.ResumableExtractor`. Checkpoints flush the loaders while records may still be being loaded,
+        on another thread, by stages such as batchers with a timeout.
+
         Arguments:
             extractor (Extractor): Extractor instance that will be used to extract records.
+            max_in_flight (Optional[int]): Maximum number of records that have been extracted but not yet fully
+                processed. Default: no limit.
+            checkpoint (Optional[Checkpoint]): Periodically save the position of the extraction, and possibly resume
+                from a saved position.
         """
         if not self._loader_at_end():
             raise ValueError("Pipeline must have a loader at the end")
 
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+        if checkpoint is not None and not is_resumable_extractor(extractor):
+            raise ValueError(f"{type(extractor).__name__} does not support checkpoints, it must implement "
+                             "iter_positions()")
+
+        self._instrument()
+
+        if checkpoint is not None:
+            records = checkpoint.iter_records(extractor, self._flush_for_checkpoint)
+        else:
+            records = None
+
+        if self.engine == "native":
+            self._extract_native(extractor, records, max_in_flight=max_in_flight)
+        else:
+            self._start_executors()
+            try:
+                self._extract_streamz(extractor, records, max_in_flight=max_in_flight)
+            finally:
+                # every record has been processed (or extraction failed), so the worker threads and processes of
+                # parallel stages are no longer needed
+                self.close()
+
+        if checkpoint is not None:
+            checkpoint.save(self._flush_for_checkpoint)
+        else:
+            self.flush_loaders()
+
+        for dedup in self._deduplicators:
+            if dedup.state_path is not None:
+                dedup.save()
+
+    def close(self) -> None:
+        """Shut down the worker threads and processes of parallel stages, waiting for them to exit.
+
+        `extract` calls this when it returns, so it is only needed after pushing records with `push`. The workers are
+        started again if more records are pushed or extracted.
+        """
+        for stage, _ in self._executors:
+            stage.executor.shutdown(wait=True)
+        self._executors_closed = True
+
+    def __enter__(self) -> "ProcessingPipeline":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _start_executors(self) -> None:
+        """Replace the executors of parallel stages that have been shut down by `close`."""
+        if self._executors_closed:
+            for stage, factory in self._executors:
+                stage.executor = factory()
+            self._executors_closed = False
+
+    def _add_executor_stage(self, stage: ExecutorMap, factory: Callable[[], concurrent.futures.Executor]) -> None:
+        """Make `stage` the current stage, and have the pipeline own its executor."""
+        self._executors.append((stage, factory))
+        self.current = stage
+
+    def _flush_for_checkpoint(self) -> None:
+        # a stage may have dropped a record that failed, which must not be covered by a checkpoint
+        self._raise_stage_errors()
+        self.flush_loaders()
+
+    def _extract_streamz(self, extractor: Extractor, records: Optional[Iterable[tuple[Any, Callable[[], None]]]], *,
+                         max_in_flight: Optional[int] = None) -> None:
+        """Extract records through streamz, see `extract`."""
         cv = threading.Condition()
-        tasks = 0
 
-        def callback():
-            nonlocal tasks
+        def callback(done: Optional[Callable[[], None]] = None):
+            if done is not None:
+                done()
             with cv:
-                tasks -= 1
+                self._in_flight -= 1
                 cv.notify()
 
-        for record in extractor.iter_records():
-            self.push(record, callback=callback)
+        if records is None:
+            records = ((record, None) for record in extractor.iter_records())
 
+        for record, done in records:
             with cv:
-                tasks += 1
-                cv.notify()
+                if max_in_flight is not None:
+                    cv.wait_for(lambda: self._in_flight < max_in_flight)
+                self._in_flight += 1
 
-        while tasks > 0:
+            self.push(record, callback=callback if done is None else functools.partial(callback, done))
+
+        # records can be left waiting in open windows and sized batchers, and in batchers in the lanes of a partitioner
+        for stream in self._iter_streams():
+            if isinstance(stream, (KeyPartition, Window, Batch)):
+                stream.flush()
+
+        while self._in_flight > 0:
             with cv:
-                cv.wait_for(lambda: tasks <= 0)
+                cv.wait_for(lambda: self._in_flight <= 0)
+
+        self._raise_stage_errors()
+
+    def _extract_native(self, extractor: Extractor, records: Optional[Iterable[tuple[Any, Callable[[], None]]]], *,
+                        max_in_flight: Optional[int] = None) -> None:
+        """Extract records through the native engine, see `extract`."""
+        emit = self.source.emit
+
+        if records is not None:
+            # completion callbacks fire once a record, and every record before it, has been processed
+            for record, done in records:
+                if max_in_flight is not None:
+                    self.source.wait(lambda held: held < max_in_flight)
+                emit(record, callback=done)
+        elif max_in_flight is None:
+            for record in extractor.iter_records():
+                emit(record)
+        else:
+            for record in extractor.iter_records():
+                self.source.wait(lambda held: held < max_in_flight)
+                emit(record)
+
+        # records are only ever left waiting in batchers and open windows
+        self.source.flush()
+        self._raise_stage_errors()
+
+    def branch(self) -> "PipelineBranch":
+        """Start a branch at the current end of the pipeline.
+
+        Every record that reaches the current end of the pipeline is passed both to the stages added to the branch and
+        to those added to the pipeline afterwards, so that one extraction feeds several chains of stages. Each branch
+        must end with a loader, or be merged (see `merge`). Records are only done, for `extract` and `in_flight`, once
+        every branch has processed them, and the loaders of every branch are flushed with those of the pipeline.
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> raw, squared = [], []
+            >>> pipeline = ProcessingPipeline()
+            >>> archive = pipeline.branch()
+            >>> archive.add_loader(ListLoader(raw))
+            >>> pipeline.add_transform(lambda x: x ** 2)
+            >>> pipeline.add_loader(ListLoader(squared))
+            >>> pipeline.extract(RecordExtractor(range(4)))
+            >>> raw, squared
+            ([0, 1, 2, 3], [0, 1, 4, 9])
 
-        # flush all the loaders
-        self.flush_loaders()
+        Returns:
+            PipelineBranch: The branch, to which stages are added like they are to the pipeline.
+        """
+        branch = PipelineBranch(self, self.current)
+        self._branches.append(branch)
+        return branch
+
+    def merge(self, *branches: "PipelineBranch", name: Optional[str] = None) -> None:
+        """Merge branches into the pipeline: stages added to the pipeline afterwards receive the records that reach its
+        current end and the end of every branch.
+
+        Records are not combined or reordered: each is passed on as soon as it reaches the end of its branch, so a
+        record that takes several branches is passed on once by each. After a partitioner, only branches that follow
+        that partitioner can be merged, and they are merged separately in each lane.
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.load import ListLoader
+            >>> records = []
+            >>> pipeline = ProcessingPipeline()
+            >>> negated = pipeline.branch()
+            >>> negated.add_transform(lambda x: -x)
+            >>> pipeline.add_transform(lambda x: x ** 2)
+            >>> pipeline.merge(negated)
+            >>> pipeline.add_loader(ListLoader(records))
+            >>> pipeline.push(3)
+            >>> records
+            [-3, 9]
+
+        Arguments:
+            branches (PipelineBranch): Branches of this pipeline.
+            name (Optional[str]): Name of the merge.
+        """
+        self.current = self._merge(self.current, branches, name)
+
+    def _merge(self, current: streamz.Stream | native.Node | _LaneStages, branches: Sequence["PipelineBranch"],
+               name: Optional[str]) -> streamz.Stream | native.Node | _LaneStages:
+        """Get a stage that emits the records of `current` and of the ends of `branches`."""
+        if not branches:
+            raise ValueError("At least one branch is required")
+        if any(branch.pipeline is not self for branch in branches):
+            raise ValueError("Only branches of the same pipeline can be merged")
+        others = [branch.current for branch in branches]
+        if any(isinstance(other, _LaneStages) != isinstance(current, _LaneStages) for other in others):
+            raise ValueError("Branches that follow a partitioner can only be merged with each other")
+        return current.union(*others, stream_name=name)
+
+    def _require_streamz(self, feature: str) -> None:
+        """Raise if the stage being added will not be executed by streamz."""
+        if self.engine != "streamz":
+            raise ValueError(f"{feature} is not supported by the {self.engine} engine")
+        if isinstance(self.current, _LaneStages):
+            raise ValueError(f"{feature} is not supported after a partitioner, whose lanes use the native engine")
 
     def add_transform(self, func: Callable[[Any], Any], *, name: Optional[str] = None) -> None:
         """Add a transformation to the pipeline.
@@ -161,18 +501,325 @@ class ProcessingPipeline:
             name (Optional[str]): Name of the transformation.
         """
         self.current = self.current.map(func, stream_name=name)
+        self._attach_cache_stats(func)
+
+    def _attach_cache_stats(self, func: Callable[[Any], Any]) -> None:
+        """Include the cache counters of a `CachedTransformation` in the stats of the current stage."""
+        if isinstance(func, CachedTransformation):
+            self.current.details = func.stats
+
+    def add_parallel_transform(self, func: Callable[[Any], Any], *, workers: Optional[int] = None,
+                               ordered: bool = True, buffer_size: Optional[int] = None,
+                               name: Optional[str] = None) -> None:
+        """Add a transformation that is run on a pool of threads.
+
+        This is useful for I/O-bound transformations, such as those that make network requests or read files, where
+        running one record at a time would leave the machine mostly idle. The transformation must be thread-safe.
+
+        At most `buffer_size` records are held by this stage at once. When the limit is reached, pushing more records
+        into the pipeline blocks until a record has been emitted downstream.
+
+        The threads are shut down when `extract` returns, or by `close` after records are pushed with `push`.
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> records = []
+            >>> pipeline = ProcessingPipeline()
+            >>> pipeline.add_parallel_transform(lambda x: x ** 2, workers=4)
+            >>> pipeline.add_loader(ListLoader(records))
+            >>> pipeline.extract(RecordExtractor(range(5)))
+            >>> records
+            [0, 1, 4, 9, 16]
 
-    def add_batcher(self, size: int, *, name: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        Arguments:
+            func (Callable): Callable that will be used to transform the data.
+            workers (Optional[int]): Number of threads. Default: `min(32, os.cpu_count() + 4)`.
+            ordered (bool): If True, records are emitted downstream in the order they were received. Otherwise, they
+                are emitted as soon as they have been transformed.
+            buffer_size (Optional[int]): Maximum number of records being transformed or waiting to be emitted. This
+                bounds the size of the reorder buffer when `ordered` is True. Default: `2 * workers`.
+            name (Optional[str]): Name of the transformation.
+        """
+        self._require_streamz("add_parallel_transform")
+        workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        factory = functools.partial(concurrent.futures.ThreadPoolExecutor, max_workers=workers,
+                                    thread_name_prefix=name or "transform")
+        self._add_executor_stage(ExecutorMap(self.current, func, factory(), max_pending=buffer_size or 2 * workers,
+                                             ordered=ordered, stream_name=name), factory)
+        self._attach_cache_stats(func)
+
+    def add_process_transform(self, func: Callable[[Any], Any], *, workers: Optional[int] = None,
+                              chunksize: int = 32, ordered: bool = True, buffer_size: Optional[int] = None,
+                              initializer: Optional[Callable[..., None]] = None, initargs: Sequence[Any] = (),
+                              start_method: Optional[str] = None, name: Optional[str] = None) -> None:
+        """Add a transformation that is run on a pool of processes.
+
+        This is useful for CPU-bound transformations written in pure Python, which cannot make use of more than one
+        core when run on threads. Records are sent to the worker processes in chunks of up to `chunksize` records to
+        spread out the cost of pickling. Chunks are sent early, before they are full, when a worker would otherwise be
+        idle.
+
+        The transformation, the records, and the transformed records must all be picklable. In particular, lambdas and
+        functions defined inside other functions cannot be used.
+
+        If a transformation raises, or a worker process dies, the error is logged and raised from `extract`.
+
+        The worker processes are shut down when `extract` returns, or by `close` after records are pushed with `push`.
+        They are started again, running `initializer`, the next time records are extracted or pushed.
+
+        Arguments:
+            func (Callable): Callable that will be used to transform the data. Must be picklable.
+            workers (Optional[int]): Number of worker processes. Default: `os.cpu_count()`.
+            chunksize (int): Maximum number of records sent to a worker at once.
+            ordered (bool): If True, records are emitted downstream in the order they were received.
+            buffer_size (Optional[int]): Maximum number of records being transformed or waiting to be emitted.
+                Default: `2 * workers * chunksize`.
+            initializer (Optional[Callable]): Called once in each worker process when it starts. Use this to set up
+                expensive state, such as lookup tables, that the transformation needs.
+            initargs (Sequence[Any]): Arguments passed to `initializer`.
+            start_method (Optional[str]): The multiprocessing start method ("fork", "spawn", or "forkserver").
+                Default: the platform default.
+            name (Optional[str]): Name of the transformation.
+        """
+        self._require_streamz("add_process_transform")
+        workers = workers or os.cpu_count() or 1
+        factory = functools.partial(
+            concurrent.futures.ProcessPoolExecutor,
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method) if start_method else None,
+            initializer=initializer,
+            initargs=tuple(initargs))
+        self._add_executor_stage(
+            ChunkedExecutorMap(self.current, func, factory(), chunksize=chunksize, workers=workers,
+                               max_pending=buffer_size or 2 * workers * chunksize, ordered=ordered,
+                               stream_name=name),
+            factory)
+
+    def add_deduplicator(self, key: Optional[Callable[[Any], Any]] = None, *, capacity: int,
+                         mode: Literal["exact", "bloom"] = "exact", error_rate: float = 0.001,
+                         state_path: Optional[str | os.PathLike] = None, name: Optional[str] = None) -> Deduplicator:
+        """Add a stage that drops records whose key has already been seen, see `dcw.etl.dedup`.
+
+        In "exact" mode, the `capacity` most recently seen keys are held in memory, and a duplicate is only let through
+        once its key has been forgotten. In "bloom" mode, keys are added to a Bloom filter sized for `capacity` keys,
+        which uses a fixed amount of memory (about 1.8 bytes per key at the default `error_rate`), but drops a small
+        fraction of records that are not duplicates.
+
+        If `state_path` is given, the state is loaded from it if it exists, and saved to it after each successful
+        `extract`. The stage stats include the number of keys held, their memory footprint and the false-positive rate
+        under "details".
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> records = []
+            >>> pipeline = ProcessingPipeline()
+            >>> dedup = pipeline.add_deduplicator(lambda x: x % 3, capacity=100)
+            >>> pipeline.add_loader(ListLoader(records))
+            >>> pipeline.extract(RecordExtractor(range(6)))
+            >>> records, dedup.duplicates
+            ([0, 1, 2], 3)
+
+        Arguments:
+            key (Optional[Callable]): Returns the key of a record. If None, the record itself is the key.
+            capacity (int): The number of keys held ("exact") or the filter is sized for ("bloom").
+            mode (str): "exact" or "bloom".
+            error_rate (float): In "bloom" mode, the target false-positive rate at `capacity` keys.
+            state_path (Optional[str | os.PathLike]): File to load the state from and save it to.
+            name (Optional[str]): Name of the stage.
+
+        Returns:
+            Deduplicator: The predicate used by the stage.
+        """
+        dedup = Deduplicator(key, capacity=capacity, mode=mode, error_rate=error_rate, state_path=state_path)
+        self.current = self.current.filter(dedup, stream_name=name)
+        self.current.details = dedup.stats
+        self._deduplicators.append(dedup)
+        return dedup
+
+    def add_partitioner(self, key_func: Callable[[Any], Hashable], *, partitions: int,
+                        buffer_size: Optional[int] = None, name: Optional[str] = None) -> None:
+        """Add a partitioner, which processes the records of each key in order, and different keys in parallel.
+
+        Records are hashed by `key_func` into one of `partitions` lanes. Each lane has its own worker thread, and every
+        stage added to the pipeline after the partitioner is added separately to each lane. The records of a key all go
+        through the same lane, one at a time, in the order they were pushed. Transformations and loaders in the lanes
+        are shared by all the lanes, and must be thread-safe, unless `add_loader` is given a function that creates a
+        loader for each lane. Lane stages are named after the stage and the lane, such as "loader[0]".
+
+        The lanes are executed by the native engine (see `dcw.etl.engine`), so parallel transformations cannot be
+        added after a partitioner; the lanes themselves provide the parallelism. Partitioners cannot be nested.
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> loaders = []
+            >>> pipeline = ProcessingPipeline()
+            >>> pipeline.add_partitioner(lambda x: x % 2, partitions=2)
+            >>> pipeline.add_transform(lambda x: x * 10)
+            >>> pipeline.add_loader(lambda lane: loaders.append(ListLoader()) or loaders[-1])
+            >>> pipeline.extract(RecordExtractor(range(6)))
+            >>> sorted(loader.records for loader in loaders)
+            [[0, 20, 40], [10, 30, 50]]
+
+        Arguments:
+            key_func (Callable): Returns the key of a record. Keys must be hashable.
+            partitions (int): Number of lanes.
+            buffer_size (Optional[int]): Maximum number of records waiting for each lane. When a lane is full, pushing
+                a record for it blocks. Default: 1000.
+            name (Optional[str]): Name of the partitioner. Its lanes are named "{name}[0]", "{name}[1]" and so on.
+        """
+        if isinstance(self.current, _LaneStages):
+            raise ValueError("Partitioners cannot be nested")
+
+        lanes = native.Lanes(key_func, partitions, buffer_size=buffer_size or 1000, name=name or "partitioner")
+        if self.engine == "native":
+            partitioner = native.KeyPartition(self.current, lanes, stream_name=name)
+        else:
+            partitioner = KeyPartition(self.current, lanes, stream_name=name)
+        self.current = _LaneStages(partitioner, lanes.sources)
+
+    def add_batcher(self, size: int, *, name: Optional[str] = None, timeout: Optional[float] = None,
+                    max_bytes: Optional[int] = None, sizeof: Optional[Callable[[Any], int]] = None,
+                    target_latency: Optional[float] = None, max_size: Optional[int] = None) -> None:
         """Add a batcher to the pipeline.
 
         The batcher will build up batches of some size and emit them downstream.
 
+        If `max_bytes` is given, a batch is also emitted before it would exceed that many bytes, as estimated by
+        `sizeof` (by default, `dcw.etl.batching.estimate_size`). If `target_latency` is given, the batch size starts at
+        `size` and adapts so that processing a batch downstream of the batcher (typically, loading it) takes about that
+        many seconds: it grows while full batches are processed in time, and halves when one is not. See
+        `dcw.etl.batching.BatchSizer`; the current batch size is reported in the stage stats under "details".
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> batches = []
+            >>> pipeline = ProcessingPipeline()
+            >>> pipeline.add_batcher(100, max_bytes=10)
+            >>> pipeline.add_loader(ListLoader(batches))
+            >>> pipeline.extract(RecordExtractor(["aaaa", "bbbb", "cccc", "dddddddddddd", "e"]))
+            >>> batches
+            [('aaaa', 'bbbb'), ('cccc',), ('dddddddddddd',), ('e',)]
+
         Arguments:
-            size (int): Size of the batches.
+            size (int): Size of the batches, or the initial size if `target_latency` is given.
             name (Optional[str]): Name of the batcher.
             timeout (Optional[float]): Timeout in seconds after which the batcher will emit a partial batch.
+            max_bytes (Optional[int]): Maximum estimated size of a batch, in bytes.
+            sizeof (Optional[Callable]): Estimates the size of a record in bytes, for `max_bytes`.
+            target_latency (Optional[float]): Seconds that processing a batch should take, adapting the batch size.
+            max_size (Optional[int]): With `target_latency`, the largest batch size. Default: no limit.
         """
-        self.current = self.current.partition(size, timeout=timeout, stream_name=name)
+        if max_bytes is None and target_latency is None:
+            if sizeof is not None or max_size is not None:
+                raise ValueError("sizeof requires max_bytes, and max_size requires target_latency")
+            self.current = self.current.partition(size, timeout=timeout, stream_name=name)
+            return
+
+        new_sizer = functools.partial(BatchSizer, size, max_bytes=max_bytes, sizeof=sizeof,
+                                      target_latency=target_latency, max_size=max_size)
+        if isinstance(self.current, _LaneStages):
+            self.current = self.current.partition(size, timeout=timeout, stream_name=name, new_sizer=new_sizer)
+        elif self.engine == "native":
+            self.current = self.current.partition(size, timeout=timeout, stream_name=name, sizer=new_sizer())
+        else:
+            self.current = Batch(self.current, new_sizer(), timeout=timeout, stream_name=name)
+
+    def add_window(self, size: float, *, aggregates: dict[str, Aggregate], slide: Optional[float] = None,
+                   key: Optional[Callable[[Any], Hashable]] = None, timestamp: Optional[Callable[[Any], Any]] = None,
+                   lateness: float = 0.0, name: Optional[str] = None) -> None:
+        """Add a stage that aggregates records over windows of time, see `dcw.etl.window`.
+
+        Windows are tumbling, or sliding if `slide` is given, and are kept separately for each key if `key` is given.
+        Each window keeps only the running state of its aggregates, and emits a dict with its "key", "start", "end" and
+        the result of each aggregate when it closes. Windows based on processing time close as the clock passes their
+        end; windows based on event time (when `timestamp` is given) close as later records arrive. Any windows still
+        open at the end of `extract` are closed and emitted.
+
+        An open window holds on to its records until it closes, so `max_in_flight` in `extract` must be larger than the
+        number of windows that can be open at once.
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> from dcw.etl.window import Count, Max
+            >>> records = []
+            >>> pipeline = ProcessingPipeline()
+            >>> pipeline.add_window(10, timestamp=lambda x: x, aggregates={"n": Count(), "last": Max()})
+            >>> pipeline.add_loader(ListLoader(records))
+            >>> pipeline.extract(RecordExtractor([1, 4, 12, 25]))
+            >>> [(r["start"], r["n"], r["last"]) for r in records]
+            [(0.0, 2, 4), (10.0, 1, 12), (20.0, 1, 25)]
+
+        Arguments:
+            size (float): Length of each window, in seconds.
+            aggregates (dict[str, Aggregate]): The aggregates to compute for each window, by the name of their result.
+            slide (Optional[float]): Seconds between the starts of consecutive windows. Default: `size` (tumbling).
+            key (Optional[Callable]): Returns the key of a record.
+            timestamp (Optional[Callable]): Returns the event time of a record, in seconds since the epoch or as a
+                `datetime.datetime`. If None, windows are based on processing time.
+            lateness (float): With event time, seconds to keep a window open past its end for records that arrive out
+                of order.
+            name (Optional[str]): Name of the stage.
+        """
+        new_windower = functools.partial(Windower, size, slide=slide, aggregates=aggregates, key=key,
+                                         timestamp=timestamp, lateness=lateness)
+        if isinstance(self.current, _LaneStages):
+            self.current = self.current.window(new_windower, stream_name=name)
+        elif self.engine == "native":
+            self.current = self.current.window(new_windower(), stream_name=name)
+        else:
+            self.current = Window(self.current, new_windower(), stream_name=name)
+
+    def add_batch_transform(self, func: Callable[[Any], Any], size: int, *, timeout: Optional[float] = None,
+                            collect: Literal["numpy", "pandas", "arrow"] = "numpy", flatten: bool = True,
+                            name: Optional[str] = None) -> None:
+        """Add a vectorized transformation that is called once per batch of records.
+
+        Records are gathered into batches of up to `size` records (see `add_batcher`), and each batch is collected into
+        a NumPy array, a pandas DataFrame or an Arrow record batch before being passed to `func`. This makes operations
+        such as `x ** 2` cost one call per batch rather than one interpreter call per record.
+
+        If `flatten` is True, the output of `func` is split back into individual records (see
+        `dcw.etl.transform.to_records`) and emitted one at a time. Otherwise, the output is emitted as-is, and can be
+        split later with `add_flattener`.
+
+        This stage is made up of a batcher, a transformation and, if `flatten` is True, a flattener. When `name` is
+        given, they are named "{name}.batcher", "{name}" and "{name}.flattener".
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> records = []
+            >>> pipeline = ProcessingPipeline()
+            >>> pipeline.add_batch_transform(lambda x: x ** 2, 1000, timeout=0.1)
+            >>> pipeline.add_loader(ListLoader(records))
+            >>> pipeline.extract(RecordExtractor(range(5)))
+            >>> records
+            [0, 1, 4, 9, 16]
+
+        Arguments:
+            func (Callable): Callable that transforms a whole batch.
+            size (int): Maximum size of the batches.
+            timeout (Optional[float]): Timeout in seconds after which a partial batch is transformed.
+            collect (str): How each batch is collected before being passed to `func`, "numpy", "pandas" or "arrow". See
+                `dcw.etl.transform.VectorizedTransformation`.
+            flatten (bool): If True, emit the transformed records one at a time rather than as a batch.
+            name (Optional[str]): Name of the transformation.
+        """
+        self.add_batcher(size, timeout=timeout, name=f"{name}.batcher" if name else None)
+        self.add_transform(VectorizedTransformation(func, collect=collect, records=flatten), name=name)
+        if flatten:
+            self.add_flattener(name=f"{name}.flattener" if name else None)
 
     def add_flattener(self, *, name: Optional[str] = None) -> None:
         """Add a flattener to the pipeline.
@@ -184,7 +831,8 @@ class ProcessingPipeline:
         """
         self.current = self.current.flatten(stream_name=name)
 
-    def add_loader(self, loader: Loader, *, name: Optional[str] = None) -> None:
+    def add_loader(self, loader: Loader | Callable[[int], Loader], *, name: Optional[str] = None,
+                   queue_size: Optional[int] = None, workers: int = 1) -> None:
         """Add a loader to the pipeline.
 
         A Loader is used to store data somewhere. This may be a database, or a file, or a list, or something else.
@@ -194,24 +842,139 @@ class ProcessingPipeline:
 
         Think of loader as a sink that is pulling data through the pipeline.
 
+        After a partitioner (see `add_partitioner`), a Loader instance is shared by every lane. To give each lane its
+        own loader, pass a function that is called with the index of each lane and returns its loader.
+
+        By default, a loader is called on the thread that pushed the record, so a slow loader holds up the stages
+        upstream of it and any other loaders. If `queue_size` is given, records are instead put on a bounded queue and
+        loaded by `workers` threads of the loader's own (see `dcw.etl.engine.LoaderQueue`), so that loaders run in
+        parallel with each other and with the rest of the pipeline. Pushing a record only blocks once the queue is
+        full. A record still counts as in flight until it has been loaded, and `flush_loaders` waits for the queue to
+        drain before flushing the loader. With more than one worker, the loader must be thread-safe.
+
+        Examples:
+            >>> from dcw.etl.pipeline import ProcessingPipeline
+            >>> from dcw.etl.extract import RecordExtractor
+            >>> from dcw.etl.load import ListLoader
+            >>> records = []
+            >>> pipeline = ProcessingPipeline()
+            >>> pipeline.add_loader(ListLoader(records), queue_size=100)
+            >>> pipeline.extract(RecordExtractor(range(5)))
+            >>> records
+            [0, 1, 2, 3, 4]
+
         Arguments:
-            loader (Loader): Loader instance that will be used to load data.
+            loader (Loader | Callable): Loader instance that will be used to load data, or, after a partitioner, a
+                function that creates the loader of each lane.
             name (Optional[str]): Name of the loader.
+            queue_size (Optional[int]): If given, load records on worker threads, with at most this many records
+                waiting in the queue.
+            workers (int): Number of worker threads loading from the queue. Requires `queue_size`.
         """
-        self.current.sink(loader, stream_name=name)
-
-    def describe(self):
-        visited = []
+        if queue_size is None and workers != 1:
+            raise ValueError("workers requires a queue_size")
+
+        new_queue = None
+        if queue_size is not None:
+            new_queue = functools.partial(self._new_loader_queue, maxsize=queue_size, workers=workers)
+
+        if isinstance(self.current, _LaneStages):
+            lanes = range(len(self.current.stages))
+            self.current.sink([loader if isinstance(loader, Loader) else loader(i) for i in lanes], stream_name=name,
+                              new_queue=new_queue)
+        elif new_queue is None:
+            self.current.sink(loader, stream_name=name)
+        elif self.engine == "native":
+            native.QueuedSink(self.current, new_queue(loader, name), stream_name=name)
+        else:
+            QueuedSink(self.current, new_queue(loader, name), stream_name=name)
+
+    @staticmethod
+    def _new_loader_queue(loader: Loader | Callable[[Any], None], name: Optional[str], *, maxsize: int,
+                          workers: int) -> native.LoaderQueue:
+        return native.LoaderQueue(loader, maxsize=maxsize, workers=workers, name=name)
+
+    def _iter_streams(self) -> Iterable[streamz.Stream | native.Node]:
+        """Iterate over the streams in the pipeline, including those in the lanes of partitioners, breadth first."""
         queue = deque()
         queue.append(self.source)
+        seen = set()
 
         while queue:
             stream = queue.popleft()
-            visited.append(stream.name)
+            # the stages after a merge are reached from every merged branch
+            if id(stream) in seen:
+                continue
+            seen.add(id(stream))
+            yield stream
             for child in stream.downstreams:
                 queue.append(child)
+            if isinstance(stream, (KeyPartition, native.KeyPartition)):
+                queue.extend(stream.lanes.sources)
+
+    def _iter_loader_streams(self) -> Iterable[streamz.Stream | native.Node]:
+        """Iterate over the streams at the ends of the pipeline, which hold the loaders."""
+        for stream in self._iter_streams():
+            if 0 == len(stream.downstreams) and hasattr(stream, "func"):
+                yield stream
+
+    def _raise_stage_errors(self) -> None:
+        """Raise the first exception recorded by a stage that runs work outside of the calling thread, if any."""
+        for stream in self._iter_streams():
+            exception = getattr(stream, "exception", None)
+            if exception is not None:
+                raise exception
 
-        return visited
+    def describe(self):
+        return [stream.name for stream in self._iter_streams()]
+
+    @property
+    def stats_enabled(self) -> bool:
+        """Whether statistics are collected, see `enable_stats`."""
+        return self._stats_enabled
+
+    def enable_stats(self, *, memory: bool = False) -> None:
+        """Collect statistics for every stage of the pipeline, see `dcw.etl.stats`.
+
+        Counting and timing every record adds some overhead, so statistics are not collected unless enabled. Stages
+        added after this is called are included from the next call to `extract` or `stats`.
+
+        Arguments:
+            memory (bool): Also track the memory allocated by each stage. This has no effect unless `tracemalloc` is
+                tracing, and adds considerable overhead when it is.
+        """
+        self._stats_enabled = True
+        self._stats_memory = memory
+        for stream in self._iter_streams():
+            if getattr(stream, "stats", None) is not None:
+                stream.stats.memory = memory
+        self._instrument()
+
+    def _instrument(self) -> None:
+        """Attach stats to any stage that does not have them yet, if stats are enabled."""
+        if not self._stats_enabled:
+            return
+
+        for stream, name in new_stage_names(self._iter_streams()):
+            if isinstance(stream, native.Node):
+                stream.stats = StageStats(name, stage_kind(stream), memory=self._stats_memory)
+                stream.stats.details = getattr(stream, "details", None)
+                stream.source.invalidate()
+            else:
+                instrument_stream(stream, name, memory=self._stats_memory)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Get the statistics of each stage, keyed by a unique stage name.
+
+        The stage name is the name given when the stage was added or, if it has none, the kind of stage ("source",
+        "transform", "filter", "batcher", "flattener", "merge" or "loader"). A numeric suffix is added to names that
+        are used by more than one stage. Each value is a dict as returned by `dcw.etl.stats.StageStats.to_dict`.
+
+        This can be called while the pipeline is running. Returns an empty dict unless `enable_stats` was called.
+        """
+        self._instrument()
+        return {stream.stats.name: stream.stats.to_dict()
+                for stream in self._iter_streams() if getattr(stream, "stats", None) is not None}
 
     def get_loaders(self) -> Iterable[Loader]:
         """Get the loaders in the pipeline.
@@ -219,21 +982,128 @@ class ProcessingPipeline:
         Returns:
             Iterable[Loader]: Iterable of Loader instances.
         """
-        queue = deque()
-        queue.append(self.source)
-
-        while queue:
-            stream = queue.popleft()
-            if 0 == len(stream.downstreams):
+        seen = set()
+        for stream in self._iter_loader_streams():
+            if id(stream.func) not in seen:
+                seen.add(id(stream.func))
                 yield stream.func
-            for child in stream.downstreams:
-                queue.append(child)
 
     def flush_loaders(self) -> None:
+        """Flush every loader in the pipeline.
+
+        Loaders are flushed concurrently, each on its own thread, so that a slow loader does not delay the others. A
+        queued loader (see `add_loader`) is flushed once its queue has drained. The first exception raised by a loader
+        is raised once every loader has been flushed.
+        """
         logger.debug("Flushing loaders")
-        for loader in self.get_loaders():
-            logger.debug(f"Flushing loader {loader}")
-            loader.flush()
+        # a loader shared by the lanes of a partitioner is flushed once, after each lane's queue has drained
+        streams: dict[int, list[streamz.Stream | native.Node]] = {}
+        for stream in self._iter_loader_streams():
+            streams.setdefault(id(stream.func), []).append(stream)
+
+        if len(streams) <= 1:
+            for group in streams.values():
+                self._flush_loader(group)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(len(streams), thread_name_prefix="flush") as executor:
+            futures = [executor.submit(self._flush_loader, group) for group in streams.values()]
+        for future in futures:
+            future.result()
+
+    @staticmethod
+    def _flush_loader(streams: list[streamz.Stream | native.Node]) -> None:
+        """Flush the loader of `streams`, which all share it, once their queues have drained."""
+        for stream in streams:
+            if isinstance(stream, (QueuedSink, native.QueuedSink)):
+                stream.flush()
+
+        stream = streams[0]
+        logger.debug(f"Flushing loader {stream.func}")
+        start = time.perf_counter()
+        stream.func.flush()
+        if getattr(stream, "stats", None) is not None:
+            stream.stats.record_flush(time.perf_counter() - start)
+
+
+class PipelineBranch:
+    """A branch of a `ProcessingPipeline`, see `ProcessingPipeline.branch`.
+
+    Stages are added to a branch with the same methods, and arguments, as they are added to the pipeline. Everything
+    else, such as extracting, stats and flushing the loaders, is done through the pipeline.
+
+    Attributes:
+        pipeline (ProcessingPipeline): The pipeline the branch belongs to.
+        current: The last stage of the branch.
+    """
+
+    def __init__(self, pipeline: ProcessingPipeline, current: streamz.Stream | native.Node | _LaneStages) -> None:
+        self.pipeline = pipeline
+        self.current = current
+
+    @property
+    def end_name(self):
+        return self.current.name
+
+    def _add(self, method: Callable[..., None], *args, **kwargs) -> None:
+        """Call a method of the pipeline that adds a stage, so that it adds the stage to the end of this branch."""
+        end = self.pipeline.current
+        self.pipeline.current = self.current
+        try:
+            method(*args, **kwargs)
+            self.current = self.pipeline.current
+        finally:
+            self.pipeline.current = end
+
+    def add_transform(self, *args, **kwargs) -> None:
+        """Add a transformation to the branch, see `ProcessingPipeline.add_transform`."""
+        self._add(self.pipeline.add_transform, *args, **kwargs)
+
+    def add_parallel_transform(self, *args, **kwargs) -> None:
+        """Add a transformation run on a pool of threads, see `ProcessingPipeline.add_parallel_transform`."""
+        self._add(self.pipeline.add_parallel_transform, *args, **kwargs)
+
+    def add_process_transform(self, *args, **kwargs) -> None:
+        """Add a transformation run on a pool of processes, see `ProcessingPipeline.add_process_transform`."""
+        self._add(self.pipeline.add_process_transform, *args, **kwargs)
+
+    def add_deduplicator(self, *args, **kwargs) -> None:
+        """Add a deduplicator to the branch, see `ProcessingPipeline.add_deduplicator`."""
+        self._add(self.pipeline.add_deduplicator, *args, **kwargs)
+
+    def add_partitioner(self, *args, **kwargs) -> None:
+        """Add a partitioner to the branch, see `ProcessingPipeline.add_partitioner`."""
+        self._add(self.pipeline.add_partitioner, *args, **kwargs)
+
+    def add_batcher(self, *args, **kwargs) -> None:
+        """Add a batcher to the branch, see `ProcessingPipeline.add_batcher`."""
+        self._add(self.pipeline.add_batcher, *args, **kwargs)
+
+    def add_window(self, *args, **kwargs) -> None:
+        """Add a windowed aggregation to the branch, see `ProcessingPipeline.add_window`."""
+        self._add(self.pipeline.add_window, *args, **kwargs)
+
+    def add_batch_transform(self, *args, **kwargs) -> None:
+        """Add a vectorized transformation to the branch, see `ProcessingPipeline.add_batch_transform`."""
+        self._add(self.pipeline.add_batch_transform, *args, **kwargs)
+
+    def add_flattener(self, *args, **kwargs) -> None:
+        """Add a flattener to the branch, see `ProcessingPipeline.add_flattener`."""
+        self._add(self.pipeline.add_flattener, *args, **kwargs)
+
+    def add_loader(self, *args, **kwargs) -> None:
+        """Add a loader to the branch, see `ProcessingPipeline.add_loader`."""
+        self._add(self.pipeline.add_loader, *args, **kwargs)
+
+    def branch(self) -> "PipelineBranch":
+        """Start a branch at the current end of this branch, see `ProcessingPipeline.branch`."""
+        branch = PipelineBranch(self.pipeline, self.current)
+        self.pipeline._branches.append(branch)
+        return branch
+
+    def merge(self, *branches: "PipelineBranch", name: Optional[str] = None) -> None:
+        """Merge other branches into this one, see `ProcessingPipeline.merge`."""
+        self.current = self.pipeline._merge(self.current, branches, name)
 
 
 class PipelineFactory(abc.ABC):
@@ -247,6 +1117,9 @@ class PipelineFactory(abc.ABC):
     The `Options` subclass is intended to be used to define the options that will be used to configure the pipeline and
     extractor.
 
+    Factories for network-bound pipelines may return an `AsyncProcessingPipeline` from `get_pipeline` and/or an
+    `AsyncExtractor` from `get_extractor`. These are detected and run on an event loop by `run_pipeline`.
+
     Examples:
         A full pipeline which can be run from the command line or another script:
         >>> from dcw.etl.load import ListLoader
@@ -294,26 +1167,26 @@ class PipelineFactory(abc.ABC):
         return iter([])
 
     @abc.abstractmethod
-    def get_pipeline(self, opts: Options) -> ProcessingPipeline:
+    def get_pipeline(self, opts: Options) -> ProcessingPipeline | AsyncProcessingPipeline:
         """Get the data processing pipeline that will be used to process extracted data.
 
         Arguments:
             opts (Options): Options instance.
 
         Returns:
-            ProcessingPipeline: ProcessingPipeline instance.
+            ProcessingPipeline | AsyncProcessingPipeline: The pipeline instance.
         """
         pass
 
     @abc.abstractmethod
-    def get_extractor(self, opts: Options) -> Extractor:
+    def get_extractor(self, opts: Options) -> Extractor | AsyncExtractor:
         """Get the extractor that will produce data to be processed by the pipeline.
 
         Arguments:
             opts (Options): Options instance.
 
         Returns:
-            Extractor: Extractor instance.
+            Extractor | AsyncExtractor: The extractor instance.
         """
         pass
 
@@ -367,27 +1240,112 @@ class PipelineFactory(abc.ABC):
         return cls.Options(**vars(args))
 
 
-def run_pipeline(factory: PipelineFactory, opts: PipelineFactory.Options | None = None) -> None:
+def run_pipeline(factory: PipelineFactory, opts: PipelineFactory.Options | None = None, *,
+                 max_in_flight: int | None = None,
+                 setup: Callable[[ProcessingPipeline | AsyncProcessingPipeline], None] | None = None,
+                 checkpoint: Checkpoint | None = None, shard: tuple[int, int] | None = None) -> None:
     """Run a pipeline using the given factory and options.
 
     The factory will be used to create the pipeline and extractor, and then the pipeline will be used to process all
     records produced by the extractor, by calling `pipeline.extract(extractor)`.
 
+    If `shard` is given as `(index, count)`, only shard `index` of `count` of the records is processed (see
+    `dcw.etl.extract.shard_extractor`), so that `count` runs, typically in separate processes, divide the records
+    between them. `dcw-pipeline run --workers N` does this.
+
+    If the factory produces an `AsyncProcessingPipeline` or an `AsyncExtractor`, the pipeline is run on a new event
+    loop (see `arun_pipeline`).
+
+    Args:
+        factory: The factory to use to create the pipeline and extractor.
+        opts: Optional. The options to use to create the pipeline and extractor. If not provided, the default options
+            will be constructed using the `PipelineFactory.Options` class.
+        max_in_flight: Optional. Maximum number of records that have been extracted but not yet fully processed. See
+            `ProcessingPipeline.extract`.
+        setup: Optional. Called with the pipeline before extraction starts, for example to enable stats.
+        checkpoint: Optional. Save the progress of the extraction, and possibly resume from a previous run. See
+            `dcw.etl.checkpoint`. Not supported for async pipelines and extractors.
+        shard: Optional. The index of the shard of the records to process, and the number of shards. Not supported
+            for async extractors.
+    """
+    if opts is None:
+        opts = factory.Options()
+
+    pipeline = factory.get_pipeline(opts)
+    extractor = factory.get_extractor(opts)
+    if shard is not None:
+        extractor = shard_extractor(extractor, *shard)
+
+    if setup is not None:
+        setup(pipeline)
+
+    if isinstance(pipeline, AsyncProcessingPipeline) or is_async_extractor(extractor):
+        if checkpoint is not None:
+            raise ValueError("Checkpoints are not supported for async pipelines and extractors")
+        asyncio.run(_arun(pipeline, extractor, max_in_flight=max_in_flight))
+        return
+
+    logger.debug(f"Starting extraction for '{pipeline.name}'")
+    pipeline.extract(extractor, max_in_flight=max_in_flight, checkpoint=checkpoint)
+    logger.debug(f"Pipeline extraction for '{pipeline.name}' finished")
+
+
+async def arun_pipeline(factory: PipelineFactory, opts: PipelineFactory.Options | None = None, *,
+                        max_in_flight: int | None = None,
+                        setup: Callable[[ProcessingPipeline | AsyncProcessingPipeline], None] | None = None) -> None:
+    """Run a pipeline using the given factory and options on the running event loop.
+
+    This is the asynchronous counterpart to `run_pipeline`. Any combination of regular and async pipelines and
+    extractors is supported. A regular `ProcessingPipeline` is run on a separate thread so that it does not block the
+    event loop, which continues to drive an async extractor.
+
     Args:
         factory: The factory to use to create the pipeline and extractor.
         opts: Optional. The options to use to create the pipeline and extractor. If not provided, the default options
             will be constructed using the `PipelineFactory.Options` class.
+        max_in_flight: Optional. Maximum number of records being processed at once.
+        setup: Optional. Called with the pipeline before extraction starts, for example to enable stats.
     """
     if opts is None:
         opts = factory.Options()
 
     pipeline = factory.get_pipeline(opts)
     extractor = factory.get_extractor(opts)
+
+    if setup is not None:
+        setup(pipeline)
+
+    await _arun(pipeline, extractor, max_in_flight=max_in_flight)
+
+
+async def _arun(pipeline: ProcessingPipeline | AsyncProcessingPipeline, extractor: Extractor | AsyncExtractor, *,
+                max_in_flight: int | None = None) -> None:
     logger.debug(f"Starting extraction for '{pipeline.name}'")
-    pipeline.extract(extractor)
+    if isinstance(pipeline, AsyncProcessingPipeline):
+        await pipeline.extract(extractor, max_in_flight=max_in_flight)
+    else:
+        if is_async_extractor(extractor):
+            extractor = _BlockingExtractor(extractor, asyncio.get_running_loop())
+        await asyncio.to_thread(pipeline.extract, extractor, max_in_flight=max_in_flight)
     logger.debug(f"Pipeline extraction for '{pipeline.name}' finished")
 
 
+class _BlockingExtractor(Extractor):
+    """Iterate over the records of an async extractor from a thread other than the event loop's."""
+
+    def __init__(self, extractor: AsyncExtractor, loop: asyncio.AbstractEventLoop) -> None:
+        self.extractor = extractor
+        self.loop = loop
+
+    def iter_records(self):
+        records = aiter_records(self.extractor)
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(anext(records), self.loop).result()
+            except StopAsyncIteration:
+                return
+
+
 def get_factory_class_by_path(path: str) -> type[PipelineFactory]:
     """Get a PipelineFactory by name.
 
@@ -0,0 +1,79 @@
+"""Profile pipeline runs with `cProfile`.
+
+`cProfile` only profiles the thread it is enabled on, but pipelines do much of their work on other threads: streamz
+runs batchers on an event loop thread, and parallel transformations run on thread pools. `profile` also profiles every
+thread started while it is active, and merges the results into a single dump that can be read with `pstats` or tools
+such as `snakeviz`.
+
+Threads must be started inside the `profile` block to be profiled, so the pipeline should be created inside it too.
+
+Examples:
+    >>> import pstats
+    >>> import tempfile
+    >>> from dcw.etl.pipeline import ProcessingPipeline
+    >>> from dcw.etl.extract import RecordExtractor
+    >>> from dcw.etl.load import ListLoader
+    >>> def square(x):
+    ...     return x ** 2
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     with profile(f"{tmpdir}/out.prof"):
+    ...         pipeline = ProcessingPipeline()
+    ...         pipeline.add_parallel_transform(square, workers=2)
+    ...         pipeline.add_loader(ListLoader())
+    ...         pipeline.extract(RecordExtractor(range(10)))
+    ...     stats = pstats.Stats(f"{tmpdir}/out.prof")
+    >>> [calls for (_, _, name), (_, calls, *_) in stats.stats.items() if name == "square"]
+    [10]
+"""
+
+import contextlib
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def profile(path: str | Path) -> Iterator[None]:
+    """Profile the calling thread, and every thread started in the block, writing the merged stats to `path`.
+
+    Arguments:
+        path (str | pathlib.Path): The file to write the profile to, in the `pstats` format.
+    """
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+    per_thread = sys.version_info < (3, 12)  # from 3.12, cProfile profiles every thread
+
+    def start_thread_profiler(frame, event, arg):
+        # called on the first profiling event of each new thread; enabling the profiler replaces this hook
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    if per_thread:
+        threading.setprofile(start_thread_profiler)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        if per_thread:
+            threading.setprofile(None)
+
+        with lock:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                try:
+                    stats.add(profiler)
+                except TypeError:
+                    # the thread did not make any calls that were profiled
+                    pass
+
+        stats.dump_stats(str(path))
+        logger.info(f"Wrote profile to {path}")
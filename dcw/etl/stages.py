@@ -0,0 +1,498 @@
+"""Custom stream nodes used by `dcw.etl.pipeline.ProcessingPipeline`.
+
+The nodes in this module extend `streamz.Stream` to provide behavior that the built-in streamz nodes do not, such as
+applying transformations concurrently. They take part in the same reference counting as the built-in nodes, so the
+completion callbacks used by `ProcessingPipeline.extract` fire only after a record has made it all the way through the
+pipeline.
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Optional
+
+import streamz
+
+from dcw.etl.batching import BatchSizer
+from dcw.etl.engine import Lanes, LoaderQueue
+from dcw.etl.window import Windower
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+    """A unit of work submitted to an executor along with the metadata of the record(s) it carries."""
+    __slots__ = ("future", "metadata", "size", "parts", "started")
+
+    def __init__(self, metadata: list, size: int = 1) -> None:
+        self.started = time.perf_counter()
+        self.future: Optional[Future] = None
+        self.metadata = metadata
+        self.size = size
+        self.parts: list[list] = []
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+
+def _apply_chunk(func: Callable[[Any], Any], chunk: list) -> list:
+    """Apply `func` to each element of `chunk`, in a worker."""
+    return [func(x) for x in chunk]
+
+
+class ExecutorMap(streamz.Stream):
+    """Apply a function to every element in the stream using a `concurrent.futures.Executor`.
+
+    At most `max_pending` elements are in the executor or waiting to be emitted at any time. When that limit is
+    reached, `update` blocks until a slot frees up, pushing back on whatever is feeding the stream. When `ordered` is
+    True, results are emitted in the order their inputs arrived; the pending elements double as the reorder buffer.
+
+    Results are emitted downstream one at a time, from whichever thread completed the work. If the stream is bound to
+    an event loop (for example because a batcher is part of the pipeline), emitting is handed off to that loop instead.
+
+    If the function raises, the exception is logged, the element is dropped (its references are released so that
+    completion tracking is not left waiting on it), and the exception is stored in `exception`. It is raised from the
+    next call to `update`.
+
+    Attributes:
+        func (Callable): The function applied to each element.
+        executor (concurrent.futures.Executor): The executor the function is run on.
+        ordered (bool): Whether results are emitted in input order.
+        exception (Optional[BaseException]): The first exception raised by the function, if any.
+        stats (Optional[dcw.etl.stats.StageStats]): If set, the time from each element arriving to its result being
+            ready to emit, and any errors, are recorded here.
+    """
+
+    def __init__(self, upstream: streamz.Stream, func: Callable[[Any], Any], executor: Executor, *,
+                 max_pending: int, ordered: bool = True, stream_name: Optional[str] = None) -> None:
+        """Create a new ExecutorMap.
+
+        Arguments:
+            upstream (streamz.Stream): The stream this node receives elements from.
+            func (Callable): The function to apply to each element.
+            executor (concurrent.futures.Executor): The executor to run the function on.
+            max_pending (int): Maximum number of elements being processed or waiting to be emitted.
+            ordered (bool): If True, emit results in the order the inputs were received.
+            stream_name (Optional[str]): Name of the stream.
+        """
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be at least 1, got {max_pending}")
+        self.func = func
+        self.executor = executor
+        self.ordered = ordered
+        self.exception: Optional[BaseException] = None
+        self.stats = None
+        self._slots = threading.Semaphore(max_pending)
+        self._lock = threading.RLock()
+        self._pending: deque[_Task] = deque()
+        streamz.Stream.__init__(self, upstream, stream_name=stream_name)
+
+    def update(self, x, who=None, metadata=None):
+        if self.exception is not None:
+            raise self.exception
+
+        metadata = list(metadata) if metadata else []
+        self._retain_refs(metadata)
+
+        with self._lock:
+            self._enqueue(x, metadata)
+
+        if self.loop is None:
+            self._slots.acquire()
+        else:
+            # never block the event loop; emitting results requires it to be running
+            return self._acquire_slot()
+
+    async def _acquire_slot(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            await self.loop.run_in_executor(None, self._slots.acquire)
+
+    def _enqueue(self, x, metadata: list) -> None:
+        """Queue element `x` for processing. Called with the lock held."""
+        task = _Task(metadata)
+        self._pending.append(task)
+        self._submit(task, self.func, x)
+
+    def _submit(self, task: _Task, fn: Callable, *args) -> None:
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception as e:
+            # report the failure (e.g. a broken executor) the same way as an error raised by the function
+            future = Future()
+            future.set_exception(e)
+        task.future = future
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: Future) -> None:
+        if self.loop is None:
+            self._drain()
+        else:
+            self.loop.add_callback(self._drain)
+
+    def _drain(self) -> None:
+        """Emit the results of completed tasks, respecting ordering if required."""
+        with self._lock:
+            if self.ordered:
+                while self._pending and self._pending[0].done():
+                    self._finish(self._pending.popleft())
+            else:
+                pending = self._pending
+                self._pending = deque()
+                for task in pending:
+                    if task.done():
+                        self._finish(task)
+                    else:
+                        self._pending.append(task)
+
+    def _emit_results(self, task: _Task) -> None:
+        self._emit(task.future.result(), metadata=task.metadata)
+
+    def _finish(self, task: _Task) -> None:
+        finished = time.perf_counter()
+        failed = False
+        try:
+            self._emit_results(task)
+        except Exception as e:
+            failed = True
+            logger.exception(f"Error in stage {self}")
+            if self.exception is None:
+                self.exception = e
+        finally:
+            if self.stats is not None:
+                self.stats.record(errors=task.size if failed else 0, elapsed=finished - task.started,
+                                  samples=task.size)
+            self._release_refs(task.metadata)
+            self._slots.release(task.size)
+
+
+class ChunkedExecutorMap(ExecutorMap):
+    """Apply a function to every element in the stream, sending elements to the executor in chunks.
+
+    This is intended for use with a `concurrent.futures.ProcessPoolExecutor`, where each submission has to be pickled
+    and sent to a worker process. Sending elements in chunks spreads that cost over many elements.
+
+    A chunk is submitted once it holds `chunksize` elements, or as soon as fewer than `workers` chunks are being
+    processed. This keeps the workers busy when elements arrive slowly, and makes sure a partially filled chunk is not
+    left waiting for elements that may never come.
+
+    If the function raises for any element of a chunk, every element in that chunk is dropped. Otherwise, errors are
+    handled the same way as in `ExecutorMap`, including errors that take down the executor, such as a worker process
+    that crashes.
+
+    Attributes:
+        chunksize (int): Maximum number of elements sent to the executor in one submission.
+        workers (int): Number of workers the executor has.
+    """
+
+    def __init__(self, upstream: streamz.Stream, func: Callable[[Any], Any], executor: Executor, *,
+                 chunksize: int, workers: int, max_pending: int, ordered: bool = True,
+                 stream_name: Optional[str] = None) -> None:
+        """Create a new ChunkedExecutorMap.
+
+        Arguments:
+            upstream (streamz.Stream): The stream this node receives elements from.
+            func (Callable): The function to apply to each element. Must be picklable to use a process pool.
+            executor (concurrent.futures.Executor): The executor to run the function on.
+            chunksize (int): Maximum number of elements sent to the executor in one submission.
+            workers (int): Number of workers the executor has.
+            max_pending (int): Maximum number of elements being processed or waiting to be emitted.
+            ordered (bool): If True, emit results in the order the inputs were received.
+            stream_name (Optional[str]): Name of the stream.
+        """
+        if chunksize < 1:
+            raise ValueError(f"chunksize must be at least 1, got {chunksize}")
+        self.chunksize = chunksize
+        self.workers = workers
+        self._chunk: list = []
+        self._open: Optional[_Task] = None
+        self._in_flight = 0
+        super().__init__(upstream, func, executor, max_pending=max_pending, ordered=ordered,
+                         stream_name=stream_name)
+
+    def _enqueue(self, x, metadata: list) -> None:
+        if self._open is None:
+            self._open = _Task([], size=0)
+            self._pending.append(self._open)
+
+        task = self._open
+        task.size += 1
+        task.parts.append(metadata)
+        task.metadata.extend(metadata)
+        self._chunk.append(x)
+
+        if task.size >= self.chunksize or self._in_flight < self.workers:
+            self._submit_open_chunk()
+
+    def _submit_open_chunk(self) -> None:
+        task, chunk = self._open, self._chunk
+        self._open, self._chunk = None, []
+        self._in_flight += 1
+        self._submit(task, _apply_chunk, self.func, chunk)
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if self._open is not None and self._in_flight < self.workers:
+                self._submit_open_chunk()
+        super()._on_done(future)
+
+    def _emit_results(self, task: _Task) -> None:
+        for result, metadata in zip(task.future.result(), task.parts):
+            self._emit(result, metadata=metadata)
+
+
+class KeyPartition(streamz.Stream):
+    """Send each element to one of several lanes by key, see `dcw.etl.engine.Lanes`.
+
+    The lanes are natively executed pipelines, separate from the streamz graph, so this node has no downstreams. The
+    references of an element are released once it has made it through its lane. When a lane is full, `update` blocks
+    or, if the stream is bound to an event loop, waits for room without blocking the loop.
+
+    Attributes:
+        lanes (dcw.etl.engine.Lanes): The lanes.
+        exception (Optional[BaseException]): The first exception raised by a lane, if any. It is raised from the next
+            call to `update`.
+        stats (Optional[dcw.etl.stats.StageStats]): If set, elements sent to a lane are counted as emitted.
+    """
+
+    def __init__(self, upstream: streamz.Stream, lanes: Lanes, *, stream_name: Optional[str] = None) -> None:
+        self.lanes = lanes
+        self.stats = None
+        streamz.Stream.__init__(self, upstream, stream_name=stream_name)
+
+    @property
+    def exception(self) -> Optional[BaseException]:
+        return self.lanes.exception
+
+    def update(self, x, who=None, metadata=None):
+        if self.lanes.exception is not None:
+            raise self.lanes.exception
+
+        metadata = list(metadata) if metadata else []
+        self._retain_refs(metadata)
+        done = functools.partial(self._release_refs, metadata)
+        if self.stats is not None:
+            self.stats.record(records_out=1)
+
+        if self.loop is None:
+            self.lanes.submit(x, done)
+        elif not self.lanes.submit(x, done, block=False):
+            return self._submit_later(x, done)
+
+    async def _submit_later(self, x, done: Callable[[], None]) -> None:
+        await self.loop.run_in_executor(None, functools.partial(self.lanes.submit, x, done))
+
+    def flush(self) -> None:
+        """Emit the partial batches held in the lanes, once they have taken every queued element."""
+        self.lanes.flush()
+
+
+class Batch(streamz.Stream):
+    """Collect elements into tuples, emitting a batch when a `dcw.etl.batching.BatchSizer` decides it is full.
+
+    Unlike `streamz.partition`, batches can be capped by the estimated size of their elements in bytes, and their
+    size can adapt to the time taken to process them downstream. If a `timeout` is given, the stream is bound to an
+    event loop, which emits a partial batch once its first element has been waiting for that many seconds.
+
+    Attributes:
+        sizer (dcw.etl.batching.BatchSizer): Decides when a batch is full.
+        timeout (Optional[float]): Seconds after which a partial batch is emitted.
+    """
+
+    def __init__(self, upstream: streamz.Stream, sizer: BatchSizer, *, timeout: Optional[float] = None,
+                 stream_name: Optional[str] = None) -> None:
+        self.sizer = sizer
+        self.timeout = timeout
+        self._buffer: list = []
+        self._metadata: list = []
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._timer = None
+        kwargs = {} if timeout is None else {"ensure_io_loop": True}
+        streamz.Stream.__init__(self, upstream, stream_name=stream_name, **kwargs)
+
+    @property
+    def details(self) -> Callable[[], dict[str, Any]]:
+        return self.sizer.stats
+
+    def update(self, x, who=None, metadata=None):
+        metadata = list(metadata) if metadata else []
+        nbytes = self.sizer.measure(x)
+        with self._lock:
+            results = []
+            if self._buffer and not self.sizer.fits(self._bytes, nbytes):
+                results.extend(self._emit_batch())
+            self._retain_refs(metadata)
+            self._buffer.append(x)
+            self._metadata.extend(metadata)
+            self._bytes += nbytes
+            if self.sizer.full(len(self._buffer), self._bytes):
+                results.extend(self._emit_batch())
+            elif self.timeout is not None and len(self._buffer) == 1:
+                self._timer = self.loop.call_later(self.timeout, self._on_timeout)
+        return results
+
+    def _emit_batch(self) -> list:
+        """Emit the buffered elements as a batch and release their references. Called with the lock held."""
+        batch, metadata = tuple(self._buffer), self._metadata
+        self._buffer, self._metadata, self._bytes = [], [], 0
+        if self._timer is not None:
+            self.loop.remove_timeout(self._timer)
+            self._timer = None
+
+        start = time.perf_counter()
+        try:
+            results = self._emit(batch, metadata=metadata)
+        finally:
+            self._release_refs(metadata)
+        self.sizer.observe(len(batch), time.perf_counter() - start)
+        return results
+
+    def _on_timeout(self) -> None:
+        with self._lock:
+            self._timer = None
+            if self._buffer:
+                self._emit_batch()
+
+    def flush(self) -> None:
+        """Emit the current partial batch, if any."""
+        if self.loop is None:
+            self._flush()
+        else:
+            streamz.core.sync(self.loop, self._flush_async)
+
+    def _flush(self) -> None:
+        with self._lock:
+            if self._buffer:
+                self._emit_batch()
+
+    async def _flush_async(self) -> None:
+        self._flush()
+
+
+class QueuedSink(streamz.sinks.Sink):
+    """Pass every element to a `dcw.etl.engine.LoaderQueue`, which loads it on a worker thread.
+
+    The references of an element are released once it has been loaded. When the queue is full, `update` blocks or, if
+    the stream is bound to an event loop, waits for room without blocking the loop.
+
+    Attributes:
+        queue (dcw.etl.engine.LoaderQueue): The queue.
+        func (Loader | Callable): The loader.
+        exception (Optional[BaseException]): The first exception raised by the loader, if any. It is raised from the
+            next call to `update`.
+    """
+
+    def __init__(self, upstream: streamz.Stream, queue: LoaderQueue, *, stream_name: Optional[str] = None) -> None:
+        self.queue = queue
+        self.func = queue.loader
+        # registered as a sink, so that it is kept alive although streamz only holds weak references to downstreams
+        streamz.sinks.Sink.__init__(self, upstream, stream_name=stream_name)
+
+    @property
+    def stats(self):
+        return self.queue.stats
+
+    @stats.setter
+    def stats(self, stats) -> None:
+        self.queue.stats = stats
+
+    @property
+    def exception(self) -> Optional[BaseException]:
+        return self.queue.exception
+
+    @property
+    def details(self) -> Callable[[], dict[str, Any]]:
+        return self.queue.details
+
+    def update(self, x, who=None, metadata=None):
+        if self.queue.exception is not None:
+            raise self.queue.exception
+
+        metadata = list(metadata) if metadata else []
+        self._retain_refs(metadata)
+        done = functools.partial(self._release_refs, metadata)
+
+        if self.loop is None:
+            self.queue.submit(x, done)
+        elif not self.queue.submit(x, done, block=False):
+            return self._submit_later(x, done)
+
+    async def _submit_later(self, x, done: Callable[[], None]) -> None:
+        await self.loop.run_in_executor(None, functools.partial(self.queue.submit, x, done))
+
+    def flush(self) -> None:
+        """Wait until every queued element has been loaded."""
+        self.queue.join()
+
+
+class Window(streamz.Stream):
+    """Aggregate elements over windows of time, see `dcw.etl.window`.
+
+    The references of an element are held until every window it was added to has closed. With processing time, the
+    stream is bound to an event loop, which closes windows as they end.
+
+    Attributes:
+        windower (dcw.etl.window.Windower): Assigns elements to windows and computes their aggregates.
+    """
+
+    def __init__(self, upstream: streamz.Stream, windower: Windower, *, stream_name: Optional[str] = None) -> None:
+        self.windower = windower
+        self._refs: dict[Any, list] = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        kwargs = {} if windower.event_time else {"ensure_io_loop": True}
+        streamz.Stream.__init__(self, upstream, stream_name=stream_name, **kwargs)
+
+    @property
+    def details(self) -> Callable[[], dict[str, Any]]:
+        return self.windower.stats
+
+    def update(self, x, who=None, metadata=None):
+        metadata = list(metadata) if metadata else []
+        with self._lock:
+            added, closed = self.windower.add(x)
+            for window in added:
+                self._retain_refs(metadata)
+                self._refs.setdefault(window, []).extend(metadata)
+            result = self._emit_closed(closed)
+            if not self.windower.event_time:
+                self._schedule()
+        return result
+
+    def _emit_closed(self, closed: list[tuple[Any, dict]]) -> list:
+        """Emit the results of closed windows and release the references of their elements."""
+        results = []
+        for window, result in closed:
+            metadata = self._refs.pop(window, [])
+            results.extend(self._emit(result, metadata=metadata))
+            self._release_refs(metadata)
+        return results
+
+    def _schedule(self) -> None:
+        end = self.windower.next_end()
+        if end is not None and self._timer is None:
+            self._timer = self.loop.call_later(max(0.0, end - self.windower.clock()), self._on_timer)
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._emit_closed(self.windower.close_due())
+            self._schedule()
+
+    def flush(self) -> None:
+        """Close and emit every open window."""
+        if self.loop is None:
+            self._flush()
+        else:
+            streamz.core.sync(self.loop, self._flush_async)
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._emit_closed(self.windower.flush())
+
+    async def _flush_async(self) -> None:
+        self._flush()
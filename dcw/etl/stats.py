@@ -0,0 +1,404 @@
+"""Per-stage counters and latency histograms for processing pipelines.
+
+Once `ProcessingPipeline.enable_stats()` (or `AsyncProcessingPipeline.enable_stats()`) has been called, every stage of
+the pipeline keeps a `StageStats`:
+
+- `records_in`: records (or batches) received by the stage.
+- `records_out`: records emitted downstream. For a loader, the records loaded without error.
+- `errors`: records for which the stage raised an exception.
+- `time`: cumulative seconds spent in the stage itself. Time spent in downstream stages is not included, so the stage
+  with the largest `time` is the one limiting throughput. For parallel transformations, this is the time from a record
+  entering the stage to its result being emitted, summed over records.
+- `latency`: a histogram of the time each record spent in the stage.
+- `flushes` and `flush_time`: for a loader, the number of times it was flushed and the seconds spent flushing.
+- `details`: stage-specific statistics, such as the memory footprint and false-positive rate of a deduplicator (see
+  `dcw.etl.dedup`).
+- `allocated`: if enabled with `enable_stats(memory=True)`, the net bytes allocated by the stage, excluding downstream
+  stages, as measured by `tracemalloc` (which must be started separately). Memory is process-wide, so this is only
+  accurate for stages that run while nothing else is allocating, and not at all for parallel transformations.
+
+Statistics can be read at any time, including while the pipeline is running, with `pipeline.stats()`.
+
+Examples:
+    >>> from dcw.etl.pipeline import ProcessingPipeline
+    >>> from dcw.etl.extract import RecordExtractor
+    >>> from dcw.etl.load import ListLoader
+    >>> pipeline = ProcessingPipeline()
+    >>> pipeline.add_transform(lambda x: x ** 2, name="square")
+    >>> pipeline.add_batcher(2, name="batch")
+    >>> pipeline.add_loader(ListLoader(), name="load")
+    >>> pipeline.enable_stats()
+    >>> pipeline.extract(RecordExtractor(range(4)))
+    >>> stats = pipeline.stats()
+    >>> [(name, s["kind"], s["records_in"], s["records_out"]) for name, s in stats.items()]
+    [('source', 'source', 4, 4), ('square', 'transform', 4, 4), ('batch', 'batcher', 4, 2), ('load', 'loader', 2, 2)]
+"""
+
+import math
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Iterable, Optional
+
+import tabulate
+
+# stage kinds, by the class name of the node that implements the stage
+_KINDS = {
+    "Stream": "source",
+    "Source": "source",
+    "_Stage": "source",
+    "map": "transform",
+    "Map": "transform",
+    "_Map": "transform",
+    "ExecutorMap": "transform",
+    "ChunkedExecutorMap": "transform",
+    "filter": "filter",
+    "Filter": "filter",
+    "KeyPartition": "partitioner",
+    "union": "merge",
+    "Union": "merge",
+    "Window": "window",
+    "partition": "batcher",
+    "Batch": "batcher",
+    "_Batch": "batcher",
+    "flatten": "flattener",
+    "Flatten": "flattener",
+    "_Flatten": "flattener",
+    "sink": "loader",
+    "Sink": "loader",
+    "_Sink": "loader",
+    "QueuedSink": "loader",
+}
+
+# time spent in downstream stages by each stage currently being updated on this thread
+_frames = threading.local()
+
+
+def stage_kind(node: Any) -> str:
+    """Get the kind of stage ("source", "transform", "filter", "partitioner", "batcher", "window", "flattener",
+    "merge" or "loader") a node implements."""
+    return _KINDS.get(type(node).__name__, "stage")
+
+
+class LatencyHistogram:
+    """A histogram of durations with exponentially sized buckets.
+
+    Bucket `i` counts durations of at most `2 ** i` microseconds (the first bucket also counts anything shorter than a
+    microsecond, the last anything longer than the largest bucket). Recording a duration is constant time, and
+    percentiles are estimated as the upper bound of the bucket they fall into.
+
+    Examples:
+        >>> histogram = LatencyHistogram()
+        >>> for seconds in (0.000_003, 0.000_003, 0.001):
+        ...     histogram.record(seconds)
+        >>> histogram.count, histogram.percentile(50), histogram.percentile(100)
+        (3, 4e-06, 0.001024)
+    """
+
+    BUCKETS = 32  # the last bucket ends at about 36 minutes
+
+    def __init__(self) -> None:
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def bucket_bound(cls, index: int) -> float:
+        """Get the upper bound of a bucket, in seconds."""
+        return (2 ** index) / 1e6
+
+    def record(self, seconds: float, count: int = 1) -> None:
+        """Record `count` durations of `seconds` each."""
+        micros = seconds * 1e6
+        index = 0 if micros <= 1 else min(math.ceil(math.log2(micros)), self.BUCKETS - 1)
+        self.counts[index] += count
+        self.count += count
+        self.total += seconds * count
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimate the `q`th percentile, in seconds, or None if nothing has been recorded."""
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bucket_bound(index)
+        return self.bucket_bound(self.BUCKETS - 1)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "LatencyHistogram":
+        """Rebuild a histogram from the output of `to_dict`."""
+        histogram = cls()
+        index_of = {cls.bucket_bound(i): i for i in range(cls.BUCKETS)}
+        for bound, count in data["buckets"].items():
+            histogram.counts[index_of[bound]] += count
+        histogram.count = data["count"]
+        histogram.total = data["sum"]
+        histogram.max = data["max"] or 0.0
+        return histogram
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Add the durations recorded by another histogram to this one."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+            "buckets": {self.bucket_bound(i): count for i, count in enumerate(self.counts) if count},
+        }
+
+
+class StageStats:
+    """Counters and a latency histogram for one stage of a pipeline.
+
+    All methods are thread-safe.
+
+    Attributes:
+        name (str): Name of the stage.
+        kind (str): Kind of stage, such as "transform" or "loader".
+        records_in (int): Records received.
+        records_out (int): Records emitted downstream, or loaded.
+        errors (int): Records for which the stage raised.
+        time (float): Cumulative seconds spent in the stage, excluding downstream stages.
+        latency (LatencyHistogram): Time each record spent in the stage.
+        flushes (int): Number of times the stage (a loader) was flushed.
+        flush_time (float): Cumulative seconds spent flushing the stage.
+        memory (bool): Whether memory allocated by the stage is tracked.
+        allocated (int): Net bytes allocated by the stage, excluding downstream stages, according to `tracemalloc`.
+            Only tracked if `memory` is True and `tracemalloc` is tracing.
+        details (Optional[Callable]): Returns a dict of stage-specific statistics.
+    """
+
+    def __init__(self, name: str, kind: str, *, memory: bool = False) -> None:
+        self.name = name
+        self.kind = kind
+        self.memory = memory
+        self.allocated = 0
+        self.records_in = 0
+        self.records_out = 0
+        self.errors = 0
+        self.time = 0.0
+        self.latency = LatencyHistogram()
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.details: Optional[Callable[[], dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def record(self, *, records_in: int = 0, records_out: int = 0, errors: int = 0,
+               elapsed: Optional[float] = None, samples: int = 1, allocated: int = 0) -> None:
+        """Update the counters.
+
+        Arguments:
+            records_in (int): Records received.
+            records_out (int): Records emitted.
+            errors (int): Errors raised.
+            elapsed (Optional[float]): Seconds spent in the stage, added to `time` and recorded as the latency of
+                `samples` records.
+            samples (int): Number of records `elapsed` is the latency of.
+            allocated (int): Net bytes allocated.
+        """
+        with self._lock:
+            self.allocated += allocated
+            self.records_in += records_in
+            self.records_out += records_out
+            self.errors += errors
+            if elapsed is not None:
+                self.time += elapsed
+                self.latency.record(elapsed, samples)
+
+    def record_flush(self, elapsed: float) -> None:
+        """Record that the stage was flushed, taking `elapsed` seconds."""
+        with self._lock:
+            self.flushes += 1
+            self.flush_time += elapsed
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get a snapshot of the stats as a dict."""
+        details = self.details() if self.details is not None else {}
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "records_in": self.records_in,
+                "records_out": self.records_out,
+                "errors": self.errors,
+                "time": self.time,
+                "throughput": self.records_in / self.time if self.time > 0 else None,
+                "latency": self.latency.to_dict(),
+                "flushes": self.flushes,
+                "flush_time": self.flush_time,
+                "allocated": self.allocated if self.memory else None,
+                "details": details,
+            }
+
+    def wrap_update(self, update: Callable[..., Any], *, timed: bool = True,
+                    loader: bool = False) -> Callable[..., Any]:
+        """Wrap a stage's update function so that each call is counted and timed.
+
+        Arguments:
+            update (Callable): The function called with each record the stage receives.
+            timed (bool): If False, only count records received; the stage records time and errors itself, because its
+                work happens outside of `update`.
+            loader (bool): If True, count records processed without error as emitted.
+        """
+        perf_counter = time.perf_counter
+
+        if not timed:
+            def counted_update(*args, **kwargs):
+                self.record(records_in=1)
+                return update(*args, **kwargs)
+
+            return counted_update
+
+        traced = self._traced_memory
+
+        def timed_update(*args, **kwargs):
+            frames = _frames.__dict__.setdefault("stack", [])
+            frame = [0.0, 0]  # time and memory allocated downstream
+            frames.append(frame)
+            start, start_memory = perf_counter(), traced()
+            failed = True
+            try:
+                result = update(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed = perf_counter() - start - frame[0]
+                allocated = traced() - start_memory - frame[1]
+                frames.pop()
+                self.record(records_in=1, records_out=int(loader and not failed), errors=int(failed),
+                            elapsed=elapsed, allocated=allocated)
+
+        return timed_update
+
+    def wrap_emit(self, emit: Callable[..., Any], *, count_in: bool = False) -> Callable[..., Any]:
+        """Wrap a stage's emit function so that records emitted are counted, and time spent (and memory allocated)
+        downstream is excluded from the stage's totals.
+
+        Arguments:
+            emit (Callable): The function called with each record the stage emits.
+            count_in (bool): If True, also count each record emitted as received. Used for the source of a pipeline,
+                which emits records without receiving them from another stage.
+        """
+        perf_counter = time.perf_counter
+        traced = self._traced_memory
+        records_in = int(count_in)
+
+        def timed_emit(*args, **kwargs):
+            start, start_memory = perf_counter(), traced()
+            try:
+                return emit(*args, **kwargs)
+            finally:
+                self.record(records_in=records_in, records_out=1)
+                frames = getattr(_frames, "stack", None)
+                if frames:
+                    frames[-1][0] += perf_counter() - start
+                    frames[-1][1] += traced() - start_memory
+
+        return timed_emit
+
+    def _traced_memory(self) -> int:
+        """Get the memory currently allocated according to `tracemalloc`, if memory is being tracked."""
+        if self.memory and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+        return 0
+
+
+def new_stage_names(nodes: Iterable[Any]) -> Iterable[tuple[Any, str]]:
+    """Pair each node that does not have stats yet with a unique name.
+
+    The name is the node's own name or, if it has none, its kind. A numeric suffix is added if the name is already
+    taken by another node.
+    """
+    nodes = list(nodes)
+    seen = {node.stats.name for node in nodes if getattr(node, "stats", None) is not None}
+    for node in nodes:
+        if getattr(node, "stats", None) is not None:
+            continue
+        base = node.name or stage_kind(node)
+        name, n = base, 1
+        while name in seen:
+            n += 1
+            name = f"{base}-{n}"
+        seen.add(name)
+        yield node, name
+
+
+def instrument_stream(stream: Any, name: str, *, memory: bool = False) -> StageStats:
+    """Attach a `StageStats` to a `streamz` stream, wrapping its `update` and `_emit` methods.
+
+    Nodes that do their work outside of `update`, such as `dcw.etl.stages.ExecutorMap` and
+    `dcw.etl.stages.QueuedSink`, record their own time, errors and latency through their `stats` attribute. A node's
+    `details` attribute, if it has one, is used as the stats' `details`.
+    """
+    stats = StageStats(name, stage_kind(stream), memory=memory)
+    stats.details = getattr(stream, "details", None)
+    if stats.kind != "source":
+        timed = not (hasattr(stream, "executor") or hasattr(stream, "queue"))
+        stream.update = stats.wrap_update(stream.update, timed=timed, loader=stats.kind == "loader")
+    stream._emit = stats.wrap_emit(stream._emit, count_in=stats.kind == "source")
+    stream.stats = stats
+    return stats
+
+
+def merge_stats(runs: Iterable[dict[str, dict[str, Any]]]) -> dict[str, dict[str, Any]]:
+    """Merge the output of `ProcessingPipeline.stats()` from several runs of the same pipeline, such as the workers
+    of a sharded run, into one summary.
+
+    Counters and times are summed, latency histograms are combined, and throughput is recomputed. The stage-specific
+    `details` are not merged, as their meaning varies from stage to stage.
+
+    Examples:
+        >>> run = {"load": {"kind": "loader", "records_in": 2, "records_out": 2, "errors": 0, "time": 1.0,
+        ...                 "throughput": 2.0, "latency": LatencyHistogram().to_dict(), "flushes": 1,
+        ...                 "flush_time": 0.5, "allocated": None, "details": {}}}
+        >>> merged = merge_stats([run, run])["load"]
+        >>> merged["records_in"], merged["time"], merged["throughput"], merged["flushes"]
+        (4, 2.0, 2.0, 2)
+    """
+    merged: dict[str, dict[str, Any]] = {}
+    histograms: dict[str, LatencyHistogram] = {}
+    for run in runs:
+        for name, stage in run.items():
+            if name not in merged:
+                merged[name] = dict(stage, details={})
+                histograms[name] = LatencyHistogram.from_dict(stage["latency"])
+                continue
+
+            total = merged[name]
+            for key in ("records_in", "records_out", "errors", "time", "flushes", "flush_time"):
+                total[key] += stage[key]
+            if stage["allocated"] is not None:
+                total["allocated"] = (total["allocated"] or 0) + stage["allocated"]
+            histograms[name].merge(LatencyHistogram.from_dict(stage["latency"]))
+
+    for name, total in merged.items():
+        total["latency"] = histograms[name].to_dict()
+        total["throughput"] = total["records_in"] / total["time"] if total["time"] > 0 else None
+    return merged
+
+
+def _millis(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else seconds * 1000
+
+
+def format_stats(stats: dict[str, dict[str, Any]], *, tablefmt: str = "grid") -> str:
+    """Format the output of `ProcessingPipeline.stats()` as a table, one row per stage."""
+    tbl = [(name, s["kind"], s["records_in"], s["records_out"], s["errors"], s["time"], s["throughput"],
+            _millis(s["latency"]["p50"]), _millis(s["latency"]["p99"]))
+           for name, s in stats.items()]
+    headers = ("Stage", "Kind", "In", "Out", "Errors", "Time (s)", "Records/s", "p50 (ms)", "p99 (ms)")
+    return tabulate.tabulate(tbl, headers=headers, tablefmt=tablefmt, missingval="-",
+                             floatfmt=("", "", "", "", "", ".3f", ",.0f", ".3f", ".3f"))
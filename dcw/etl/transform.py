@@ -1,5 +1,9 @@
 import gzip
-from typing import Any, Protocol
+from typing import Any, Callable, Literal, Protocol, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 
 
 class Transformation(Protocol):
@@ -35,3 +39,120 @@ class GzipExtractTransformation(Transformation):
         with gzip.open(record, mode="rb") as f:
             data = f.read()
             return data.decode(self.encoding) if self.encoding else data
+
+
+def to_records(batch: Any) -> list:
+    """Convert a batch of data back into a list of records.
+
+    - `numpy.ndarray` and `pandas.Series` become a list of Python values (rows, for multi-dimensional arrays).
+    - `pandas.DataFrame`, `pyarrow.RecordBatch` and `pyarrow.Table` become a list of dicts, one per row.
+    - Anything else iterable is converted to a list.
+
+    Examples:
+        >>> to_records(np.array([1, 4, 9]))
+        [1, 4, 9]
+        >>> to_records(pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}))
+        [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+    """
+    if isinstance(batch, (np.ndarray, pd.Series)):
+        return batch.tolist()
+    if isinstance(batch, pd.DataFrame):
+        return batch.to_dict(orient="records")
+    if isinstance(batch, (pa.RecordBatch, pa.Table)):
+        return batch.to_pylist()
+    return list(batch)
+
+
+class VectorizedTransformation(Transformation):
+    """A transformation that operates on a whole batch of records at once.
+
+    The batch (a sequence of records, such as one produced by a batcher) is collected into a NumPy array, a pandas
+    DataFrame, or a `pyarrow.RecordBatch` before being passed to `func`, so that a vectorized operation can process
+    every record in a single call.
+
+    Examples:
+        >>> square = VectorizedTransformation(lambda x: x ** 2)
+        >>> square((1, 2, 3))
+        array([1, 4, 9])
+        >>> total = VectorizedTransformation(lambda df: df.assign(total=df["a"] + df["b"]), collect="pandas",
+        ...                                  records=True)
+        >>> total(({"a": 1, "b": 2}, {"a": 3, "b": 4}))
+        [{'a': 1, 'b': 2, 'total': 3}, {'a': 3, 'b': 4, 'total': 7}]
+    """
+
+    def __init__(self, func: Callable[[Any], Any], *, collect: Literal["numpy", "pandas", "arrow"] = "numpy",
+                 records: bool = False):
+        """Create a new VectorizedTransformation.
+
+        Args:
+            func: Called with each batch, collected as described by `collect`.
+            collect: How to collect the batch. "numpy" creates an array with `numpy.asarray`, "pandas" creates a
+                DataFrame with `pandas.DataFrame.from_records` (records should be dicts or tuples), and "arrow" creates
+                a `pyarrow.RecordBatch` with `pyarrow.RecordBatch.from_pylist` (records should be dicts).
+            records: If True, the output of `func` is converted back into a list of records with `to_records`.
+        """
+        if collect not in self._collectors:
+            raise ValueError(f"Unknown collect {collect}")
+        self.func = func
+        self.collect = collect
+        self.records = records
+
+    _collectors = {
+        "numpy": np.asarray,
+        "pandas": lambda batch: pd.DataFrame.from_records(list(batch)),
+        "arrow": lambda batch: pa.RecordBatch.from_pylist(list(batch)),
+    }
+
+    def transform(self, batch: Sequence[Any]) -> Any:
+        result = self.func(self._collectors[self.collect](batch))
+        return to_records(result) if self.records else result
+
+
+class ArrowComputeTransformation(Transformation):
+    """A transformation that adds or replaces columns of a `pyarrow.RecordBatch` or `pyarrow.Table`.
+
+    Each column is computed from the whole batch, typically with `pyarrow.compute` kernels, so the data never leaves
+    columnar form. Optionally, rows can be filtered with a boolean mask computed the same way.
+
+    Examples:
+        >>> import pyarrow.compute as pc
+        >>> transformation = ArrowComputeTransformation(
+        ...     {"y": lambda batch: pc.multiply(batch["x"], batch["x"])},
+        ...     where=lambda batch: pc.greater(batch["x"], 1))
+        >>> transformation(pa.RecordBatch.from_pydict({"x": [1, 2, 3]})).to_pydict()
+        {'x': [2, 3], 'y': [4, 9]}
+    """
+
+    def __init__(self, columns: dict[str, Callable[[Any], Any]] | None = None, *,
+                 where: Callable[[Any], Any] | None = None):
+        """Create a new ArrowComputeTransformation.
+
+        Args:
+            columns: Maps a column name to a function that computes the column's values from the batch. Existing
+                columns with the same name are replaced, others are appended.
+            where: A function that computes a boolean mask from the batch. Only rows where the mask is true are kept.
+                The mask is applied after the columns have been computed.
+        """
+        self.columns = columns or {}
+        self.where = where
+
+    def transform(self, batch: pa.RecordBatch | pa.Table) -> pa.RecordBatch | pa.Table:
+        for name, func in self.columns.items():
+            values = func(batch)
+            index = batch.schema.get_field_index(name)
+            if isinstance(batch, pa.Table):
+                batch = batch.append_column(name, values) if index == -1 else batch.set_column(index, name, values)
+            else:
+                # pyarrow.RecordBatch has no append_column or set_column before pyarrow 15, so it is rebuilt instead
+                columns, names = list(batch.columns), list(batch.schema.names)
+                if index == -1:
+                    columns.append(values)
+                    names.append(name)
+                else:
+                    columns[index] = values
+                batch = pa.RecordBatch.from_arrays(columns, names=names)
+
+        if self.where is not None:
+            batch = batch.filter(self.where(batch))
+
+        return batch
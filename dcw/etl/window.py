@@ -0,0 +1,290 @@
+"""Aggregate records over windows of time.
+
+`ProcessingPipeline.add_window` adds a stage that groups records into windows of time, optionally per key, and
+emits one result per key and window when the window closes. Windows are either:
+
+- tumbling: consecutive windows of `size` seconds that do not overlap, or
+- sliding: windows of `size` seconds that start every `slide` seconds, so that each record falls into
+  `size / slide` windows.
+
+The time of a record is either its event time, as returned by a `timestamp` function, or the processing time, when
+the record reaches the stage. With processing time, a window closes once the clock passes its end. With event time,
+a window closes once a record has been seen that is more than `lateness` seconds past its end; records that arrive
+after all their windows have closed are dropped and counted as late.
+
+Records are not kept. Each window holds one state per aggregate (see `Aggregate`), which is updated as records arrive,
+so memory is constant per key and window. The result emitted for a window is a dict with its "start" and "end" (in
+seconds since the epoch), its "key" if a key function was given, and the result of each aggregate.
+
+Examples:
+    >>> windower = Windower(60, key=lambda r: r["user"], timestamp=lambda r: r["t"],
+    ...                     aggregates={"clicks": Count(), "spent": Sum("amount")})
+    >>> for record in ({"user": "a", "t": 5, "amount": 2}, {"user": "a", "t": 50, "amount": 3},
+    ...                {"user": "b", "t": 70, "amount": 1}):
+    ...     _, closed = windower.add(record)
+    ...     print([result for _, result in closed])
+    []
+    []
+    [{'key': 'a', 'start': 0.0, 'end': 60.0, 'clicks': 2, 'spent': 5}]
+    >>> [result for _, result in windower.flush()]
+    [{'key': 'b', 'start': 60.0, 'end': 120.0, 'clicks': 1, 'spent': 1}]
+"""
+
+import abc
+import datetime
+import heapq
+import math
+import time
+from typing import Any, Callable, Hashable, Optional
+
+_INFINITY = float("inf")
+
+
+class Aggregate(abc.ABC):
+    """An aggregation that is computed incrementally, one record at a time, in a constant amount of memory.
+
+    Subclasses implement `create`, which returns the initial state, and `add`, which returns the state updated with a
+    record, and can override `result`, which computes the final value from the state.
+
+    Attributes:
+        value (Optional[str | Callable]): What is aggregated: the record itself if None, `record[value]` if a string,
+            or `value(record)` if a callable.
+    """
+
+    def __init__(self, value: Optional[str | Callable[[Any], Any]] = None) -> None:
+        self.value = value
+
+    def get(self, record: Any) -> Any:
+        """Get the value of a record that is aggregated."""
+        if self.value is None:
+            return record
+        if isinstance(self.value, str):
+            return record[self.value]
+        return self.value(record)
+
+    @abc.abstractmethod
+    def create(self) -> Any:
+        """Get the state of an empty window."""
+        raise NotImplementedError("create() must be implemented by subclasses")
+
+    @abc.abstractmethod
+    def add(self, state: Any, record: Any) -> Any:
+        """Get `state` updated with `record`."""
+        raise NotImplementedError("add() must be implemented by subclasses")
+
+    def result(self, state: Any) -> Any:
+        """Get the result of the aggregation from its state."""
+        return state
+
+
+class Count(Aggregate):
+    """Count the records."""
+
+    def create(self) -> int:
+        return 0
+
+    def add(self, state: int, record: Any) -> int:
+        return state + 1
+
+
+class Sum(Aggregate):
+    """Sum the values."""
+
+    def create(self) -> Any:
+        return 0
+
+    def add(self, state: Any, record: Any) -> Any:
+        return state + self.get(record)
+
+
+class Min(Aggregate):
+    """Get the smallest value."""
+
+    def create(self) -> Any:
+        return None
+
+    def add(self, state: Any, record: Any) -> Any:
+        value = self.get(record)
+        return value if state is None or value < state else state
+
+
+class Max(Aggregate):
+    """Get the largest value."""
+
+    def create(self) -> Any:
+        return None
+
+    def add(self, state: Any, record: Any) -> Any:
+        value = self.get(record)
+        return value if state is None or value > state else state
+
+
+class Mean(Aggregate):
+    """Get the mean of the values."""
+
+    def create(self) -> tuple[Any, int]:
+        return 0, 0
+
+    def add(self, state: tuple[Any, int], record: Any) -> tuple[Any, int]:
+        total, count = state
+        return total + self.get(record), count + 1
+
+    def result(self, state: tuple[Any, int]) -> Optional[float]:
+        total, count = state
+        return total / count if count else None
+
+
+class Reduce(Aggregate):
+    """Combine the values with a function, such as `operator.or_`, starting from `initial`.
+
+    Examples:
+        >>> longest = Reduce(lambda a, b: a if len(a) >= len(b) else b, initial="")
+        >>> state = longest.create()
+        >>> for word in ("a", "abc", "ab"):
+        ...     state = longest.add(state, word)
+        >>> longest.result(state)
+        'abc'
+    """
+
+    def __init__(self, func: Callable[[Any, Any], Any], initial: Any = None, *,
+                 value: Optional[str | Callable[[Any], Any]] = None) -> None:
+        """Create a new Reduce aggregation.
+
+        Arguments:
+            func (Callable): Combines the state so far with a value, returning the new state.
+            initial (Any): The state of an empty window. It must not be mutated by `func`.
+            value (Optional[str | Callable]): What is aggregated, see `Aggregate`.
+        """
+        super().__init__(value)
+        self.func = func
+        self.initial = initial
+
+    def create(self) -> Any:
+        return self.initial
+
+    def add(self, state: Any, record: Any) -> Any:
+        return self.func(state, self.get(record))
+
+
+class Windower:
+    """Assign records to windows, keep their aggregates up to date and close them, see the module documentation.
+
+    Not thread-safe: the stages that use it hold a lock.
+
+    Attributes:
+        size (float): Length of each window, in seconds.
+        slide (float): Seconds between the starts of consecutive windows. Equal to `size` for tumbling windows.
+        aggregates (dict[str, Aggregate]): The aggregates computed for each window, by the name of their result.
+        key (Optional[Callable]): Returns the key of a record. Windows are separate for each key.
+        timestamp (Optional[Callable]): Returns the event time of a record, in seconds since the epoch or as a
+            `datetime.datetime`. If None, processing time is used.
+        lateness (float): With event time, seconds to wait past the end of a window for records that arrive out of
+            order.
+        clock (Callable): Returns the current time, for processing time.
+        watermark (float): With event time, the time before which windows have closed.
+        late (int): Records dropped because they arrived after all their windows had closed.
+    """
+
+    def __init__(self, size: float, *, slide: Optional[float] = None, aggregates: dict[str, Aggregate],
+                 key: Optional[Callable[[Any], Hashable]] = None,
+                 timestamp: Optional[Callable[[Any], float | datetime.datetime]] = None, lateness: float = 0.0,
+                 clock: Callable[[], float] = time.time) -> None:
+        if size <= 0:
+            raise ValueError(f"size must be positive, got {size}")
+        slide = size if slide is None else slide
+        if not 0 < slide <= size:
+            raise ValueError(f"slide must be positive and at most size, got {slide}")
+        if not aggregates:
+            raise ValueError("At least one aggregate is required")
+        self.size = size
+        self.slide = slide
+        self.aggregates = aggregates
+        self.key = key
+        self.timestamp = timestamp
+        self.lateness = lateness
+        self.clock = clock
+        self.watermark = -_INFINITY
+        self.late = 0
+        self._aggregates = tuple(aggregates.values())
+        self._windows: dict[tuple[Hashable, float], list] = {}
+        self._ends: list[tuple[float, int, tuple[Hashable, float]]] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        """Get the number of open windows."""
+        return len(self._windows)
+
+    @property
+    def event_time(self) -> bool:
+        return self.timestamp is not None
+
+    def next_end(self) -> Optional[float]:
+        """Get the time at which the next window closes, if any are open."""
+        return self._ends[0][0] if self._ends else None
+
+    def _time(self, record: Any) -> float:
+        if self.timestamp is None:
+            return self.clock()
+        t = self.timestamp(record)
+        return t.timestamp() if isinstance(t, datetime.datetime) else t
+
+    def add(self, record: Any) -> tuple[list[tuple[Hashable, float]], list[tuple[tuple[Hashable, float], dict]]]:
+        """Add a record to the windows it falls into, and close the windows that are due.
+
+        Returns:
+            tuple: The ids of the windows the record was added to (empty if it was late), and the id and result of
+                each window that closed.
+        """
+        key = self.key(record) if self.key is not None else None
+        t = self._time(record)
+        added = []
+
+        start = math.floor(t / self.slide) * self.slide
+        while start > t - self.size:
+            end = start + self.size
+            if end > self.watermark:
+                window = (key, start)
+                states = self._windows.get(window)
+                if states is None:
+                    states = self._windows[window] = [aggregate.create() for aggregate in self._aggregates]
+                    heapq.heappush(self._ends, (end, self._seq, window))
+                    self._seq += 1
+                for i, aggregate in enumerate(self._aggregates):
+                    states[i] = aggregate.add(states[i], record)
+                added.append(window)
+            start -= self.slide
+
+        if not added:
+            self.late += 1
+
+        if self.event_time:
+            self.watermark = max(self.watermark, t - self.lateness)
+            return added, self.close(self.watermark)
+        return added, self.close(t)
+
+    def close(self, until: float) -> list[tuple[tuple[Hashable, float], dict]]:
+        """Close every window that ends at or before `until`, returning the id and result of each."""
+        closed = []
+        while self._ends and self._ends[0][0] <= until:
+            end, _, window = heapq.heappop(self._ends)
+            key, start = window
+            states = self._windows.pop(window)
+            result = {"key": key} if self.key is not None else {}
+            result["start"] = float(start)
+            result["end"] = float(end)
+            for (name, aggregate), state in zip(self.aggregates.items(), states):
+                result[name] = aggregate.result(state)
+            closed.append((window, result))
+        return closed
+
+    def close_due(self) -> list[tuple[tuple[Hashable, float], dict]]:
+        """With processing time, close every window that has ended by now."""
+        return self.close(self.clock()) if not self.event_time else []
+
+    def flush(self) -> list[tuple[tuple[Hashable, float], dict]]:
+        """Close every open window."""
+        return self.close(_INFINITY)
+
+    def stats(self) -> dict[str, Any]:
+        """Get the number of open windows and of late records."""
+        return {"open_windows": len(self._windows), "late": self.late}
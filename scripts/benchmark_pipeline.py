@@ -0,0 +1,71 @@
+"""Compare the throughput of the streamz and native pipeline engines.
+
+Each engine runs the same pipeline (two transformations, a batcher, a flattener, and a loader) over the same records,
+and the records per second are reported for each.
+
+Usage:
+    python scripts/benchmark_pipeline.py --records 200000 --repeat 3
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import tabulate
+
+# import dcw from this checkout, so that the script runs without installing the package or setting PYTHONPATH
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dcw.etl.extract import RecordExtractor  # noqa: E402
+from dcw.etl.load import Loader  # noqa: E402
+from dcw.etl.pipeline import ProcessingPipeline  # noqa: E402
+
+
+class CountingLoader(Loader):
+    """A loader that only counts the records it receives."""
+
+    def __init__(self):
+        self.count = 0
+
+    def load(self, item):
+        self.count += 1
+
+
+def build_pipeline(engine: str, batch_size: int) -> tuple[ProcessingPipeline, CountingLoader]:
+    loader = CountingLoader()
+    pipeline = ProcessingPipeline(name=engine, engine=engine)
+    pipeline.add_transform(lambda x: x * 2)
+    pipeline.add_transform(lambda x: x + 1)
+    pipeline.add_batcher(batch_size, timeout=0.1)
+    pipeline.add_flattener()
+    pipeline.add_loader(loader)
+    return pipeline, loader
+
+
+def benchmark(engine: str, records: int, batch_size: int) -> float:
+    """Run the pipeline once and return the number of records processed per second."""
+    pipeline, loader = build_pipeline(engine, batch_size)
+    start = time.perf_counter()
+    pipeline.extract(RecordExtractor(range(records)))
+    elapsed = time.perf_counter() - start
+    assert loader.count == records, f"{engine} loaded {loader.count} of {records} records"
+    return records / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100_000, help="Number of records to push through")
+    parser.add_argument("--batch-size", type=int, default=100, help="Size of the batches")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per engine, the best is reported")
+    args = parser.parse_args()
+
+    results = {engine: max(benchmark(engine, args.records, args.batch_size) for _ in range(args.repeat))
+               for engine in ("streamz", "native")}
+
+    tbl = [(engine, f"{rate:,.0f}", f"{rate / results['streamz']:.1f}x") for engine, rate in results.items()]
+    print(tabulate.tabulate(tbl, headers=("Engine", "Records/sec", "Speedup"), tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
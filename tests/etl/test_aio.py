@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from dcw.etl.aio import AsyncProcessingPipeline
+from dcw.etl.extract import AsyncExtractor, RecordExtractor
+from dcw.etl.load import AsyncLoader, ListLoader
+from dcw.etl.pipeline import PipelineFactory, ProcessingPipeline, arun_pipeline, run_pipeline
+
+
+class NumberExtractor(AsyncExtractor):
+    def __init__(self, num):
+        self.num = num
+
+    async def __aiter__(self):
+        for i in range(self.num):
+            await asyncio.sleep(0)
+            yield i
+
+
+class AsyncListLoader(AsyncLoader):
+    def __init__(self):
+        self.records = []
+        self.flushed = False
+
+    async def load(self, item):
+        await asyncio.sleep(0)
+        self.records.append(item)
+
+    async def flush(self):
+        self.flushed = True
+
+
+def test_async_pipeline_transform_concurrency():
+    """Transforms run concurrently, up to the stage's concurrency limit."""
+    running = 0
+    peak = 0
+
+    async def lookup(x):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return x * 2
+
+    loader = AsyncListLoader()
+    pipeline = AsyncProcessingPipeline()
+    pipeline.add_transform(lookup, concurrency=5)
+    pipeline.add_loader(loader)
+    asyncio.run(pipeline.extract(NumberExtractor(20)))
+
+    assert sorted(loader.records) == [x * 2 for x in range(20)]
+    assert peak == 5
+    assert loader.flushed
+
+
+def test_async_pipeline_reads_regular_extractor_off_the_loop():
+    """A regular extractor that blocks while reading records does not block the event loop."""
+    import time
+
+    class SlowExtractor(RecordExtractor):
+        def iter_records(self):
+            for record in super().iter_records():
+                time.sleep(0.01)
+                yield record
+
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.001)
+            ticks += 1
+
+    async def main():
+        ticker = asyncio.create_task(tick())
+        await pipeline.extract(SlowExtractor(range(10)))
+        ticker.cancel()
+
+    loader = AsyncListLoader()
+    pipeline = AsyncProcessingPipeline()
+    pipeline.add_loader(loader)
+    asyncio.run(main())
+
+    assert sorted(loader.records) == list(range(10))
+    assert ticks >= 10
+
+
+def test_aiter_records_errors_and_early_stop():
+    """Errors raised by a regular extractor are raised by aiter_records, and stopping early closes the extractor."""
+    from dcw.etl.aio import aiter_records
+
+    closed = []
+
+    class Extractor(RecordExtractor):
+        def iter_records(self):
+            try:
+                for record in super().iter_records():
+                    if record == "boom":
+                        raise ValueError(record)
+                    yield record
+            finally:
+                closed.append(True)
+
+    async def take(extractor, n):
+        records = []
+        async with contextlib.aclosing(aiter_records(extractor, buffer_size=2)) as it:
+            async for record in it:
+                records.append(record)
+                if len(records) == n:
+                    break
+        return records
+
+    assert asyncio.run(take(Extractor(range(1000)), 5)) == [0, 1, 2, 3, 4]
+    assert closed == [True]
+    assert asyncio.run(take(Extractor(range(10)), 100)) == list(range(10))
+
+    with pytest.raises(ValueError):
+        asyncio.run(take(Extractor([1, 2, "boom", 3]), 100))
+
+
+def test_async_pipeline_batch_and_flatten():
+    batched = ListLoader()
+    flattened = ListLoader()
+    pipeline = AsyncProcessingPipeline()
+    pipeline.add_batcher(3)
+    pipeline.add_loader(batched)
+    pipeline.add_flattener()
+    pipeline.add_loader(flattened)
+    asyncio.run(pipeline.extract(RecordExtractor(range(7))))
+
+    assert sorted(len(batch) for batch in batched.records) == [1, 3, 3]
+    assert sorted(flattened.records) == list(range(7))
+
+
+def test_async_pipeline_raises():
+    def fail(x):
+        raise RuntimeError("boom")
+
+    pipeline = AsyncProcessingPipeline()
+    pipeline.add_transform(fail)
+    pipeline.add_loader(ListLoader())
+    with pytest.raises(RuntimeError):
+        asyncio.run(pipeline.extract(RecordExtractor(range(3))))
+
+
+def test_async_pipeline_requires_loader():
+    pipeline = AsyncProcessingPipeline()
+    with pytest.raises(ValueError):
+        asyncio.run(pipeline.extract(RecordExtractor(range(3))))
+
+
+def test_run_pipeline_detects_async_factory():
+    """run_pipeline drives factories that return async pipelines and extractors."""
+    loader = AsyncListLoader()
+
+    class AsyncFactory(PipelineFactory):
+        def get_extractor(self, opts):
+            return NumberExtractor(10)
+
+        def get_pipeline(self, opts):
+            pipeline = AsyncProcessingPipeline()
+            pipeline.add_transform(lambda x: x + 1)
+            pipeline.add_loader(loader)
+            return pipeline
+
+    run_pipeline(AsyncFactory())
+    assert sorted(loader.records) == list(range(1, 11))
+
+
+def test_arun_pipeline_with_sync_pipeline_and_async_extractor():
+    loader = ListLoader()
+
+    class MixedFactory(PipelineFactory):
+        def get_extractor(self, opts):
+            return NumberExtractor(10)
+
+        def get_pipeline(self, opts):
+            pipeline = ProcessingPipeline()
+            pipeline.add_loader(loader)
+            return pipeline
+
+    asyncio.run(arun_pipeline(MixedFactory()))
+    assert loader.records == list(range(10))
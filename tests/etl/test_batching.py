@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from dcw.etl.batching import BatchSizer, estimate_size
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader
+from dcw.etl.pipeline import ProcessingPipeline
+
+
+class SlowLoader(ListLoader):
+    """Takes a millisecond per record, so that larger batches take longer to load."""
+
+    def load(self, item):
+        time.sleep(len(item) / 1000)
+        super().load(item)
+
+
+def test_estimate_size():
+    assert estimate_size("abc") == 3
+    assert estimate_size(np.zeros(100)) == 800
+    assert estimate_size(pa.table({"x": pa.array(range(100), pa.int64())})) == 800
+    assert estimate_size(pd.DataFrame({"x": range(100)})) >= 800
+    assert estimate_size([b"x" * 100, {"y": b"z" * 100}]) > 200
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+@pytest.mark.parametrize("timeout", [None, 1.0])
+def test_batcher_max_bytes(engine, timeout):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_batcher(3, max_bytes=100, sizeof=len, timeout=timeout, name="batcher")
+    pipeline.add_loader(loader)
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(["a" * 40, "b" * 40, "c" * 40, "d" * 200, "e", "f", "g", "h"]))
+
+    assert [tuple(len(record) for record in batch) for batch in loader.records] == [
+        (40, 40), (40,), (200,), (1, 1, 1), (1,)]
+    assert pipeline.stats()["batcher"]["details"] == {"batch_size": 3, "batches": 5}
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_adaptive_batcher_holds_target_latency(engine):
+    loader = SlowLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_batcher(2, target_latency=0.02, name="batcher")
+    pipeline.add_loader(loader)
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(600)))
+
+    sizes = [len(batch) for batch in loader.records]
+    assert sum(sizes) == 600
+    assert max(sizes) > 10
+    assert 5 <= pipeline.stats()["batcher"]["details"]["batch_size"] <= 30
+
+
+def test_adaptive_batch_size_bounds():
+    sizer = BatchSizer(4, target_latency=1.0, max_size=5, increase=2)
+    sizer.observe(4, 0.1)
+    assert sizer.size == 5
+    sizer.observe(2, 0.1)  # a partial batch does not grow the size
+    assert sizer.size == 5
+    for _ in range(5):
+        sizer.observe(5, 10.0)
+    assert sizer.size == 1
+
+
+def test_sized_batcher_in_partitioner_lanes():
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_partitioner(lambda record: record % 2, partitions=2)
+    pipeline.add_batcher(10, max_bytes=3, sizeof=lambda record: 1)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(10)))
+
+    assert sorted(loader.records) == [(0, 2, 4), (1, 3, 5), (6, 8), (7, 9)]
+
+
+def test_batcher_options_require_limits():
+    with pytest.raises(ValueError):
+        ProcessingPipeline().add_batcher(10, sizeof=len)
+    with pytest.raises(ValueError):
+        BatchSizer(10, max_bytes=0)
@@ -0,0 +1,186 @@
+import pickle
+import threading
+
+import pytest
+
+from dcw.etl.cache import CachedTransformation, PersistentTransformCache, TransformCache, file_fingerprint
+from dcw.etl.extract import FileWalkExtractor, RecordExtractor
+from dcw.etl.load import ListLoader
+from dcw.etl.pipeline import ProcessingPipeline
+from dcw.etl.transform import SquareTransformation
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _square_pickle(x):
+    return x ** 2
+
+
+def test_cache_lru_eviction():
+    cache = TransformCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "hit_rate": 0.75, "evictions": 1, "expirations": 0}
+
+
+def test_cache_ttl():
+    clock = FakeClock()
+    cache = TransformCache(ttl=10, clock=clock)
+    cache.put("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_cached_transformation_key_and_none_results():
+    calls = []
+
+    def lookup(record):
+        calls.append(record)
+        return None
+
+    cached = CachedTransformation(lookup, key=lambda record: record["id"])
+    assert [cached({"id": i % 2}) for i in range(4)] == [None] * 4
+    assert calls == [{"id": 0}, {"id": 1}]
+
+
+def test_cached_transformation_wraps_transformation():
+    cached = CachedTransformation(SquareTransformation())
+    assert [cached(x) for x in (3, 3)] == [9, 9]
+    assert cached.stats()["hits"] == 1
+
+
+def test_shared_cache_namespaces():
+    cache = TransformCache()
+    double = CachedTransformation(lambda x: x * 2, cache=cache, namespace="double")
+    triple = CachedTransformation(lambda x: x * 3, cache=cache, namespace="triple")
+    assert (double(2), triple(2), double(2)) == (4, 6, 4)
+    assert len(cache) == 2
+
+
+def test_cache_thread_safety():
+    cache = TransformCache(maxsize=50)
+    cached = CachedTransformation(lambda x: x + 1, cache=cache)
+
+    def work():
+        for i in range(2000):
+            assert cached(i % 100) == i % 100 + 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 16_000
+    assert stats["size"] <= 50
+
+
+def test_cache_pickles_empty():
+    cached = CachedTransformation(_square_pickle, maxsize=10, ttl=5)
+    cached(2)
+    copy = pickle.loads(pickle.dumps(cached))
+    assert (copy.cache.maxsize, copy.cache.ttl, len(copy.cache)) == (10, 5, 0)
+    assert copy(3) == 9
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_cached_transform_stage_stats(engine):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_transform(CachedTransformation(lambda x: x * 10), name="lookup")
+    pipeline.add_loader(loader)
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor([1, 2, 1, 1]))
+
+    assert loader.records == [10, 20, 10, 10]
+    details = pipeline.stats()["lookup"]["details"]
+    assert (details["hits"], details["misses"]) == (2, 2)
+
+
+def test_cache_shared_between_parallel_pipelines():
+    cache = TransformCache()
+    results = []
+    for _ in range(2):
+        loader = ListLoader()
+        pipeline = ProcessingPipeline()
+        pipeline.add_parallel_transform(CachedTransformation(lambda x: -x, cache=cache), workers=2)
+        pipeline.add_loader(loader)
+        pipeline.extract(RecordExtractor(range(5)))
+        results.append(loader.records)
+
+    assert results == [[0, -1, -2, -3, -4]] * 2
+    assert cache.stats()["hits"] >= 5
+
+
+def test_persistent_cache_skips_unchanged_files(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    for name in "abc":
+        (data / f"{name}.txt").write_text(name * 3)
+
+    def run(version="1"):
+        parsed = []
+
+        def parse(path):
+            parsed.append(path.name)
+            return path.read_text().upper()
+
+        cache = PersistentTransformCache(tmp_path / "cache.db", version=version)
+        loader = ListLoader()
+        pipeline = ProcessingPipeline()
+        pipeline.add_transform(CachedTransformation(parse, key=file_fingerprint, cache=cache))
+        pipeline.add_loader(loader)
+        pipeline.extract(FileWalkExtractor(data))
+        cache.close()
+        return sorted(parsed), sorted(loader.records)
+
+    assert run() == (["a.txt", "b.txt", "c.txt"], ["AAA", "BBB", "CCC"])
+    assert run() == ([], ["AAA", "BBB", "CCC"])
+
+    (data / "b.txt").write_text("changed")
+    assert run() == (["b.txt"], ["AAA", "CCC", "CHANGED"])
+
+    # a new version of the transformation invalidates every entry
+    assert run(version="2")[0] == ["a.txt", "b.txt", "c.txt"]
+
+
+def test_persistent_cache_max_bytes(tmp_path):
+    cache = PersistentTransformCache(tmp_path / "cache.db", version="1", max_bytes=3500)
+    for i in range(3):
+        cache.put(i, b"x" * 1000)
+    cache.get(0)
+    cache.put(3, b"x" * 1000)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 3500
+    assert (stats["size"], stats["evictions"]) == (3, 1)
+    assert cache.get(0) == cache.get(3) == b"x" * 1000
+    assert cache.get(1) is None
+    cache.close()
+
+
+def test_persistent_cache_names_and_pickling(tmp_path):
+    first = PersistentTransformCache(tmp_path / "cache.db", version="1", name="first")
+    second = PersistentTransformCache(tmp_path / "cache.db", version="7", name="second")
+    first.put("k", 1)
+    second.put("k", 2)
+
+    copy = pickle.loads(pickle.dumps(first))
+    assert (copy.get("k"), second.get("k")) == (1, 2)
+    for cache in (first, second, copy):
+        cache.close()
@@ -0,0 +1,143 @@
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from dcw.etl.checkpoint import Checkpoint, FileCheckpointStore, SQLiteCheckpointStore, Watermark
+from dcw.etl.extract import ArrowDatasetExtractor, Extractor, RecordExtractor
+from dcw.etl.load import ListLoader, Loader
+from dcw.etl.pipeline import ProcessingPipeline
+
+
+class FlakyLoader(Loader):
+    """Appends records to a list, and raises on the record `fail_on`. Only flushed records are kept."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.pending = []
+        self.flushed = []
+
+    def load(self, item):
+        if item == self.fail_on:
+            raise RuntimeError("loader failed")
+        self.pending.append(item)
+
+    def flush(self):
+        self.flushed.extend(self.pending)
+        self.pending = []
+
+
+class NotResumable(Extractor):
+    def iter_records(self):
+        yield from range(3)
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteCheckpointStore(tmp_path / "checkpoints.db")
+    else:
+        store = FileCheckpointStore(tmp_path / "checkpoints")
+    yield store
+    store.close()
+
+
+def test_checkpoint_store(store):
+    assert store.load("a") is None
+    store.save("a", [1, 2])
+    store.save("b/c", "x")
+    assert store.load("a") == [1, 2]
+    assert store.load("b/c") == "x"
+    store.clear("a")
+    assert store.load("a") is None
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_resume_after_failure(store, engine):
+    def run(loader, resume):
+        pipeline = ProcessingPipeline(engine=engine)
+        pipeline.add_loader(loader)
+        # with one record in flight, every record before the one being pushed has completed
+        pipeline.extract(RecordExtractor(range(20)), max_in_flight=1,
+                         checkpoint=Checkpoint(store, "key", every=3, resume=resume))
+
+    failed = FlakyLoader(fail_on=10)
+    with pytest.raises(RuntimeError):
+        run(failed, resume=False)
+
+    # nothing past the records that were flushed is saved
+    position = store.load("key")
+    assert position is not None and position < len(failed.flushed)
+
+    resumed = FlakyLoader()
+    run(resumed, resume=True)
+    assert resumed.flushed == list(range(position + 1, 20))
+    assert set(failed.flushed) | set(resumed.flushed) == set(range(20))
+    assert store.load("key") == 19
+
+
+def test_resume_false_starts_over(store):
+    store.save("key", 5)
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(3)), checkpoint=Checkpoint(store, "key"))
+    assert loader.records == [0, 1, 2]
+    assert store.load("key") == 2
+
+
+def test_checkpoint_out_of_order():
+    """Records that complete out of order do not move the saved position past an incomplete record."""
+    def slow_first(x):
+        if x == 0:
+            time.sleep(0.2)
+        return x
+
+    saved = []
+
+    class RecordingStore(SQLiteCheckpointStore):
+        def save(self, key, position):
+            saved.append(position)
+
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(slow_first, workers=4, ordered=False)
+    pipeline.add_loader(loader)
+    recording = RecordingStore(":memory:")
+    pipeline.extract(RecordExtractor(range(8)), checkpoint=Checkpoint(recording, "key", every=1))
+    recording.close()
+
+    assert sorted(loader.records) == list(range(8))
+    assert loader.records[-1] == 0
+    assert saved[-1] == 7
+    assert all(position is None or position == 7 for position in saved)
+
+
+def test_checkpoint_requires_resumable_extractor(store):
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(ListLoader())
+    with pytest.raises(ValueError):
+        pipeline.extract(NotResumable(), checkpoint=Checkpoint(store, "key"))
+
+
+def test_watermark():
+    watermark = Watermark(position=3)
+    seqs = [watermark.track(position) for position in (4, 5, 6)]
+    watermark.complete(seqs[2])
+    watermark.complete(seqs[1])
+    assert watermark.position == 3
+    watermark.complete(seqs[0])
+    assert watermark.position == 6
+
+
+def test_arrow_dataset_positions(tmp_path):
+    for i in range(2):
+        pq.write_table(pa.table({"x": list(range(i * 10, i * 10 + 10))}), tmp_path / f"{i}.parquet")
+    extractor = ArrowDatasetExtractor(tmp_path, batch_size=4)
+
+    positions = [position for position, _ in extractor.iter_positions()]
+    assert positions == [[0, 0], [0, 1], [0, 2], [1, 0], [1, 1], [1, 2]]
+
+    resumed = [batch["x"].to_pylist() for _, batch in extractor.iter_positions([0, 2])]
+    assert resumed == [[10, 11, 12, 13], [14, 15, 16, 17], [18, 19]]
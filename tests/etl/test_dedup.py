@@ -0,0 +1,75 @@
+import pytest
+
+from dcw.etl.dedup import BloomFilter, Deduplicator, LRUSet
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader
+from dcw.etl.metrics import render_metrics
+from dcw.etl.pipeline import ProcessingPipeline
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+@pytest.mark.parametrize("mode", ["exact", "bloom"])
+def test_deduplicator_stage(engine, mode):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_deduplicator(lambda record: record["id"], capacity=1000, mode=mode, name="dedup")
+    pipeline.add_loader(loader)
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor({"id": i % 10, "n": i} for i in range(30)))
+
+    assert [record["n"] for record in loader.records] == list(range(10))
+
+    stats = pipeline.stats()["dedup"]
+    assert (stats["kind"], stats["records_in"], stats["records_out"]) == ("filter", 30, 10)
+    assert stats["details"]["duplicates"] == 20
+    assert stats["details"]["keys"] == 10
+    assert stats["details"]["memory_bytes"] > 0
+    if mode == "exact":
+        assert stats["details"]["false_positive_rate"] == 0.0
+    else:
+        assert 0 < stats["details"]["false_positive_rate"] < 0.001
+
+    assert 'dcw_pipeline_stage_detail{pipeline="",stage="dedup",detail="duplicates"} 20' in render_metrics(pipeline)
+
+
+def test_lru_set_capacity():
+    seen = LRUSet(3)
+    assert [seen.add(key) for key in (1, 2, 3, 1, 4, 2)] == [True, True, True, False, True, True]
+    assert len(seen) == 3
+    assert 1 in seen and 3 not in seen
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(i)
+
+    false_positives = sum(i in bloom for i in range(10_000, 20_000))
+    assert false_positives < 200
+    assert bloom.false_positive_rate == pytest.approx(0.01, rel=0.2)
+    assert bloom.memory_bytes < 10_000 * 10 / 8 + 1
+
+
+@pytest.mark.parametrize("mode", ["exact", "bloom"])
+def test_deduplicator_state(tmp_path, mode):
+    state_path = tmp_path / "dedup.state"
+
+    def run(records):
+        loader = ListLoader()
+        pipeline = ProcessingPipeline()
+        pipeline.add_deduplicator(capacity=100, mode=mode, state_path=state_path)
+        pipeline.add_loader(loader)
+        pipeline.extract(RecordExtractor(records))
+        return loader.records
+
+    assert run(["a", "b"]) == ["a", "b"]
+    assert run(["b", "c", ("d", 1)]) == ["c", ("d", 1)]
+    assert run([("d", 1)]) == []
+
+    with pytest.raises(ValueError):
+        Deduplicator(capacity=50, mode=mode, state_path=state_path)
+
+
+def test_deduplicator_invalid_mode():
+    with pytest.raises(ValueError):
+        Deduplicator(capacity=10, mode="fuzzy")
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader
+from dcw.etl.pipeline import ProcessingPipeline
+
+
+def build_pipeline(engine, loader, flattened):
+    pipeline = ProcessingPipeline(name="test", engine=engine)
+    pipeline.add_transform(lambda x: x ** 2, name="square")
+    pipeline.add_transform(lambda x: x + 1, name="increment")
+    pipeline.add_batcher(3, timeout=0.05, name="batch")
+    pipeline.add_loader(loader, name="batch_loader")
+    pipeline.add_flattener(name="flatten")
+    pipeline.add_loader(flattened, name="flat_loader")
+    return pipeline
+
+
+def test_native_engine_matches_streamz():
+    """The native engine produces the same output as the streamz engine."""
+    results = {}
+    for engine in ("streamz", "native"):
+        loader, flattened = ListLoader(), ListLoader()
+        pipeline = build_pipeline(engine, loader, flattened)
+        pipeline.extract(RecordExtractor(range(10)))
+        results[engine] = (loader.records, flattened.records)
+
+    assert results["native"] == results["streamz"]
+    assert results["native"][1] == [x ** 2 + 1 for x in range(10)]
+
+
+def test_native_engine_describe_and_get_loaders():
+    loader, flattened = ListLoader(), ListLoader()
+    pipeline = build_pipeline("native", loader, flattened)
+    assert pipeline.describe() == ["test", "square", "increment", "batch", "batch_loader", "flatten", "flat_loader"]
+    assert list(pipeline.get_loaders()) == [loader, flattened]
+
+
+def test_native_engine_push():
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine="native")
+    pipeline.add_transform(lambda x: x * 2)
+    pipeline.add_loader(loader)
+    pipeline.push(1)
+    pipeline.push(2)
+    assert loader.records == [2, 4]
+
+
+def test_native_engine_push_callback_fires_when_batch_is_emitted():
+    done = []
+    pipeline = ProcessingPipeline(engine="native")
+    pipeline.add_batcher(2)
+    pipeline.add_loader(ListLoader())
+    pipeline.push(1, callback=lambda: done.append(1))
+    assert done == []
+    pipeline.push(2, callback=lambda: done.append(2))
+    assert done == [1, 2]
+
+
+def test_native_engine_batch_timeout():
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine="native")
+    pipeline.add_batcher(10, timeout=0.05)
+    pipeline.add_loader(loader)
+    pipeline.push(1)
+    pipeline.push(2)
+    time.sleep(0.3)
+    assert loader.records == [(1, 2)]
+
+
+def test_native_engine_max_in_flight():
+    """With a batcher timeout, extraction waits for held records to be emitted instead of buffering them."""
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine="native")
+    pipeline.add_batcher(10, timeout=0.01)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(5)), max_in_flight=2)
+    assert [len(batch) for batch in loader.records] == [2, 2, 1]
+
+
+def test_native_engine_held_count():
+    """The running count of held records matches the records held by batchers, windows and loader queues."""
+    import threading
+
+    from dcw.etl.window import Count
+
+    loading = threading.Event()
+    windows = []
+
+    def load(window):
+        loading.wait()
+        windows.append(window)
+
+    pipeline = ProcessingPipeline(engine="native")
+    pipeline.add_batcher(3)
+    pipeline.add_flattener()
+    pipeline.add_window(10, key=lambda r: r[0], timestamp=lambda r: r[1], aggregates={"n": Count()})
+    pipeline.add_loader(load, queue_size=10)
+
+    for record in [("a", 1), ("b", 2), ("a", 3), ("a", 12), ("b", 25), ("a", 30), ("b", 31)]:
+        pipeline.push(record)
+        assert pipeline.in_flight == sum(len(node) for node in pipeline.source.batches())
+    assert pipeline.in_flight > 0
+
+    loading.set()
+    pipeline.source.flush()
+    assert pipeline.in_flight == 0
+    assert sum(window["n"] for window in windows) == 7
+
+
+def test_native_engine_rejects_unsupported_stages():
+    pipeline = ProcessingPipeline(engine="native")
+    with pytest.raises(ValueError):
+        pipeline.add_parallel_transform(lambda x: x)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        ProcessingPipeline(engine="unknown")
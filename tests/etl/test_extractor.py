@@ -1,6 +1,18 @@
+import itertools
 import json
+import math
+import os
+import shutil
 import tempfile
+import threading
+import time
 from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+
 import dcw.etl.extract as extract
 
 
@@ -68,3 +80,332 @@ def test_JsonFileExtractor_callback_on_error():
         assert len(errors) == 1
         assert errors[0][0] == tmpdir / "foo.json"
         assert isinstance(errors[0][1], json.decoder.JSONDecodeError)
+
+
+def test_ArrowDatasetExtractor():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pq.write_table(pa.table({"x": [1, 2, 3], "y": ["a", "b", "c"]}), Path(tmpdir) / "data.parquet")
+
+        extractor = extract.ArrowDatasetExtractor(tmpdir, columns=["x"], filter=pc.field("x") > 1)
+        batches = list(extractor.iter_records())
+
+        assert all(isinstance(batch, pa.RecordBatch) for batch in batches)
+        assert pa.Table.from_batches(batches).to_pydict() == {"x": [2, 3]}
+
+
+def test_shard_extractor():
+    shards = [extract.shard_extractor(extract.RecordExtractor(range(10)), i, 3) for i in range(3)]
+    assert sorted(x for shard in shards for x in shard.iter_records()) == list(range(10))
+
+    positions = list(shards[1].iter_positions())
+    assert positions == [([1, 1], 1), ([4, 4], 4), ([7, 7], 7)]
+    assert list(shards[1].iter_positions(positions[0][0])) == positions[1:]
+
+    class Plain:
+        def iter_records(self):
+            return iter("abc")
+
+    assert not extract.is_resumable_extractor(extract.shard_extractor(Plain(), 0, 2))
+
+
+def test_shard_extractor_splits():
+    """A splittable extractor is sharded by its splits, so each shard only reads its own."""
+    read = []
+
+    class Recording(extract.RecordExtractor):
+        def iter_split(self, split):
+            read.append(split)
+            return super().iter_split(split)
+
+    extractor = Recording(range(10), split_size=3)
+    shards = [extract.shard_extractor(extractor, i, 2) for i in range(2)]
+    assert all(isinstance(shard, extract.SplitShardedExtractor) for shard in shards)
+    assert list(shards[1].iter_records()) == [3, 4, 5, 9]
+    assert read == [range(3, 6), range(9, 10)]
+    assert sorted(x for shard in shards for x in shard.iter_records()) == list(range(10))
+
+    positions = list(shards[0].iter_positions())
+    assert positions == [([0, 0], 0), ([0, 1], 1), ([0, 2], 2), ([1, 0], 6), ([1, 1], 7), ([1, 2], 8)]
+    assert list(shards[0].iter_positions(positions[2][0])) == positions[3:]
+    assert list(shards[0].iter_positions(positions[3][0])) == positions[4:]
+
+    # with fewer splits than shards, records are divided between the shards instead
+    shard = extract.shard_extractor(extract.RecordExtractor(range(10), split_size=5), 0, 3)
+    assert not isinstance(shard, extract.SplitShardedExtractor)
+    assert list(shard.iter_records()) == [0, 3, 6, 9]
+
+
+def test_splittable_extractors():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        for name in ("a", "b", "sub/c", "sub/deeper/d"):
+            (tmpdir / name).parent.mkdir(parents=True, exist_ok=True)
+            with (tmpdir / f"{name}.json").open("w") as f:
+                json.dump(name, f)
+
+        walker = extract.FileWalkExtractor(tmpdir, files_only=True, recursive=True)
+        assert len(walker.splits()) == 3
+        assert (sorted(path for split in walker.splits() for path in walker.iter_split(split))
+                == sorted(walker.iter_records()))
+
+        extractor = extract.JsonFileExtractor(tmpdir)
+        assert len(extractor.splits()) == 4
+        assert (sorted(record for split in extractor.splits() for record in extractor.iter_split(split))
+                == sorted(extractor.iter_records()))
+
+    assert extract.RecordExtractor(iter("abc")).splits() == [None]
+    assert not extract.is_splittable_extractor(extract.shard_extractor(extract.RecordExtractor("abc"), 0, 2))
+
+
+def test_FileWalkExtractor_splits_skip_symlinked_directories(tmp_path):
+    (tmp_path / "data" / "sub").mkdir(parents=True)
+    (tmp_path / "data" / "sub" / "a.txt").write_text("a")
+    (tmp_path / "elsewhere").mkdir()
+    (tmp_path / "elsewhere" / "b.txt").write_text("b")
+    (tmp_path / "data" / "link").symlink_to(tmp_path / "elsewhere", target_is_directory=True)
+
+    walker = extract.FileWalkExtractor(tmp_path / "data", files_only=True, recursive=True)
+    assert walker.splits() == [tmp_path / "data", tmp_path / "data" / "sub"]
+    assert (sorted(path for split in walker.splits() for path in walker.iter_split(split))
+            == sorted(walker.iter_records()) == [tmp_path / "data" / "sub" / "a.txt"])
+
+
+def test_ParallelExtractor():
+    records = extract.RecordExtractor(range(1000), split_size=7)
+    for ordered in (False, True):
+        result = list(extract.ParallelExtractor(records, workers=4, ordered=ordered, buffer_size=3).iter_records())
+        assert result == list(range(1000)) if ordered else sorted(result) == list(range(1000))
+
+    result = list(extract.ParallelExtractor(extract.RecordExtractor(range(100), split_size=10), workers=2,
+                                            processes=True).iter_records())
+    assert sorted(result) == list(range(100))
+
+
+def test_ParallelExtractor_error():
+    class Failing(extract.RecordExtractor):
+        def iter_split(self, split):
+            if split.start == 50:
+                raise ValueError("bad split")
+            return super().iter_split(split)
+
+    with pytest.raises(ValueError, match="bad split"):
+        list(extract.ParallelExtractor(Failing(range(100), split_size=10), workers=3).iter_records())
+
+
+def test_PrefetchingExtractor():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        for i in range(20):
+            with (tmpdir / f"{i:02}.json").open("w") as f:
+                json.dump(i, f)
+
+        json_files = extract.JsonFileExtractor(tmpdir)
+        expected = list(json_files.iter_records())
+        assert list(extract.PrefetchingExtractor(json_files, depth=3).iter_records()) == expected
+        assert list(extract.PrefetchingExtractor(json_files, depth=3, threads=4).iter_records()) == expected
+
+    with pytest.raises(ValueError):
+        extract.PrefetchingExtractor(extract.shard_extractor(extract.RecordExtractor("abc"), 0, 2), threads=2)
+
+
+def test_PrefetchingExtractor_errors_and_early_exit():
+    class Failing:
+        def iter_records(self):
+            yield 1
+            raise ValueError("bad record")
+
+    with pytest.raises(ValueError, match="bad record"):
+        list(extract.PrefetchingExtractor(Failing()).iter_records())
+
+    closed = threading.Event()
+
+    class Endless:
+        def iter_records(self):
+            try:
+                yield from itertools.count()
+            finally:
+                closed.set()
+
+    records = extract.PrefetchingExtractor(Endless(), depth=5).iter_records()
+    assert [next(records) for _ in range(3)] == [0, 1, 2]
+    records.close()
+    assert closed.is_set()
+    assert not any(thread.name == "prefetch" for thread in threading.enumerate())
+
+
+def test_IncrementalFileWalkExtractor(tmp_path):
+    data = tmp_path / "data"
+    (data / "sub" / "deeper").mkdir(parents=True)
+    for name in ("a.txt", "b.csv", "sub/c.txt", "sub/deeper/d.txt"):
+        (data / name).write_text(name)
+
+    manifest = extract.FileManifest(tmp_path / "manifest.db")
+
+    def walk(**kwargs):
+        extractor = extract.IncrementalFileWalkExtractor(data, manifest, recursive=True, glob="*.txt", **kwargs)
+        return sorted(path.relative_to(data).as_posix() for path in extractor.iter_records())
+
+    assert walk() == ["a.txt", "sub/c.txt", "sub/deeper/d.txt"]
+    assert walk() == []
+
+    (data / "sub" / "c.txt").write_text("changed")
+    (data / "sub" / "deeper" / "e.txt").write_text("new")
+    os.utime(data / "sub" / "deeper", ns=(0, 0))  # in case the clock is too coarse to tell the change apart
+    assert walk(prune=True) == ["sub/deeper/e.txt"]  # c.txt was modified in place, so its directory is pruned
+    assert walk() == ["sub/c.txt"]
+
+    shutil.rmtree(data / "sub" / "deeper")
+    assert walk() == []
+    assert len(manifest) == 2
+
+    with pytest.raises(ValueError):
+        extract.IncrementalFileWalkExtractor(data, manifest, glob="sub/*.txt")
+    manifest.close()
+
+
+def test_IncrementalFileWalkExtractor_commit(tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+    manifest = extract.FileManifest(tmp_path / "manifest.db", name="walk")
+
+    extractor = extract.IncrementalFileWalkExtractor(tmp_path, manifest, glob="*.txt", auto_commit=False)
+    assert len(list(extractor.iter_records())) == 1
+    manifest.rollback()  # e.g. the pipeline failed
+    assert len(list(extractor.iter_records())) == 1
+    extractor.commit()
+    manifest.close()
+
+    manifest = extract.FileManifest(tmp_path / "manifest.db", name="walk")
+    extractor = extract.IncrementalFileWalkExtractor(tmp_path, manifest, glob="*.txt")
+    assert list(extractor.iter_records()) == []
+
+    # a walk that stops part of the way through is not committed
+    (tmp_path / "b.txt").write_text("b")
+    (tmp_path / "c.txt").write_text("c")
+    records = extractor.iter_records()
+    next(records)
+    records.close()
+    assert len(list(extractor.iter_records())) == 2
+    manifest.close()
+
+
+def test_FileWalkExtractor_threads(tmp_path):
+    for i in range(5):
+        for j in range(5):
+            (tmp_path / f"d{i}" / f"e{j}").mkdir(parents=True)
+            (tmp_path / f"d{i}" / f"e{j}" / "x.json").write_text("1")
+            (tmp_path / f"d{i}" / f"e{j}" / "y.txt").write_text("1")
+        (tmp_path / f"d{i}" / "z.json").write_text("1")
+
+    for kwargs in ({}, {"glob": "*.json"}, {"glob": "e1/*.json"}, {"files_only": False}):
+        expected = sorted(extract.FileWalkExtractor(tmp_path, recursive=True, **kwargs).iter_records())
+        walker = extract.FileWalkExtractor(tmp_path, recursive=True, threads=4, **kwargs)
+        assert sorted(walker.iter_records()) == expected
+
+    ordered = extract.FileWalkExtractor(tmp_path, recursive=True, glob="*.json", threads=4, ordered=True)
+    paths = [path.relative_to(tmp_path).as_posix() for path in ordered.iter_records()]
+    assert paths[:7] == ["d0/z.json", "d0/e0/x.json", "d0/e1/x.json", "d0/e2/x.json", "d0/e3/x.json",
+                         "d0/e4/x.json", "d1/z.json"]
+    assert [position for position, _ in ordered.iter_positions(4)] == list(range(5, 30))
+
+    with pytest.raises(ValueError):
+        extract.FileWalkExtractor(tmp_path, recursive=True, threads=4).iter_positions()
+
+
+def test_walk_parallel_ordered_buffer_is_bounded():
+    """An ordered walk stops scanning ahead of the reader once its buffer of scanned directories is full."""
+    tree = {Path("root"): [Path(f"root/{i:02}") for i in range(40)]}
+    for child in list(tree[Path("root")]):
+        tree[child] = [child / f"{j}" for j in range(3)]
+    scanned = []
+
+    def scan(directory):
+        scanned.append(directory)
+        return [directory], tree.get(directory, [])
+
+    walk = extract._walk_parallel(Path("root"), scan, threads=4, ordered=True, buffer_size=2)
+    paths = []
+    for path in walk:
+        paths.append(path)
+        time.sleep(0.001)
+        assert len(scanned) - len(paths) <= 2 + 4 + 1
+
+    def depth_first(directory):
+        yield directory
+        for subdir in tree.get(directory, []):
+            yield from depth_first(subdir)
+
+    assert paths == list(depth_first(Path("root")))
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_FileWalkExtractor_threads_error(tmp_path, ordered):
+    for i in range(10):
+        (tmp_path / f"d{i}").mkdir()
+        (tmp_path / f"d{i}" / "x").write_text("1")
+
+    class Failing(extract.FileWalkExtractor):
+        def _scan(self, directory):
+            if directory.name == "d7":
+                raise PermissionError(directory)
+            return super()._scan(directory)
+
+    with pytest.raises(PermissionError):
+        list(Failing(tmp_path, recursive=True, threads=3, ordered=ordered).iter_records())
+
+    records = extract.FileWalkExtractor(tmp_path, recursive=True, threads=3, ordered=ordered).iter_records()
+    next(records)
+    records.close()
+    assert not any(thread.name.startswith("walker") for thread in threading.enumerate())
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"workers": 4},
+    {"workers": 4, "ordered": False},
+    {"workers": 2, "processes": True},
+])
+def test_JsonFileExtractor_workers(tmp_path, kwargs):
+    for i in range(30):
+        # integers beyond 64 bits are not supported by orjson
+        (tmp_path / f"{i:02}.json").write_text(json.dumps({"i": i, "big": 2 ** 70}))
+    (tmp_path / "bad.json").write_text("not json")
+
+    errors = []
+
+    def on_error(path, e):
+        errors.append((path.name, threading.current_thread()))
+
+    records = list(extract.JsonFileExtractor(tmp_path, on_error=on_error, **kwargs).iter_records())
+    expected = list(extract.JsonFileExtractor(tmp_path, on_error=lambda path, e: None).iter_records())
+    assert len(expected) == 30
+    assert (tmp_path / "01.json", {"i": 1, "big": 2 ** 70}) in records
+    assert errors == [("bad.json", threading.current_thread())]
+
+    if kwargs.get("ordered", True):
+        assert records == expected
+        positions = extract.JsonFileExtractor(tmp_path, on_error=on_error, **kwargs).iter_positions(9)
+        sequential = extract.JsonFileExtractor(tmp_path, on_error=on_error)
+        assert list(positions) == list(sequential.iter_positions(9))
+    else:
+        assert sorted(records) == sorted(expected)
+        with pytest.raises(ValueError):
+            extract.JsonFileExtractor(tmp_path, **kwargs).iter_positions()
+
+
+def test_JsonFileExtractor_backends(tmp_path):
+    (tmp_path / "a.json").write_text('{"x": [1, 2.5, "three", null]}')
+    (tmp_path / "nan.json").write_text("NaN")  # not strictly JSON, but accepted by json
+    (tmp_path / "big.json").write_text(str(2 ** 64 + 1))
+
+    # the default backend parses integers beyond 64 bits exactly, whether or not orjson is installed
+    records = dict(extract.JsonFileExtractor(tmp_path).iter_records())
+    assert records[tmp_path / "a.json"] == {"x": [1, 2.5, "three", None]}
+    assert math.isnan(records[tmp_path / "nan.json"])
+    assert records[tmp_path / "big.json"] == 2 ** 64 + 1
+
+    if extract.orjson is not None:
+        records = dict(extract.JsonFileExtractor(tmp_path, backend="orjson").iter_records())
+        assert records[tmp_path / "a.json"] == {"x": [1, 2.5, "three", None]}
+        assert math.isnan(records[tmp_path / "nan.json"])
+
+    with pytest.raises(ValueError):
+        extract.JsonFileExtractor(tmp_path, backend="simdjson")
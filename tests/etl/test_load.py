@@ -6,6 +6,8 @@ import os
 import tempfile
 from pathlib import Path
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import snappy
 
 from dcw.etl.load import ListLoader, TextFileLoader, ParquetLoader
@@ -195,3 +197,67 @@ def test_parquet_load_to_partitioned():
 
         readback = pd.read_parquet(output_dir)
         assert readback.equals(data), "Expected reading back loaded data to match original data"
+
+
+def test_parquet_load_arrow_batches_on_flush():
+    """Test that ParquetLoader writes Arrow record batches as row groups of one file, completed on flush."""
+    batches = [pa.RecordBatch.from_pydict({"x": [1, 2]}), pa.RecordBatch.from_pydict({"x": [3]})]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = Path(tmpdir) / "data.parquet"
+        loader = ParquetLoader(filename)
+        for batch in batches:
+            loader.load(batch)
+        loader.flush()
+
+        parquet_file = pq.ParquetFile(filename)
+        assert parquet_file.metadata.num_row_groups == 2
+        assert parquet_file.read().to_pydict() == {"x": [1, 2, 3]}
+
+        # a second run appends to the existing file
+        loader.load(pa.table({"x": [4]}))
+        loader.flush()
+        assert pq.read_table(filename).to_pydict() == {"x": [1, 2, 3, 4]}
+
+
+def test_parquet_load_arrow_keeps_file_until_flush():
+    """Test that ParquetLoader leaves the existing file intact until Arrow records are flushed."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = Path(tmpdir) / "data.parquet"
+        pq.write_table(pa.table({"x": [1, 2]}), filename)
+
+        loader = ParquetLoader(filename)
+        loader.load(pa.RecordBatch.from_pydict({"x": [3]}))
+        # e.g. the process dies here, before flushing
+        assert pq.read_table(filename).to_pydict() == {"x": [1, 2]}
+
+        loader.flush()
+        assert pq.read_table(filename).to_pydict() == {"x": [1, 2, 3]}
+        assert [x.name for x in Path(tmpdir).iterdir()] == ["data.parquet"]
+
+
+def test_parquet_load_mixed_dataframes_and_arrow():
+    """Test that ParquetLoader keeps every row when DataFrames and Arrow records are written to the same file."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = Path(tmpdir) / "data.parquet"
+        loader = ParquetLoader(filename)
+        loader.load(pa.RecordBatch.from_pydict({"x": [1, 2]}))
+        loader.load(pd.DataFrame({"x": [3]}))
+        loader.load(pa.table({"x": [4]}))
+        loader.flush()
+
+        assert pq.read_table(filename).to_pydict() == {"x": [1, 2, 3, 4]}
+
+
+def test_parquet_load_arrow_partitioned():
+    """Test that ParquetLoader partitions Arrow record batches."""
+    batch = pa.RecordBatch.from_pydict({"symbol": ["ABC", "XYZ", "ABC"], "price": [200, 100, 201]})
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_dir = Path(tmpdir)
+        loader = ParquetLoader(output_dir, partition_key=lambda x: x["symbol"])
+        loader.load(batch)
+        loader.flush()
+
+        assert sorted((x.name for x in output_dir.glob("*"))) == ["ABC.parquet", "XYZ.parquet"]
+        assert pq.read_table(output_dir / "ABC.parquet").to_pydict() == {"symbol": ["ABC", "ABC"], "price": [200, 201]}
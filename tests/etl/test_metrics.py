@@ -0,0 +1,92 @@
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader, Loader
+from dcw.etl.metrics import MetricsExporter, render_metrics
+from dcw.etl.pipeline import ProcessingPipeline
+
+
+class BlockingLoader(Loader):
+    """A loader that waits for an event before loading each record."""
+
+    def __init__(self):
+        self.records = []
+        self.release = threading.Event()
+
+    def load(self, item):
+        self.release.wait()
+        self.records.append(item)
+
+
+def _samples(text):
+    """Parse the samples in Prometheus text into a dict of {"name{labels}": value}."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            samples[key] = float(value)
+    return samples
+
+
+def test_render_metrics():
+    pipeline = ProcessingPipeline(name="test")
+    pipeline.add_transform(lambda x: x, name='say "hi"')
+    pipeline.add_loader(ListLoader(), name="load")
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(5)))
+
+    samples = _samples(render_metrics(pipeline))
+    assert samples['dcw_pipeline_records_out_total{pipeline="test",stage="say \\"hi\\"",kind="transform"}'] == 5
+    assert samples['dcw_pipeline_loader_flushes_total{pipeline="test",stage="load"}'] == 1
+    assert samples['dcw_pipeline_stage_latency_seconds_bucket{pipeline="test",stage="load",le="+Inf"}'] == 5
+    assert samples['dcw_pipeline_stage_latency_seconds_count{pipeline="test",stage="load"}'] == 5
+    assert samples['dcw_pipeline_in_flight{pipeline="test"}'] == 0
+    assert samples["process_max_resident_memory_bytes"] > 0
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_metrics_served_while_running(engine):
+    """Metrics, including the in-flight count, can be scraped while the pipeline is running."""
+    loader = BlockingLoader()
+    pipeline = ProcessingPipeline(name="test", engine=engine)
+    pipeline.add_batcher(2, timeout=0.01)
+    pipeline.add_loader(loader)
+
+    with MetricsExporter(pipeline, port=0) as exporter:
+        thread = threading.Thread(target=pipeline.extract, args=(RecordExtractor(range(4)),), daemon=True)
+        thread.start()
+        try:
+            time.sleep(0.2)
+            with urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}/metrics") as response:
+                samples = _samples(response.read().decode())
+            assert samples['dcw_pipeline_in_flight{pipeline="test"}'] > 0
+        finally:
+            loader.release.set()
+            thread.join()
+
+    assert len(loader.records) == 2
+
+
+def test_metrics_file(tmp_path):
+    path = tmp_path / "metrics" / "pipeline.prom"
+    pipeline = ProcessingPipeline(name="test")
+    pipeline.add_loader(ListLoader(), name="load")
+
+    with MetricsExporter(pipeline, path=path, interval=0.01):
+        pipeline.extract(RecordExtractor(range(3)))
+        time.sleep(0.05)
+        assert path.exists()
+
+    # the final values are written when the exporter stops, and no temporary files are left behind
+    samples = _samples(path.read_text())
+    assert samples['dcw_pipeline_records_in_total{pipeline="test",stage="load",kind="loader"}'] == 3
+    assert [p.name for p in path.parent.iterdir()] == ["pipeline.prom"]
+
+
+def test_metrics_exporter_requires_destination():
+    with pytest.raises(ValueError):
+        MetricsExporter(ProcessingPipeline())
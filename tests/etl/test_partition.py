@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+
+import pytest
+
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader, Loader
+from dcw.etl.pipeline import ProcessingPipeline
+
+
+class CountingLoader(ListLoader):
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+        self.threads = set()
+
+    def load(self, item):
+        self.threads.add(threading.current_thread().name)
+        super().load(item)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def _jitter(record):
+    time.sleep(random.random() / 1000)
+    return record
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_partitioner_preserves_order_per_key(engine):
+    loaders = []
+
+    def new_loader(lane):
+        loaders.append(CountingLoader())
+        return loaders[-1]
+
+    records = [(key, n) for n in range(20) for key in "abcdefgh"]
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_partitioner(lambda record: record[0], partitions=4)
+    pipeline.add_transform(_jitter)
+    pipeline.add_loader(new_loader)
+    pipeline.extract(RecordExtractor(records))
+
+    assert len(loaders) == 4
+    assert sorted(record for loader in loaders for record in loader.records) == sorted(records)
+    for loader in loaders:
+        assert loader.flushes == 1
+        assert len(loader.threads) <= 1
+        for key in "abcdefgh":
+            assert [n for k, n in loader.records if k == key] in ([], list(range(20)))
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_partitioner_runs_lanes_in_parallel(engine):
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_partitioner(lambda record: record, partitions=4)
+    pipeline.add_transform(lambda record: time.sleep(0.05) or record)
+    pipeline.add_loader(ListLoader())
+
+    start = time.perf_counter()
+    pipeline.extract(RecordExtractor(range(4)), max_in_flight=8)
+    assert time.perf_counter() - start < 0.15
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_partitioner_flushes_lane_batchers(engine):
+    loader = CountingLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_partitioner(lambda record: record % 2, partitions=2, name="part")
+    pipeline.add_batcher(100)
+    pipeline.add_loader(loader, name="load")
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(5)))
+
+    assert sorted(loader.records) == [(0, 2, 4), (1, 3)]
+    assert loader.flushes == 1
+
+    stats = pipeline.stats()
+    assert stats["part"]["kind"] == "partitioner"
+    assert (stats["part"]["records_in"], stats["part"]["records_out"]) == (5, 5)
+    assert {name for name in stats if name.startswith("load")} == {"load[0]", "load[1]"}
+    assert stats["batcher[0]"]["records_in"] + stats["batcher[1]"]["records_in"] == 5
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_partitioner_lane_error(engine):
+    class FailingLoader(Loader):
+        def load(self, item):
+            if item == 3:
+                raise ValueError("three")
+
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_partitioner(lambda record: record, partitions=2)
+    pipeline.add_loader(FailingLoader())
+
+    with pytest.raises(ValueError, match="three"):
+        pipeline.extract(RecordExtractor(range(5)))
+
+
+def test_partitioner_rejects_parallel_stages():
+    pipeline = ProcessingPipeline()
+    pipeline.add_partitioner(lambda record: record, partitions=2)
+    with pytest.raises(ValueError):
+        pipeline.add_parallel_transform(lambda record: record)
+    with pytest.raises(ValueError):
+        pipeline.add_partitioner(lambda record: record, partitions=2)
@@ -1,8 +1,55 @@
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import pytest
 
 from dcw.etl.pipeline import ProcessingPipeline, PipelineFactory, run_pipeline
-from dcw.etl.extract import Extractor, RecordExtractor
-from dcw.etl.load import ListLoader, PrintLoader
+from dcw.etl.extract import ArrowDatasetExtractor, Extractor, RecordExtractor
+from dcw.etl.load import ListLoader, Loader, ParquetLoader, PrintLoader
+from dcw.etl.transform import ArrowComputeTransformation
+
+# state set up in worker processes by _init_offset, used by _add_offset
+_offset = 0
+
+
+def _square(x):
+    return x ** 2
+
+
+def _init_offset(offset):
+    global _offset
+    _offset = offset
+
+
+def _add_offset(x):
+    return x + _offset
+
+
+def _crash(x):
+    if x == 5:
+        os._exit(1)
+    return x
+
+
+class SlowLoader(ListLoader):
+    def __init__(self, delay=0.0, flush_delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.flush_delay = flush_delay
+        self.release = threading.Event()
+        self.release.set()
+
+    def load(self, item):
+        self.release.wait()
+        time.sleep(self.delay)
+        super().load(item)
+
+    def flush(self):
+        time.sleep(self.flush_delay)
 
 
 def test_ProcessingPipeline():
@@ -214,3 +261,353 @@ def test_run_pipeline_from_factory():
 
     run_pipeline(TestPipelineFactory(), TestPipelineFactory.Options(num=num))
     assert destination == list(range(num))
+
+
+def test_ProcessingPipeline_parallel_transform_preserves_order():
+    """Records transformed on a thread pool are loaded in input order when ordered=True."""
+    import random
+    import time
+
+    def slow_square(x):
+        time.sleep(random.random() / 100)
+        return x ** 2
+
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(slow_square, workers=8, ordered=True)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(100)))
+    assert loader.records == [x ** 2 for x in range(100)]
+
+
+def test_ProcessingPipeline_parallel_transform_unordered():
+    """All records are loaded before extract returns, even when they complete out of order."""
+    import random
+    import time
+
+    def slow_square(x):
+        time.sleep(random.random() / 100)
+        return x ** 2
+
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(slow_square, workers=8, ordered=False)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(100)))
+    assert sorted(loader.records) == [x ** 2 for x in range(100)]
+
+
+def test_ProcessingPipeline_parallel_transform_with_batcher():
+    """Parallel transforms cooperate with batchers, which run on an event loop."""
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(lambda x: x ** 2, workers=4, buffer_size=2)
+    pipeline.add_batcher(3, timeout=0.1)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(10)))
+    assert [x for batch in loader.records for x in batch] == [x ** 2 for x in range(10)]
+
+
+def test_ProcessingPipeline_parallel_transform_raises():
+    """An exception raised on a worker thread is raised from extract."""
+    def fail(x):
+        if x == 3:
+            raise RuntimeError("boom")
+        return x
+
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(fail, workers=2)
+    pipeline.add_loader(ListLoader())
+    with pytest.raises(RuntimeError):
+        pipeline.extract(RecordExtractor(range(10)))
+
+
+def test_ProcessingPipeline_parallel_transform_shuts_down_threads():
+    """The worker threads are shut down when extract returns, and started again for the next extract."""
+    def workers():
+        return [t for t in threading.enumerate() if t.name.startswith("squarer")]
+
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(lambda x: x ** 2, workers=4, name="squarer")
+    pipeline.add_loader(loader)
+    for _ in range(3):
+        pipeline.extract(RecordExtractor(range(20)))
+        assert workers() == []
+    assert loader.records == [x ** 2 for x in range(20)] * 3
+
+
+def test_ProcessingPipeline_close_shuts_down_threads():
+    """Records can be pushed without extract, in which case close shuts down the worker threads."""
+    loader = ListLoader()
+    with ProcessingPipeline() as pipeline:
+        pipeline.add_parallel_transform(lambda x: x ** 2, workers=2, name="pushed")
+        pipeline.add_loader(loader)
+        done = threading.Event()
+        pipeline.push(3, callback=done.set)
+        assert done.wait(5)
+    assert loader.records == [9]
+    assert not any(t.name.startswith("pushed") for t in threading.enumerate())
+
+
+def test_ProcessingPipeline_process_transform():
+    """Records transformed on a process pool are loaded in input order."""
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_process_transform(_square, workers=2, chunksize=7)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(100)))
+    assert loader.records == [x ** 2 for x in range(100)]
+
+
+def test_ProcessingPipeline_process_transform_initializer():
+    """The initializer is run in each worker process before records are transformed."""
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_process_transform(_add_offset, workers=2, initializer=_init_offset, initargs=(1000,))
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(10)))
+    assert loader.records == [x + 1000 for x in range(10)]
+
+
+def test_ProcessingPipeline_process_transform_shuts_down_workers():
+    """The worker processes have exited when extract returns, including after a worker crashed."""
+    import multiprocessing
+
+    loader = ListLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_process_transform(_square, workers=2)
+    pipeline.add_loader(loader)
+    for _ in range(3):
+        pipeline.extract(RecordExtractor(range(10)))
+        assert multiprocessing.active_children() == []
+    assert loader.records == [x ** 2 for x in range(10)] * 3
+
+    pipeline = ProcessingPipeline()
+    pipeline.add_process_transform(_crash, workers=2, chunksize=2)
+    pipeline.add_loader(ListLoader())
+    with pytest.raises(Exception):
+        pipeline.extract(RecordExtractor(range(100)))
+    assert multiprocessing.active_children() == []
+
+
+def test_ProcessingPipeline_process_transform_worker_crash():
+    """A worker process that dies is reported as an error rather than hanging the pipeline."""
+    from concurrent.futures.process import BrokenProcessPool
+
+    pipeline = ProcessingPipeline()
+    pipeline.add_process_transform(_crash, workers=2, chunksize=2)
+    pipeline.add_loader(ListLoader())
+    with pytest.raises(BrokenProcessPool):
+        pipeline.extract(RecordExtractor(range(100)))
+
+
+def test_ProcessingPipeline_max_in_flight():
+    """Extraction pauses while max_in_flight records have not made it through the pipeline."""
+    import time
+
+    MAX_IN_FLIGHT = 5
+    in_flight = []
+
+    class SlowLoader(ListLoader):
+        def load(self, item):
+            time.sleep(0.001)
+            super().load(item)
+
+    class CountingExtractor(Extractor):
+        def iter_records(self):
+            for i in range(50):
+                in_flight.append(i - sum(len(batch) for batch in list(loader.records)))
+                yield i
+
+    loader = SlowLoader()
+    pipeline = ProcessingPipeline()
+    pipeline.add_batcher(2, timeout=0.01)
+    pipeline.add_loader(loader)
+    pipeline.extract(CountingExtractor(), max_in_flight=MAX_IN_FLIGHT)
+
+    assert [x for batch in loader.records for x in batch] == list(range(50))
+    assert max(in_flight) <= MAX_IN_FLIGHT
+
+
+def test_ProcessingPipeline_max_in_flight_must_be_positive():
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(ListLoader())
+    with pytest.raises(ValueError):
+        pipeline.extract(RecordExtractor([1]), max_in_flight=0)
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_batch_transform(engine):
+    """A batch transform is called once per batch and emits individual records."""
+    batches = []
+
+    def square(x):
+        batches.append(len(x))
+        return x ** 2
+
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_batch_transform(square, 4, timeout=0.05, name="square")
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(10)))
+
+    assert loader.records == [x ** 2 for x in range(10)]
+    assert batches == [4, 4, 2]
+    assert pipeline.end_name == "square.flattener"
+
+
+def test_ProcessingPipeline_batch_transform_without_flatten():
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine="native")
+    pipeline.add_batch_transform(lambda df: df["a"].sum(), 2, collect="pandas", flatten=False)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor([{"a": 1}, {"a": 2}, {"a": 3}]))
+    assert loader.records == [3, 3]
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_columnar(tmp_path, engine):
+    """Arrow record batches flow from extractor to loader without being converted to rows."""
+    pq.write_table(pa.table({"x": list(range(10))}), tmp_path / "input.parquet")
+    output = tmp_path / "output" / "data.parquet"
+
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_transform(ArrowComputeTransformation({"y": lambda batch: pc.multiply(batch["x"], 2)},
+                                                      where=lambda batch: pc.less(batch["x"], 5)))
+    pipeline.add_loader(ParquetLoader(output))
+    pipeline.extract(ArrowDatasetExtractor(tmp_path / "input.parquet", batch_size=3))
+
+    assert pq.read_table(output).to_pydict() == {"x": [0, 1, 2, 3, 4], "y": [0, 2, 4, 6, 8]}
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_queued_loaders_run_in_parallel(engine):
+    loaders = [SlowLoader(delay=0.05), SlowLoader(delay=0.05)]
+    pipeline = ProcessingPipeline(engine=engine)
+    for loader in loaders:
+        pipeline.add_loader(loader, queue_size=10)
+
+    start = time.perf_counter()
+    pipeline.extract(RecordExtractor(range(4)))
+    assert time.perf_counter() - start < 0.35
+    assert [loader.records for loader in loaders] == [[0, 1, 2, 3]] * 2
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_queued_loader_does_not_stall_others(engine):
+    slow, fast = SlowLoader(), ListLoader()
+    slow.release.clear()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_loader(slow, queue_size=100, name="slow")
+    pipeline.add_loader(fast)
+    pipeline.enable_stats()
+
+    thread = threading.Thread(target=pipeline.extract, args=(RecordExtractor(range(50)),), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while len(fast.records) < 50 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (len(fast.records), len(slow.records)) == (50, 0)
+    assert thread.is_alive()
+    assert pipeline.stats()["slow"]["details"]["queued"] + pipeline.stats()["slow"]["details"]["loading"] == 50
+
+    slow.release.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert slow.records == list(range(50))
+    assert (pipeline.stats()["slow"]["records_in"], pipeline.stats()["slow"]["records_out"]) == (50, 50)
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_queued_loader_workers_and_errors(engine):
+    class FailingLoader(Loader):
+        def load(self, item):
+            if item == 3:
+                raise ValueError("three")
+
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_loader(FailingLoader(), queue_size=2, workers=3)
+    with pytest.raises(ValueError, match="three"):
+        pipeline.extract(RecordExtractor(range(10)))
+
+    with pytest.raises(ValueError):
+        ProcessingPipeline().add_loader(ListLoader(), workers=2)
+
+
+def test_ProcessingPipeline_flushes_loaders_concurrently():
+    pipeline = ProcessingPipeline()
+    for _ in range(3):
+        pipeline.add_loader(SlowLoader(flush_delay=0.1))
+
+    start = time.perf_counter()
+    pipeline.flush_loaders()
+    assert time.perf_counter() - start < 0.25
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_branch_and_merge(engine):
+    extracted = []
+    raw, merged = ListLoader(), ListLoader()
+
+    class CountingExtractor(Extractor):
+        def iter_records(self):
+            for x in range(10):
+                extracted.append(x)
+                yield x
+
+    pipeline = ProcessingPipeline(engine=engine)
+    archive = pipeline.branch()
+    archive.add_batcher(4, timeout=0.05)
+    archive.add_loader(raw, name="raw")
+    negated = pipeline.branch()
+    negated.add_transform(lambda x: -x)
+    negated.add_batch_transform(lambda x: x * 10, 3, timeout=0.05)
+    pipeline.add_transform(lambda x: x + 100)
+    pipeline.merge(negated, name="merge")
+    pipeline.add_loader(merged, name="merged")
+    pipeline.enable_stats()
+    pipeline.extract(CountingExtractor(), max_in_flight=5)
+
+    assert extracted == list(range(10))
+    assert [x for batch in raw.records for x in batch] == list(range(10))
+    assert sorted(merged.records) == sorted([x + 100 for x in range(10)] + [-x * 10 for x in range(10)])
+    assert pipeline.in_flight == 0
+    assert list(pipeline.get_loaders()) == [raw, merged]
+
+    stats = pipeline.stats()
+    assert (stats["merge"]["kind"], stats["merge"]["records_in"], stats["merge"]["records_out"]) == ("merge", 20, 20)
+    assert stats["merged"]["records_in"] == 20
+    assert stats["merged"]["flushes"] == stats["raw"]["flushes"] == 1
+
+
+def test_ProcessingPipeline_branch_requires_loader():
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(ListLoader())
+    branch = pipeline.branch()
+    branch.add_transform(_square)
+    with pytest.raises(ValueError, match="loader"):
+        pipeline.extract(RecordExtractor(range(3)))
+
+    with pytest.raises(ValueError):
+        pipeline.merge(ProcessingPipeline().branch())
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_ProcessingPipeline_branch_in_partitioner_lanes(engine):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_partitioner(lambda x: x % 2, partitions=2)
+    doubled = pipeline.branch()
+    doubled.add_transform(lambda x: x * 2)
+    pipeline.merge(doubled)
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor(range(6)))
+
+    assert sorted(loader.records) == sorted(list(range(6)) + [x * 2 for x in range(6)])
+
+    other = ProcessingPipeline(engine=engine)
+    plain = other.branch()
+    other.add_partitioner(lambda x: x, partitions=2)
+    with pytest.raises(ValueError):
+        other.merge(plain)
@@ -0,0 +1,34 @@
+import pstats
+import threading
+
+from dcw.etl.profiling import profile
+
+
+def _busy():
+    return sum(i * i for i in range(1000))
+
+
+def _calls(path, function_name):
+    stats = pstats.Stats(str(path))
+    return sum(calls for (_, _, name), (_, calls, *_) in stats.stats.items() if name == function_name)
+
+
+def test_profile_includes_threads(tmp_path):
+    path = tmp_path / "out.prof"
+
+    with profile(path):
+        _busy()
+        threads = [threading.Thread(target=_busy) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert _calls(path, "_busy") == 4
+
+
+def test_profile_stops_profiling_new_threads(tmp_path):
+    with profile(tmp_path / "first.prof"):
+        pass
+
+    assert threading.getprofile() is None
@@ -0,0 +1,197 @@
+import asyncio
+import time
+import tracemalloc
+
+import pytest
+
+from dcw.etl.aio import AsyncProcessingPipeline
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader, Loader
+from dcw.etl.pipeline import ProcessingPipeline
+from dcw.etl.stats import LatencyHistogram, format_stats, merge_stats
+
+
+class SlowLoader(Loader):
+    def load(self, item):
+        time.sleep(0.01)
+
+
+def _counts(stats):
+    return {name: (s["kind"], s["records_in"], s["records_out"], s["errors"]) for name, s in stats.items()}
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_stats_counts(engine):
+    pipeline = ProcessingPipeline(name="test", engine=engine)
+    pipeline.add_transform(lambda x: x + 1)
+    pipeline.add_transform(lambda x: x * 2)
+    pipeline.add_batcher(3, timeout=0.05)
+    pipeline.add_flattener()
+    pipeline.add_loader(ListLoader())
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(7)))
+
+    assert _counts(pipeline.stats()) == {
+        "test": ("source", 7, 7, 0),
+        "transform": ("transform", 7, 7, 0),
+        "transform-2": ("transform", 7, 7, 0),
+        "batcher": ("batcher", 7, 3, 0),
+        "flattener": ("flattener", 3, 7, 0),
+        "loader": ("loader", 7, 7, 0),
+    }
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_stats_time_excludes_downstream(engine):
+    """A fast transformation in front of a slow loader is not charged for the loader's time."""
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_transform(lambda x: x, name="fast")
+    pipeline.add_loader(SlowLoader(), name="slow")
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(10)))
+
+    stats = pipeline.stats()
+    assert stats["slow"]["time"] >= 0.1
+    assert stats["fast"]["time"] < stats["slow"]["time"] / 10
+    assert stats["slow"]["latency"]["count"] == 10
+    assert stats["slow"]["latency"]["p50"] >= 0.01
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_stats_count_errors(engine):
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("three")
+        return x
+
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_transform(fail_on_three, name="check")
+    pipeline.add_loader(ListLoader())
+    pipeline.enable_stats()
+
+    with pytest.raises(ValueError):
+        pipeline.extract(RecordExtractor(range(5)))
+
+    assert _counts(pipeline.stats())["check"] == ("transform", 4, 3, 1)
+
+
+def test_stats_parallel_transform():
+    pipeline = ProcessingPipeline()
+    pipeline.add_parallel_transform(lambda x: time.sleep(0.01) or x, workers=4, name="sleep")
+    pipeline.add_loader(ListLoader())
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(8)))
+
+    stats = pipeline.stats()["sleep"]
+    assert (stats["records_in"], stats["records_out"], stats["errors"]) == (8, 8, 0)
+    assert stats["latency"]["count"] == 8
+    assert stats["time"] >= 0.08
+
+
+def test_stats_disabled_by_default():
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(ListLoader())
+    assert pipeline.stats() == {}
+
+
+def test_stats_include_stages_added_later():
+    pipeline = ProcessingPipeline()
+    pipeline.enable_stats()
+    pipeline.add_transform(lambda x: x, name="late")
+    pipeline.add_loader(ListLoader())
+    pipeline.extract(RecordExtractor(range(3)))
+    assert pipeline.stats()["late"]["records_in"] == 3
+
+
+def test_stats_async_pipeline():
+    async def double(x):
+        await asyncio.sleep(0)
+        return x * 2
+
+    pipeline = AsyncProcessingPipeline()
+    pipeline.add_transform(double, concurrency=2, name="double")
+    pipeline.add_batcher(2)
+    pipeline.add_loader(ListLoader(), name="load")
+    pipeline.enable_stats()
+    asyncio.run(pipeline.extract(RecordExtractor(range(5))))
+
+    assert _counts(pipeline.stats()) == {
+        "source": ("source", 5, 5, 0),
+        "double": ("transform", 5, 5, 0),
+        "batcher": ("batcher", 5, 3, 0),
+        "load": ("loader", 3, 3, 0),
+    }
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+
+    for _ in range(99):
+        histogram.record(0.000_01)
+    histogram.record(1.0)
+
+    assert histogram.percentile(50) == histogram.percentile(99) == 16e-6
+    assert histogram.percentile(100) == 2 ** 20 / 1e6
+    assert histogram.max == 1.0
+
+
+def test_format_stats():
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(ListLoader(), name="load")
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(3)))
+
+    table = format_stats(pipeline.stats())
+    assert "load" in table and "Records/s" in table
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_stats_memory(engine):
+    """Memory allocated by a stage is attributed to it, and not to the stages upstream of it."""
+    kept = []
+
+    def allocate(x):
+        kept.append(bytearray(100_000))
+        return x
+
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_transform(lambda x: x, name="noop")
+    pipeline.add_transform(allocate, name="allocate")
+    pipeline.add_loader(ListLoader(), name="load")
+    pipeline.enable_stats(memory=True)
+
+    tracemalloc.start()
+    try:
+        pipeline.extract(RecordExtractor(range(5)))
+    finally:
+        tracemalloc.stop()
+
+    stats = pipeline.stats()
+    assert stats["allocate"]["allocated"] >= 500_000
+    assert stats["noop"]["allocated"] < 100_000
+
+
+def test_stats_memory_disabled():
+    pipeline = ProcessingPipeline()
+    pipeline.add_loader(ListLoader(), name="load")
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor(range(3)))
+    assert pipeline.stats()["load"]["allocated"] is None
+
+
+def test_merge_stats():
+    runs = []
+    for n in (3, 5):
+        pipeline = ProcessingPipeline()
+        pipeline.add_transform(lambda x: x, name="t")
+        pipeline.add_loader(ListLoader(), name="load")
+        pipeline.enable_stats()
+        pipeline.extract(RecordExtractor(range(n)))
+        runs.append(pipeline.stats())
+
+    merged = merge_stats(runs)
+    assert (merged["t"]["records_in"], merged["load"]["records_out"], merged["load"]["flushes"]) == (8, 8, 2)
+    assert merged["t"]["latency"]["count"] == 8
+    assert merged["t"]["time"] == pytest.approx(runs[0]["t"]["time"] + runs[1]["t"]["time"])
+    assert LatencyHistogram.from_dict(runs[0]["t"]["latency"]).to_dict() == runs[0]["t"]["latency"]
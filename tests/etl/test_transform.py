@@ -1,4 +1,9 @@
-from dcw.etl.transform import SquareTransformation
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from dcw.etl.transform import ArrowComputeTransformation, SquareTransformation, VectorizedTransformation, to_records
 
 
 def test_square():
@@ -17,3 +22,45 @@ def test_transformation_is_callable():
     transformation = SquareTransformation()
     transformed = transformation(input)  # invoke the __call__(item) method
     assert transformed == expected, f"Expected to obtain squared value ({expected}) by calling the object"
+
+
+def test_vectorized_transformation_numpy():
+    """A vectorized transformation is called once with the whole batch."""
+    calls = []
+
+    def square(x):
+        calls.append(x)
+        return x ** 2
+
+    transformation = VectorizedTransformation(square, records=True)
+    assert transformation((1, 2, 3)) == [1, 4, 9]
+    assert len(calls) == 1
+
+
+def test_vectorized_transformation_pandas():
+    transformation = VectorizedTransformation(lambda df: df[df["a"] > 1], collect="pandas", records=True)
+    assert transformation(({"a": 1}, {"a": 2}, {"a": 3})) == [{"a": 2}, {"a": 3}]
+
+
+def test_vectorized_transformation_arrow():
+    transformation = VectorizedTransformation(lambda batch: batch.filter(pc.greater(batch["a"], 1)), collect="arrow",
+                                              records=True)
+    assert transformation(({"a": 1}, {"a": 2}, {"a": 3})) == [{"a": 2}, {"a": 3}]
+
+
+def test_arrow_compute_transformation_replaces_column():
+    transformation = ArrowComputeTransformation({"a": lambda batch: pc.add(batch["a"], 1)})
+    result = transformation(pa.table({"a": [1, 2], "b": ["x", "y"]}))
+    assert isinstance(result, pa.Table)
+    assert result.to_pydict() == {"a": [2, 3], "b": ["x", "y"]}
+
+    result = transformation(pa.RecordBatch.from_pydict({"a": [1, 2], "b": ["x", "y"]}))
+    assert isinstance(result, pa.RecordBatch)
+    assert result.to_pydict() == {"a": [2, 3], "b": ["x", "y"]}
+
+
+def test_to_records():
+    assert to_records(np.array([[1, 2], [3, 4]])) == [[1, 2], [3, 4]]
+    assert to_records(pd.Series([1.5, 2.5])) == [1.5, 2.5]
+    assert to_records((1, 2)) == [1, 2]
+    assert to_records(pa.RecordBatch.from_pydict({"a": [1, 2]})) == [{"a": 1}, {"a": 2}]
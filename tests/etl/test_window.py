@@ -0,0 +1,109 @@
+import datetime
+import time
+
+import pytest
+
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import ListLoader
+from dcw.etl.pipeline import ProcessingPipeline
+from dcw.etl.window import Count, Max, Mean, Min, Reduce, Sum, Windower
+
+
+def _results(closed):
+    return [result for _, result in closed]
+
+
+def test_sliding_windows():
+    windower = Windower(10, slide=5, timestamp=lambda r: r, aggregates={"n": Count(), "values": Reduce(
+        lambda a, b: a + (b,), initial=())})
+    closed = []
+    for t in (1, 7, 12):
+        added, new = windower.add(t)
+        assert len(added) == 2
+        closed.extend(new)
+    assert _results(closed + windower.flush()) == [
+        {"start": -5.0, "end": 5.0, "n": 1, "values": (1,)},
+        {"start": 0.0, "end": 10.0, "n": 2, "values": (1, 7)},
+        {"start": 5.0, "end": 15.0, "n": 2, "values": (7, 12)},
+        {"start": 10.0, "end": 20.0, "n": 1, "values": (12,)},
+    ]
+
+
+def test_lateness_and_late_records():
+    windower = Windower(10, timestamp=lambda r: r, lateness=5, aggregates={"n": Count()})
+    windower.add(3)
+    assert _results(windower.add(14)[1]) == []
+    assert _results(windower.add(8)[1]) == []
+    assert _results(windower.add(15)[1]) == [{"start": 0.0, "end": 10.0, "n": 2}]
+
+    added, _ = windower.add(9)
+    assert added == []
+    assert windower.stats() == {"open_windows": 1, "late": 1}
+
+
+def test_datetime_timestamps_and_aggregates():
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    windower = Windower(60, timestamp=lambda r: start + datetime.timedelta(seconds=r["t"]), aggregates={
+        "sum": Sum("v"), "min": Min("v"), "max": Max(lambda r: r["v"]), "mean": Mean("v")})
+    for t, v in ((0, 4), (10, 2), (59, 6)):
+        windower.add({"t": t, "v": v})
+    assert _results(windower.flush()) == [
+        {"start": start.timestamp(), "end": start.timestamp() + 60, "sum": 12, "min": 2, "max": 6, "mean": 4.0}]
+
+
+def test_windower_validation():
+    with pytest.raises(ValueError):
+        Windower(0, aggregates={"n": Count()})
+    with pytest.raises(ValueError):
+        Windower(10, slide=20, aggregates={"n": Count()})
+    with pytest.raises(ValueError):
+        Windower(10, aggregates={})
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_event_time_window_stage(engine):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_window(10, key=lambda r: r[0], timestamp=lambda r: r[1], aggregates={"n": Count()}, name="window")
+    pipeline.add_loader(loader)
+    pipeline.enable_stats()
+    pipeline.extract(RecordExtractor([("a", 1), ("b", 2), ("a", 5), ("a", 11), ("b", 3), ("b", 25)]))
+
+    assert loader.records == [
+        {"key": "a", "start": 0.0, "end": 10.0, "n": 2},
+        {"key": "b", "start": 0.0, "end": 10.0, "n": 1},
+        {"key": "a", "start": 10.0, "end": 20.0, "n": 1},
+        {"key": "b", "start": 20.0, "end": 30.0, "n": 1},
+    ]
+
+    stats = pipeline.stats()["window"]
+    assert (stats["kind"], stats["records_in"], stats["records_out"]) == ("window", 6, 4)
+    assert stats["details"] == {"open_windows": 0, "late": 1}
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_processing_time_window_closes_on_timer(engine):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_window(0.05, aggregates={"n": Count()})
+    pipeline.add_loader(loader)
+    for i in range(3):
+        pipeline.push(i)
+
+    deadline = time.monotonic() + 2
+    while sum(result["n"] for result in loader.records) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sum(result["n"] for result in loader.records) == 3
+
+
+@pytest.mark.parametrize("engine", ["streamz", "native"])
+def test_windows_in_partitioner_lanes(engine):
+    loader = ListLoader()
+    pipeline = ProcessingPipeline(engine=engine)
+    pipeline.add_partitioner(lambda r: r[0], partitions=3)
+    pipeline.add_window(10, key=lambda r: r[0], timestamp=lambda r: r[1], aggregates={"total": Sum(lambda r: r[1])})
+    pipeline.add_loader(loader)
+    pipeline.extract(RecordExtractor((key, t) for t in range(30) for key in "abcd"))
+
+    totals = {(r["key"], r["start"]): r["total"] for r in loader.records}
+    assert totals == {(key, start): sum(range(int(start), int(start) + 10)) for key in "abcd" for start in (0, 10, 20)}
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+
+import pytest
+
+from dcw.cli.pipeline import main
+from dcw.etl.extract import RecordExtractor
+from dcw.etl.load import JsonLinesLoader
+from dcw.etl.pipeline import PipelineFactory, ProcessingPipeline
+
+
+class ShardFactory(PipelineFactory):
+    """Writes each record to a file per process."""
+
+    class Options(PipelineFactory.Options):
+        output: str
+        num: int = 30
+        fail_on: int = -1
+
+    def get_extractor(self, opts):
+        return RecordExtractor(range(opts.num))
+
+    def get_pipeline(self, opts):
+        def check(x):
+            if x == opts.fail_on:
+                raise ValueError(f"failed on {x}")
+            return x
+
+        pipeline = ProcessingPipeline()
+        pipeline.add_transform(check)
+        pipeline.add_loader(JsonLinesLoader(os.path.join(opts.output, f"{os.getpid()}.jsonl")), name="write")
+        return pipeline
+
+
+def _read(output):
+    return {path.name: [json.loads(line) for line in path.read_text().splitlines()] for path in output.iterdir()}
+
+
+def test_run_profile_stages_with_metrics(tmp_path, capsys):
+    """Exporting metrics keeps the memory tracking enabled by --profile-stages."""
+    output = tmp_path / "output"
+    output.mkdir()
+    metrics = tmp_path / "metrics.prom"
+    main(["run", "--profile-stages", "--metrics-file", str(metrics), f"{__name__}.ShardFactory", "--",
+          "--output", str(output)])
+
+    assert metrics.exists()
+    row = [line for line in capsys.readouterr().out.splitlines() if "write" in line][0]
+    assert row.split("|")[6].strip() != "-"
+
+
+def test_run_workers(tmp_path, capsys, caplog):
+    caplog.set_level(logging.INFO)
+    main(["run", "--workers", "3", "--stats", f"{__name__}.ShardFactory", "--", "--output", str(tmp_path)])
+
+    files = _read(tmp_path)
+    assert len(files) == 3
+    assert sorted(x for records in files.values() for x in records) == list(range(30))
+    assert sorted(len(records) for records in files.values()) == [10, 10, 10]
+
+    # the stats of the workers are merged into one table
+    table = capsys.readouterr().out
+    assert [line for line in table.splitlines() if "write" in line][0].split("|")[3].strip() == "30"
+    assert "[worker 2]" in caplog.text
+
+
+def test_run_workers_failure(tmp_path):
+    with pytest.raises(SystemExit) as exc_info:
+        main(["run", "--workers", "2", f"{__name__}.ShardFactory", "--", "--output", str(tmp_path), "--fail_on", "3"])
+    assert exc_info.value.code == 1
+
+    # the worker that did not fail processed all of its records
+    assert sorted(len(records) for records in _read(tmp_path).values())[-1] == 15
+
+
+def test_failed_command_exit_codes(tmp_path, caplog):
+    """Only a failed pipeline run exits with a non-zero code, other commands log the error."""
+    main(["help", "no_such_module.Factory"])
+    assert "Unhandled exception executing the 'help' command" in caplog.text
+
+    with pytest.raises(SystemExit) as exc_info:
+        main(["run", f"{__name__}.ShardFactory", "--", "--output", str(tmp_path), "--fail_on", "3"])
+    assert exc_info.value.code == 1
@@ -9,3 +9,7 @@ def test_dcw_etl_imports():
     assert hasattr(dcw.etl, "Extractor")
     assert hasattr(dcw.etl, "Loader")
     assert hasattr(dcw.etl, "Transformation")
+    assert hasattr(dcw.etl, "AsyncProcessingPipeline")
+    assert hasattr(dcw.etl, "arun_pipeline")
+    assert hasattr(dcw.etl, "AsyncExtractor")
+    assert hasattr(dcw.etl, "AsyncLoader")